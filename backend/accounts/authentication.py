@@ -0,0 +1,133 @@
+"""
+JWT authentication without a User SELECT on every request.
+
+The resolved user's columns (everything but the password hash) are cached in
+two layers: a small process-local dict with a very short TTL, and the shared
+Django cache (Redis) with a longer one. The user is rebuilt with `User.from_db`,
+so it behaves like a normal instance: the password is simply deferred and is
+loaded on first access (e.g. by check_password), and `save()` writes only loaded
+fields.
+
+Saving or deleting a user drops the shared entry and the local entry of the
+current process only (see signals.py): no other process is told. Each keeps
+serving its local copy, deactivated or demoted user included, until that copy
+expires, up to AUTH_USER_CACHE_LOCAL_TTL seconds later; keep that TTL short.
+Bulk `update()` calls bypass signals and are only picked up when the shared
+entry expires too (AUTH_USER_CACHE_TTL).
+
+A shared cache outage is logged and costs the user SELECT, as if the entry were
+missing; it never fails the request.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+# Bounds the local layer; it is cleared wholesale when full
+LOCAL_MAX_ENTRIES = 10_000
+
+
+def cached_field_names():
+    return [field.attname for field in User._meta.concrete_fields if field.attname != 'password']
+
+
+def cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+class LocalUserCache:
+    """Keys are normalized to str: tokens carry the id as a string, signals as an int"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, user_id):
+        entry = self._entries.get(str(user_id))
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, user_id, values):
+        with self._lock:
+            if len(self._entries) >= LOCAL_MAX_ENTRIES:
+                self._entries.clear()
+            self._entries[str(user_id)] = (time.monotonic() + settings.AUTH_USER_CACHE_LOCAL_TTL, values)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_cache = LocalUserCache()
+
+
+def get_cached_values(user_id):
+    values = local_cache.get(user_id)
+    if values is None:
+        try:
+            values = cache.get(cache_key(user_id))
+        except Exception:
+            logger.warning('Auth user cache read failed', exc_info=True)
+            return None
+        if values is not None:
+            local_cache.set(user_id, values)
+    return values
+
+
+def cache_user(user):
+    values = tuple(getattr(user, name) for name in cached_field_names())
+    try:
+        cache.set(cache_key(user.pk), values, settings.AUTH_USER_CACHE_TTL)
+    except Exception:
+        logger.warning('Auth user cache write failed', exc_info=True)
+    local_cache.set(user.pk, values)
+
+
+def invalidate_user(user_id):
+    local_cache.delete(user_id)
+    try:
+        cache.delete(cache_key(user_id))
+    except Exception:
+        # The shared entry lives on until AUTH_USER_CACHE_TTL
+        logger.error('Auth user cache invalidation failed for user %s', user_id, exc_info=True)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that resolves the user from the auth cache before the database"""
+
+    def get_user(self, validated_token):
+        # Revocation checks compare against the password hash, which is never cached
+        if api_settings.CHECK_REVOKE_TOKEN or api_settings.USER_ID_FIELD != 'id':
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        values = get_cached_values(user_id)
+        if values is None:
+            user = super().get_user(validated_token)
+            cache_user(user)
+            return user
+
+        user = User.from_db(User.objects.db, cached_field_names(), values)
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
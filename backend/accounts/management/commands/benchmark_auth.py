@@ -0,0 +1,53 @@
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.authentication import CachedJWTAuthentication, invalidate_user, local_cache
+from repository.loadtest import QueryCounter, summarize
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Compares queries and latency per authenticated request for JWTAuthentication and CachedJWTAuthentication'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=1000)
+        parser.add_argument('--username', help='User to authenticate as (default: first active user)')
+        parser.add_argument('--no-local', action='store_true',
+                            help='Clear the process-local layer before every request (measures the shared cache alone)')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        if options['username']:
+            users = users.filter(username=options['username'])
+        user = users.order_by('id').first()
+        if user is None:
+            raise CommandError('No matching active user.')
+
+        factory = APIRequestFactory()
+        header = f'Bearer {AccessToken.for_user(user)}'
+        counter = QueryCounter()
+        counter.install()
+
+        invalidate_user(user.pk)
+        report = {'user': user.username}
+        for name, authenticator in [('jwt', JWTAuthentication()), ('cached_jwt', CachedJWTAuthentication())]:
+            latencies, query_counts = [], []
+            for _ in range(options['iterations']):
+                if options['no_local']:
+                    local_cache.clear()
+                request = factory.get('/api/auth/profile/', HTTP_AUTHORIZATION=header)
+                before = counter.count
+                started = time.perf_counter()
+                authenticator.authenticate(request)
+                latencies.append((time.perf_counter() - started) * 1000)
+                query_counts.append(counter.count - before)
+            report[name] = summarize(latencies, query_counts)
+
+        self.stdout.write(json.dumps(report, indent=2))
@@ -1,10 +1,32 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+
+from backend.fieldsets import DynamicFieldsMixin
+from repository.models import ScholarlyWork
+from .tokens import CachedBlacklistRefreshToken
 
 User = get_user_model()
 
 
+def upload_count_annotation(request):
+    counts = (
+        ScholarlyWork.objects.filter(uploader=OuterRef('pk'))
+        .order_by().values('uploader').annotate(n=Count('*')).values('n')
+    )
+    return {'num_uploads': Coalesce(Subquery(counts), 0)}
+
+
+PROFILE_FIELD_SOURCES = {
+    'full_name': ['first_name', 'last_name'],
+    'upload_count': [],
+    'total_reactions': [],
+}
+
+
 class SignupSerializer(serializers.ModelSerializer):
     password  = serializers.CharField(write_only=True, validators=[validate_password])
     password2 = serializers.CharField(write_only=True, label="Confirm Password")
@@ -36,11 +58,14 @@ class LoginSerializer(serializers.Serializer):
     password = serializers.CharField(write_only=True)
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     full_name      = serializers.SerializerMethodField()
     upload_count   = serializers.SerializerMethodField()
     total_reactions = serializers.SerializerMethodField()
 
+    field_sources     = PROFILE_FIELD_SOURCES
+    field_annotations = {'upload_count': upload_count_annotation}
+
     class Meta:
         model  = User
         fields = [
@@ -54,6 +79,8 @@ class UserProfileSerializer(serializers.ModelSerializer):
         return obj.get_full_name()
 
     def get_upload_count(self, obj):
+        if hasattr(obj, 'num_uploads'):
+            return obj.num_uploads
         return obj.uploaded_files.count() if hasattr(obj, 'uploaded_files') else 0
 
     def get_total_reactions(self, obj):
@@ -62,11 +89,14 @@ class UserProfileSerializer(serializers.ModelSerializer):
         return 0
 
 
-class PublicUserProfileSerializer(serializers.ModelSerializer):
+class PublicUserProfileSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """For guest users — no email exposed"""
     full_name    = serializers.SerializerMethodField()
     upload_count = serializers.SerializerMethodField()
 
+    field_sources     = PROFILE_FIELD_SOURCES
+    field_annotations = {'upload_count': upload_count_annotation}
+
     class Meta:
         model  = User
         fields = [
@@ -79,6 +109,8 @@ class PublicUserProfileSerializer(serializers.ModelSerializer):
         return obj.get_full_name()
 
     def get_upload_count(self, obj):
+        if hasattr(obj, 'num_uploads'):
+            return obj.num_uploads
         return obj.uploaded_files.count() if hasattr(obj, 'uploaded_files') else 0
 
 
@@ -101,4 +133,9 @@ class ChangePasswordSerializer(serializers.Serializer):
     def validate(self, attrs):
         if attrs['new_password'] != attrs['new_password2']:
             raise serializers.ValidationError({"new_password": "Passwords do not match."})
-        return attrs
\ No newline at end of file
+        return attrs
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh with the blacklist check served from the cache (see tokens.py)"""
+    token_class = CachedBlacklistRefreshToken
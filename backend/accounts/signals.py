@@ -0,0 +1,18 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_user
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Profile edits, password changes and deactivation all go through save().
+    Clears the shared cache and this process's local layer; other processes
+    keep their local copy until AUTH_USER_CACHE_LOCAL_TTL expires.
+    """
+    invalidate_user(instance.pk)
@@ -0,0 +1,29 @@
+from celery import shared_task
+from django.conf import settings
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from .tokens import warm_blacklist_cache
+
+
+@shared_task
+def prune_token_blacklist():
+    """
+    Delete expired outstanding tokens (their blacklist rows cascade) in batches so
+    no single statement locks the tables for long, then re-warm the blacklist cache
+    (scheduled by Celery beat)
+    """
+    batch_size = settings.TOKEN_BLACKLIST_PRUNE_BATCH_SIZE
+    now = aware_utcnow()
+    deleted = 0
+    while True:
+        ids = list(
+            OutstandingToken.objects.filter(expires_at__lte=now)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        deleted += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+
+    cached = warm_blacklist_cache()
+    return f"Pruned {deleted} expired token rows, {cached} blacklisted tokens cached"
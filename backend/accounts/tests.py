@@ -1,3 +1,227 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest.mock import patch
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from backend import profiling
+from repository.models import ScholarlyWork
+
+from .authentication import CachedJWTAuthentication, cache_key, local_cache
+from .models import User
+from .tasks import prune_token_blacklist
+from .tokens import WARM_KEY, is_blacklisted, warm_blacklist_cache
+
+
+@override_settings(DATABASE_REPLICAS=[], PROFILING_BACKEND='local')
+class CachedAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.user = User.objects.create_user('ada', 'ada@example.com', 'Password123!', is_staff=True)
+        self.token = str(AccessToken.for_user(self.user))
+
+    def authenticate(self):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_cached_path_skips_the_database(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate().pk, self.user.pk)
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertEqual((user.username, user.is_staff), ('ada', True))
+
+        # Only the local layer is lost, e.g. in another process
+        local_cache.clear()
+        with self.assertNumQueries(0):
+            self.authenticate()
+
+    def test_password_hash_is_never_cached(self):
+        self.authenticate()
+        values = cache.get(cache_key(self.user.pk))
+        self.assertIsNotNone(values)
+        self.assertNotIn(self.user.password, values)
+        self.assertEqual(local_cache.get(self.user.pk), values)
+
+        # Deferred, and loaded when something needs it
+        user = self.authenticate()
+        self.assertNotIn('password', user.__dict__)
+        self.assertTrue(user.check_password('Password123!'))
+
+    def test_deactivated_user_is_rejected(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_demoted_user_loses_staff_access(self):
+        profiling._store = profiling.LocalProfileStore()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(client.get('/api/profiling/').status_code, 200)
+
+        self.user.is_staff = False
+        self.user.save(update_fields=['is_staff'])
+        self.assertFalse(self.authenticate().is_staff)
+        self.assertEqual(client.get('/api/profiling/').status_code, 403)
+
+    def test_cache_outage_falls_back_to_the_database(self):
+        with patch('accounts.authentication.cache', BrokenCache()):
+            with self.assertLogs('accounts.authentication', 'WARNING'), self.assertNumQueries(1):
+                self.assertEqual(self.authenticate().pk, self.user.pk)
+            # Still served by the local layer
+            with self.assertNumQueries(0):
+                self.authenticate()
+
+            with self.assertLogs('accounts.authentication', 'ERROR'):
+                self.user.is_active = False
+                self.user.save()
+            with self.assertLogs('accounts.authentication', 'WARNING'), self.assertRaises(AuthenticationFailed):
+                self.authenticate()
+
+
+class BrokenCache:
+    def get(self, *args, **kwargs):
+        raise ConnectionError('cache unavailable')
+
+    set = delete = get
+
+
+@override_settings(DATABASE_REPLICAS=[], TOKEN_BLACKLIST_PRUNE_BATCH_SIZE=2)
+class TokenBlacklistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('ada', 'ada@example.com', 'Password123!')
+        self.client = APIClient()
+
+    def refresh(self, token):
+        return self.client.post('/api/auth/token/refresh/', {'refresh': str(token)})
+
+    def assertRefused(self, token):
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['code'], 'token_not_valid')
+
+    def test_rotated_token_is_refused(self):
+        token = RefreshToken.for_user(self.user)
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['refresh'], str(token))
+
+        # Cold cache: the jti entry written on blacklisting, or the database
+        self.assertIsNone(cache.get(WARM_KEY))
+        self.assertRefused(token)
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertTrue(is_blacklisted(token['jti']))
+        self.assertRefused(token)
+
+        # Warm: no query at all, for blacklisted and live tokens alike
+        self.assertEqual(warm_blacklist_cache(), 1)
+        rotated = RefreshToken(response.data['refresh'], verify=False)
+        with self.assertNumQueries(0):
+            self.assertTrue(is_blacklisted(token['jti']))
+            self.assertFalse(is_blacklisted(rotated['jti']))
+        self.assertRefused(token)
+
+    def test_logged_out_token_is_refused(self):
+        token = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.access_token}')
+        self.assertEqual(self.client.post('/api/auth/logout/', {'refresh': str(token)}).status_code, 200)
+        self.client.credentials()
+        self.assertRefused(token)
+
+        cache.clear()
+        self.assertRefused(token)
+        warm_blacklist_cache()
+        self.assertRefused(token)
+
+    def test_prune_deletes_expired_rows_in_batches(self):
+        now = timezone.now()
+        expired = [
+            OutstandingToken.objects.create(
+                user=self.user, jti=f'expired-{i}', token='t', created_at=now - timedelta(days=3),
+                expires_at=now - timedelta(days=1)
+            )
+            for i in range(5)
+        ]
+        BlacklistedToken.objects.create(token=expired[0])
+        live = OutstandingToken.objects.create(
+            user=self.user, jti='live', token='t', created_at=now, expires_at=now + timedelta(days=1)
+        )
+        BlacklistedToken.objects.create(token=live)
+
+        with CaptureQueriesContext(connection) as queries:
+            result = prune_token_blacklist()
+        self.assertEqual(result, 'Pruned 6 expired token rows, 1 blacklisted tokens cached')
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), ['live'])
+        self.assertEqual(BlacklistedToken.objects.get().token, live)
+        deletes = [q['sql'] for q in queries if q['sql'].startswith('DELETE FROM "token_blacklist_outstandingtoken"')]
+        self.assertEqual(len(deletes), 3)
+        self.assertTrue(is_blacklisted('live'))
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class ScholarFieldsetTests(TestCase):
+    def setUp(self):
+        self.scholars = [
+            User.objects.create_user(
+                f'scholar{i}', f's{i}@example.com', 'Password123!', first_name=f'S{i}', bio='Bio ' * 100
+            )
+            for i in range(3)
+        ]
+        for i in range(2):
+            ScholarlyWork.objects.create(
+                title=f'Work {i}', authors='A', publication_year=2024, file_size=4, file_type='pdf',
+                uploader=self.scholars[0],
+            )
+
+    def get(self, url, queries, **params):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(captured), queries)
+        return response.json(), captured[-1]['sql']
+
+    def test_fields_and_omit(self):
+        data, sql = self.get('/api/auth/scholars/', 2, fields='id,username')
+        self.assertEqual([set(item) for item in data['results']], [{'id', 'username'}] * 3)
+        for column in ['"bio"', '"country"', 'repository_scholarlywork']:
+            self.assertNotIn(column, sql)
+
+        data, sql = self.get('/api/auth/scholars/', 2, omit='bio,upload_count')
+        self.assertNotIn('bio', data['results'][0])
+        self.assertIn('full_name', data['results'][0])
+        self.assertNotIn('repository_scholarlywork', sql)
+
+    def test_upload_count_is_annotated_only_when_rendered(self):
+        data, sql = self.get('/api/auth/scholars/', 2, fields='username,upload_count', ordering='created_at')
+        self.assertEqual(
+            [(item['username'], item['upload_count']) for item in data['results']],
+            [('scholar0', 2), ('scholar1', 0), ('scholar2', 0)],
+        )
+        self.assertIn('repository_scholarlywork', sql)
+
+        for i in range(3, 8):
+            User.objects.create_user(f'scholar{i}', f's{i}@example.com', 'Password123!')
+        self.get('/api/auth/scholars/', 2, fields='username,upload_count')
+
+    def test_detail(self):
+        url = f'/api/auth/scholars/{self.scholars[0].pk}/'
+        data, sql = self.get(url, 1, fields='id,full_name')
+        self.assertEqual(data, {'id': self.scholars[0].pk, 'full_name': 'S0'})
+        self.assertNotIn('"bio"', sql)
+        self.assertNotIn('"password"', sql)
+
+        data, _ = self.get(url, 1)
+        self.assertEqual(data['upload_count'], 2)
+        self.assertNotIn('email', data)
@@ -0,0 +1,94 @@
+"""
+Refresh tokens whose blacklist check is answered from the shared cache.
+
+The token_blacklist tables stay the source of truth. Every blacklisted jti is
+also written to the cache until its token expires, and `warm_blacklist_cache`
+(run by the pruning task) loads all live blacklisted jtis and sets a "warm"
+marker. A jti that is absent from the cache only counts as not blacklisted
+while that marker exists. Without the marker (cold cache, Redis restart, a
+failed cache write), the check goes to the database as before.
+
+This relies on Redis not evicting keys (the default noeviction policy).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+WARM_KEY = 'auth:blacklist:warm'
+
+
+def blacklist_key(jti):
+    return f'auth:blacklisted:{jti}'
+
+
+def remaining_lifetime(exp):
+    return max(1, int(exp - timezone.now().timestamp()))
+
+
+def is_blacklisted(jti):
+    try:
+        values = cache.get_many([blacklist_key(jti), WARM_KEY])
+    except Exception:
+        values = {}
+    if blacklist_key(jti) in values:
+        return True
+    if WARM_KEY in values:
+        return False
+    return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+
+def warm_blacklist_cache(chunk_size=5000):
+    """Copy every unexpired blacklisted jti into the cache, then mark it complete. Returns the count."""
+    now = timezone.now()
+    timeout = int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+    jtis = (
+        BlacklistedToken.objects.filter(token__expires_at__gt=now)
+        .values_list('token__jti', flat=True)
+        .iterator(chunk_size=chunk_size)
+    )
+
+    count = 0
+    chunk = {}
+    for jti in jtis:
+        chunk[blacklist_key(jti)] = 1
+        if len(chunk) >= chunk_size:
+            cache.set_many(chunk, timeout)
+            count += len(chunk)
+            chunk = {}
+    if chunk:
+        cache.set_many(chunk, timeout)
+        count += len(chunk)
+
+    cache.set(WARM_KEY, 1, settings.TOKEN_BLACKLIST_WARM_TTL)
+    return count
+
+
+class CachedBlacklistRefreshToken(RefreshToken):
+    """RefreshToken with the blacklist lookup served from the cache when it can be trusted"""
+
+    def check_blacklist(self):
+        if is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        outstanding = OutstandingToken.objects.filter(jti=jti).first()
+        if outstanding is None:
+            result = super().blacklist()
+        else:
+            # The usual case: skips the user lookup that only matters when the row is missing
+            result = BlacklistedToken.objects.get_or_create(token=outstanding)
+        try:
+            cache.set(blacklist_key(jti), 1, remaining_lifetime(self.payload['exp']))
+        except Exception:
+            # The cache can no longer vouch for negatives; use the database until it is re-warmed
+            try:
+                cache.delete(WARM_KEY)
+            except Exception:
+                pass
+        return result
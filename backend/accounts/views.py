@@ -8,9 +8,14 @@ from django.http import HttpResponse
 from django.db.models import Value, F
 from django.db.models.functions import Concat
 from io import BytesIO
-import weasyprint
 from drf_spectacular.utils import extend_schema, OpenApiParameter
+
+from backend.fieldsets import SparseQuerysetMixin
+from backend.profiling import span
+from backend.routers import ReplicaReadMixin
+from backend.throttling import TokenBucketMixin
 from .serializers import ChangePasswordSerializer
+from .tokens import CachedBlacklistRefreshToken
 
 from .serializers import (
     SignupSerializer,
@@ -53,8 +58,9 @@ class SignupView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class LoginView(APIView):
+class LoginView(TokenBucketMixin, APIView):
     permission_classes = [AllowAny]
+    throttle_scope = 'login'
 
     @extend_schema(
         request=LoginSerializer,
@@ -106,7 +112,7 @@ class LogoutView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            token = RefreshToken(refresh_token)
+            token = CachedBlacklistRefreshToken(refresh_token)
             token.blacklist()
             
             return Response(
@@ -127,7 +133,7 @@ class ProfileView(APIView):
         description="Get current user profile"
     )
     def get(self, request):
-        serializer = UserProfileSerializer(request.user)
+        serializer = UserProfileSerializer(request.user, context={'request': request})
         return Response(serializer.data)
 
     @extend_schema(
@@ -150,7 +156,7 @@ class ProfileView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ScholarListView(generics.ListAPIView):
+class ScholarListView(ReplicaReadMixin, SparseQuerysetMixin, generics.ListAPIView):
     """Global scholar overview — all users, public access (RM11)"""
     permission_classes = [AllowAny]
     serializer_class   = PublicUserProfileSerializer
@@ -167,16 +173,17 @@ class ScholarListView(generics.ListAPIView):
             )
 
 
-class ScholarDetailView(generics.RetrieveAPIView):
+class ScholarDetailView(ReplicaReadMixin, SparseQuerysetMixin, generics.RetrieveAPIView):
     """Public profile view for any scholar (RM5)"""
     permission_classes = [AllowAny]
     serializer_class   = PublicUserProfileSerializer
     queryset           = User.objects.filter(is_active=True)
 
 
-class ProfileExportView(APIView):
+class ProfileExportView(TokenBucketMixin, APIView):
     """Download profile as PDF — CV-like format (RM12)"""
     permission_classes = [AllowAny]
+    throttle_scope = 'profile_pdf'
 
     @extend_schema(
         responses={200: bytes},
@@ -215,8 +222,12 @@ class ProfileExportView(APIView):
         </html>
         """
 
+        # Imported here: WeasyPrint (with Pango/Cairo) is slow to load and only this view uses it
+        import weasyprint
+
         pdf_file = BytesIO()
-        weasyprint.HTML(string=html_content).write_pdf(pdf_file)
+        with span('pdf'):
+            weasyprint.HTML(string=html_content).write_pdf(pdf_file)
         pdf_file.seek(0)
 
         response = HttpResponse(pdf_file, content_type='application/pdf')
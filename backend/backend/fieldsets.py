@@ -0,0 +1,105 @@
+"""
+Sparse fieldsets and expansion control for read endpoints.
+
+`?fields=a,b` keeps only the listed fields, `?omit=a,b` drops some, and
+`?expand=uploader` renders a relation as its nested object instead of its id.
+Relations in a serializer's `default_expand` stay expanded unless the client
+sends `expand` itself (an empty `?expand=` collapses them), so existing clients
+keep getting the full payload.
+
+SparseQuerysetMixin narrows the view's queryset to the same selection: only the
+columns behind the kept fields are loaded, relations are joined only when
+expanded, and annotations a field needs (`field_annotations`) are added only when
+that field is kept. Method fields declare the columns they read in
+`field_sources`; a `rel__column` source joins `rel` as well.
+"""
+from django.db.models import QuerySet
+from rest_framework import serializers
+
+from .profiling import span
+
+
+def query_list(request, name):
+    """Comma-separated query parameter as a set, or None when it isn't sent"""
+    params = getattr(request, 'query_params', None) if request is not None else None
+    if params is None:
+        params = getattr(request, 'GET', {})
+    if name not in params:
+        return None
+    return {part.strip() for part in params[name].split(',') if part.strip()}
+
+
+class DynamicFieldsMixin:
+    expandable_fields = ()
+    default_expand = ()
+    field_sources = {}
+    field_annotations = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+
+        keep = query_list(request, 'fields')
+        omit = query_list(request, 'omit') or set()
+        expand = query_list(request, 'expand')
+        if expand is None:
+            expand = set(self.default_expand)
+
+        for name in list(self.fields):
+            if (keep is not None and name not in keep) or name in omit:
+                self.fields.pop(name)
+            elif name in self.expandable_fields and name not in expand:
+                source = self.fields[name].source
+                kwargs = {'source': source} if source != name else {}
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, **kwargs)
+
+    def to_representation(self, instance):
+        with span('serialize'):
+            return super().to_representation(instance)
+
+
+def columns(serializer):
+    """Model fields (including `rel__column` paths) the serializer's current fields read"""
+    model_fields = {field.name for field in serializer.Meta.model._meta.concrete_fields}
+    sources = getattr(serializer, 'field_sources', {})
+    found = {serializer.Meta.model._meta.pk.name}
+    for name, field in serializer.fields.items():
+        if name in sources:
+            found.update(sources[name])
+        elif isinstance(field, serializers.BaseSerializer):
+            found.update(f'{field.source}__{column}' for column in columns(field))
+        elif field.source in model_fields:
+            found.add(field.source)
+    return found
+
+
+def sparse_queryset(queryset, serializer):
+    """Load exactly what `serializer` (already narrowed by the request) will render"""
+    if not isinstance(queryset, QuerySet):
+        return queryset
+    request = serializer.context.get('request')
+    only = columns(serializer)
+    related = {column.rsplit('__', 1)[0] for column in only if '__' in column}
+
+    annotations = {}
+    for name, annotate in getattr(serializer, 'field_annotations', {}).items():
+        if name in serializer.fields:
+            annotations.update(annotate(request))
+
+    if related:
+        queryset = queryset.select_related(*related)
+    if annotations:
+        queryset = queryset.annotate(**annotations)
+    return queryset.only(*only)
+
+
+class SparseQuerysetMixin:
+    """For generic views whose serializer uses DynamicFieldsMixin"""
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        # Only the request matters for the field selection; skip the view's full serializer context
+        serializer = self.get_serializer_class()(context={'request': self.request, 'view': self})
+        return sparse_queryset(queryset, serializer)
@@ -0,0 +1,267 @@
+"""
+Counters and histograms for the Celery pipeline, shared by every process.
+
+Task signals time every task: queue wait (publish to start, from a header set
+at publish time), runtime, and the final state. `convert_docx_to_pdf` adds its
+own outcome, LibreOffice's wall time and the PDF/DOCX size ratio, since it
+reports failures through `conversion_status` rather than by raising; those
+are recorded through `best_effort`, so a store outage can't change its result.
+
+Values are aggregated in Redis hashes (METRICS_BACKEND='local' keeps them in
+process memory), so the web process can serve what the workers recorded:
+`/metrics/` renders them, plus queue depth and pending conversions read at
+scrape time, in the Prometheus text format. It answers 404 until METRICS_TOKEN
+is set and then wants that token as a bearer token.
+The `pipeline_metrics` command prints a live summary from the same data.
+"""
+import hmac
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from celery import signals
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+INF = float('inf')
+TIME_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, INF)
+RATIO_BUCKETS = (0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10, INF)
+
+COUNTERS = {
+    'celery_tasks_total': 'Tasks finished, by task and final state',
+    'conversions_total': 'DOCX to PDF conversions, by outcome',
+}
+HISTOGRAMS = {
+    'celery_task_queue_wait_seconds': ('Time between publishing a task and a worker starting it', TIME_BUCKETS),
+    'celery_task_runtime_seconds': ('Time a worker spent running a task', TIME_BUCKETS),
+    'conversion_libreoffice_seconds': ('Wall time of the LibreOffice conversion subprocess', TIME_BUCKETS),
+    'conversion_output_ratio': ('Size of the converted PDF relative to its DOCX', RATIO_BUCKETS),
+}
+GAUGES = {
+    'celery_queue_length': 'Messages waiting in the broker queue',
+    'conversions_in_progress': 'Works whose DOCX conversion is pending or running',
+}
+
+
+def label_string(labels):
+    return ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in sorted((labels or {}).items())
+    )
+
+
+class RedisMetricsStore:
+    prefix = 'metrics'
+
+    def __init__(self, client=None):
+        if client is None:
+            from backend.redis_client import get_redis
+            client = get_redis()
+        self.redis = client
+
+    def add(self, name, increments):
+        pipe = self.redis.pipeline(transaction=False)
+        for field, amount in increments.items():
+            pipe.hincrbyfloat(f'{self.prefix}:{name}', field, amount)
+        pipe.execute()
+
+    def read(self, names):
+        pipe = self.redis.pipeline(transaction=False)
+        for name in names:
+            pipe.hgetall(f'{self.prefix}:{name}')
+        return {
+            name: {field: float(value) for field, value in fields.items()}
+            for name, fields in zip(names, pipe.execute())
+        }
+
+
+class LocalMetricsStore:
+    """In-process equivalent of RedisMetricsStore"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = defaultdict(lambda: defaultdict(float))
+
+    def add(self, name, increments):
+        with self._lock:
+            for field, amount in increments.items():
+                self._metrics[name][field] += amount
+
+    def read(self, names):
+        with self._lock:
+            return {name: dict(self._metrics.get(name, {})) for name in names}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            if settings.METRICS_BACKEND == 'local':
+                _store = LocalMetricsStore()
+            else:
+                _store = RedisMetricsStore()
+        return _store
+
+
+def increment(name, labels=None, amount=1):
+    get_store().add(name, {label_string(labels): amount})
+
+
+def observe(name, value, labels=None):
+    labels = label_string(labels)
+    buckets = HISTOGRAMS[name][1]
+    index = next(i for i, bound in enumerate(buckets) if value <= bound)
+    get_store().add(name, {f'{labels}|{index}': 1, f'{labels}|sum': value, f'{labels}|count': 1})
+
+
+@contextmanager
+def best_effort():
+    """For recording inside a task: a metrics store outage is logged, never the task's result"""
+    try:
+        yield
+    except Exception:
+        logger.warning('Pipeline metrics not recorded', exc_info=True)
+
+
+def collect():
+    """
+    {name: {labels: value}} for counters and
+    {name: {labels: {'buckets': [count per bucket], 'sum': s, 'count': n}}} for histograms
+    """
+    raw = get_store().read(list(COUNTERS) + list(HISTOGRAMS))
+    snapshot = {name: raw[name] for name in COUNTERS}
+    for name, (_, bounds) in HISTOGRAMS.items():
+        series = {}
+        for field, value in raw[name].items():
+            labels, _, part = field.rpartition('|')
+            entry = series.setdefault(labels, {'buckets': [0] * len(bounds), 'sum': 0.0, 'count': 0})
+            if part in ('sum', 'count'):
+                entry[part] = value
+            else:
+                entry['buckets'][int(part)] = value
+        snapshot[name] = series
+    return snapshot
+
+
+def quantile(name, histogram, q):
+    """Estimate from bucket counts, interpolating linearly inside the bucket (Prometheus style)"""
+    bounds = HISTOGRAMS[name][1]
+    rank, seen = q * histogram['count'], 0
+    if not histogram['count']:
+        return None
+    for index, count in enumerate(histogram['buckets']):
+        if count and seen + count >= rank:
+            if bounds[index] == INF:
+                return bounds[index - 1]
+            lower = bounds[index - 1] if index else 0
+            return lower + (bounds[index] - lower) * (rank - seen) / count
+        seen += count
+    return bounds[-2]
+
+
+def labels_dict(labels):
+    pairs = (part.split('=', 1) for part in labels.split(',')) if labels else ()
+    return {key: value.strip('"') for key, value in pairs}
+
+
+def gauges():
+    """Read at scrape time: broker queue depth and conversions waiting in the database"""
+    from django.db.models import Count
+
+    from repository.models import ScholarlyWork
+
+    values = {'celery_queue_length': {}, 'conversions_in_progress': {}}
+    if settings.METRICS_BACKEND != 'local':
+        from backend.redis_client import get_redis
+        pipe = get_redis().pipeline(transaction=False)
+        for queue in settings.METRICS_QUEUES:
+            pipe.llen(queue)
+        for queue, length in zip(settings.METRICS_QUEUES, pipe.execute()):
+            values['celery_queue_length'][label_string({'queue': queue})] = length
+
+    in_progress = dict(
+        ScholarlyWork.objects.filter(conversion_status__in=['pending', 'processing'])
+        .values_list('conversion_status')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for status in ('pending', 'processing'):
+        values['conversions_in_progress'][label_string({'status': status})] = in_progress.get(status, 0)
+    return values
+
+
+def number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(snapshot, gauge_values):
+    lines = []
+
+    def series(name, labels, value, extra=''):
+        joined = ','.join(part for part in (labels, extra) if part)
+        lines.append(f'{name}{{{joined}}} {number(value)}' if joined else f'{name} {number(value)}')
+
+    for name, help_text in COUNTERS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for labels, value in sorted(snapshot[name].items()):
+            series(name, labels, value)
+    for name, help_text in GAUGES.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+        for labels, value in sorted(gauge_values[name].items()):
+            series(name, labels, value)
+    for name, (help_text, bounds) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for labels, histogram in sorted(snapshot[name].items()):
+            cumulative = 0
+            for bound, count in zip(bounds, histogram['buckets']):
+                cumulative += count
+                series(f'{name}_bucket', labels, cumulative, 'le="{}"'.format('+Inf' if bound == INF else bound))
+            series(f'{name}_sum', labels, histogram['sum'])
+            series(f'{name}_count', labels, histogram['count'])
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; `Authorization: Bearer <METRICS_TOKEN>`"""
+    token = settings.METRICS_TOKEN
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not token:
+        raise Http404
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        return HttpResponse('Invalid metrics token.\n', status=401, content_type='text/plain')
+    return HttpResponse(render(collect(), gauges()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Task signals. A metrics backend outage is reported by Celery's signal dispatch, not by the task.
+
+_started = {}
+
+
+@signals.before_task_publish.connect
+def stamp_published(headers=None, **kwargs):
+    if headers is not None:
+        headers['published_at'] = time.time()
+
+
+@signals.task_prerun.connect
+def task_started(task_id=None, task=None, **kwargs):
+    _started[task_id] = time.monotonic()
+    published_at = getattr(task.request, 'published_at', None)
+    if published_at is not None:
+        observe('celery_task_queue_wait_seconds', max(0.0, time.time() - published_at), {'task': task.name})
+
+
+@signals.task_postrun.connect
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    if started is not None:
+        observe('celery_task_runtime_seconds', time.monotonic() - started, {'task': task.name})
+    increment('celery_tasks_total', {'task': task.name, 'state': (state or 'unknown').lower()})
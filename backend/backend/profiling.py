@@ -0,0 +1,315 @@
+"""
+Opt-in request profiling (PROFILING_ENABLED).
+
+A sampled request (PROFILING_SAMPLE_RATE) records its total time, its query count
+and database time, and the time spent in named spans: `serialize` (read
+serializers and the works list fast path), `pdf` (WeasyPrint) and `file`
+(opening stored files). It answers with them in a `Server-Timing` header and adds
+them to per-endpoint histograms. Endpoints are keyed by method and URL pattern
+(`GET api/repository/<int:pk>/`), so ids don't multiply the keys.
+
+Histograms use fixed log-spaced buckets, each 20% wider than the last, so they
+merge by addition: every minute gets its own, and the stats endpoint sums the
+last PROFILING_WINDOW_MINUTES and reads p50/p95/p99 off the result (accurate to
+one bucket). The Redis backend aggregates all processes; 'local' keeps the
+histograms in process memory. An unsampled request costs one random() call and a
+context variable lookup per query. A store outage is logged and loses the sample;
+the response still goes out.
+"""
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+current = ContextVar('profile', default=None)
+
+# Bucket upper bounds for times: 0.1 ms up to about a minute. Counts get one bucket per value.
+BOUNDS = [0.1 * 1.2 ** i for i in range(74)]
+COUNT_METRICS = {'queries'}
+PERCENTILES = (50, 95, 99)
+NO_SPAN = nullcontext()
+
+
+class Profile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.spans = defaultdict(float)
+        self.open = set()
+
+    @contextmanager
+    def span(self, name):
+        # Nested spans of the same name (a serializer inside a serializer) count once
+        if name in self.open:
+            yield
+            return
+        self.open.add(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[name] += time.perf_counter() - started
+            self.open.discard(name)
+
+    def metrics(self):
+        """{metric: value}, times in milliseconds"""
+        metrics = {
+            'total': (time.perf_counter() - self.started) * 1000,
+            'db': self.db * 1000,
+            'queries': self.queries,
+        }
+        metrics.update((name, seconds * 1000) for name, seconds in self.spans.items())
+        return metrics
+
+
+def span(name):
+    """Time a block under `name` when the current request is being profiled"""
+    profile = current.get()
+    return NO_SPAN if profile is None else profile.span(name)
+
+
+def record_query(execute, sql, params, many, context):
+    profile = current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries += 1
+        profile.db += time.perf_counter() - started
+
+
+def install(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def bucket(metric, value):
+    return int(value) if metric in COUNT_METRICS else bisect_left(BOUNDS, value)
+
+
+def bucket_value(metric, index):
+    if metric in COUNT_METRICS:
+        return index
+    return round(BOUNDS[min(index, len(BOUNDS) - 1)], 2)
+
+
+def server_timing(metrics):
+    entries = [f"total;dur={metrics['total']:.1f}", f"db;dur={metrics['db']:.1f};desc=\"{metrics['queries']} queries\""]
+    entries.extend(
+        f'{name};dur={value:.1f}' for name, value in metrics.items() if name not in ('total', 'db', 'queries')
+    )
+    return ', '.join(entries)
+
+
+def summarize(fields):
+    """Per-metric mean and percentiles from one endpoint's merged histogram fields"""
+    requests = fields.get('requests', 0)
+    metrics = {}
+    for key, count in fields.items():
+        metric, _, part = key.partition(':')
+        if part and part != 'sum':
+            metrics.setdefault(metric, {})[int(part)] = count
+
+    summary = {}
+    for metric, buckets in metrics.items():
+        observed = sum(buckets.values())
+        stats = {'mean': round(fields.get(f'{metric}:sum', 0) / observed, 2)}
+        for percentile in PERCENTILES:
+            rank, seen = observed * percentile / 100, 0
+            for index in sorted(buckets):
+                seen += buckets[index]
+                if seen >= rank:
+                    stats[f'p{percentile}'] = bucket_value(metric, index)
+                    break
+        # Spans only show up in the requests that had them
+        if observed != requests:
+            stats['requests'] = int(observed)
+        summary[metric] = stats
+    return summary
+
+
+class RedisProfileStore:
+    prefix = 'profiling'
+
+    def __init__(self, client=None):
+        if client is None:
+            from backend.redis_client import get_redis
+            client = get_redis()
+        self.redis = client
+
+    def record(self, endpoint, metrics, minute):
+        key = f'{self.prefix}:{minute}:{endpoint}'
+        ttl = (settings.PROFILING_WINDOW_MINUTES + 1) * 60
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hincrby(key, 'requests', 1)
+        for metric, value in metrics.items():
+            pipe.hincrby(key, f'{metric}:{bucket(metric, value)}', 1)
+            pipe.hincrbyfloat(key, f'{metric}:sum', value)
+        pipe.expire(key, ttl)
+        pipe.sadd(f'{self.prefix}:{minute}:endpoints', endpoint)
+        pipe.expire(f'{self.prefix}:{minute}:endpoints', ttl)
+        pipe.execute()
+
+    def merged(self, minutes):
+        pipe = self.redis.pipeline(transaction=False)
+        for minute in minutes:
+            pipe.smembers(f'{self.prefix}:{minute}:endpoints')
+        keys = [
+            f'{self.prefix}:{minute}:{endpoint}'
+            for minute, endpoints in zip(minutes, pipe.execute())
+            for endpoint in endpoints
+        ]
+        for key in keys:
+            pipe.hgetall(key)
+
+        merged = defaultdict(lambda: defaultdict(float))
+        for key, fields in zip(keys, pipe.execute()):
+            endpoint = key.split(':', 2)[2]
+            for field, value in fields.items():
+                merged[endpoint][field] += float(value)
+        return merged
+
+
+class LocalProfileStore:
+    """In-process equivalent of RedisProfileStore"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._minutes = {}
+
+    def record(self, endpoint, metrics, minute):
+        with self._lock:
+            fields = self._minutes.setdefault(minute, {}).setdefault(endpoint, defaultdict(float))
+            fields['requests'] += 1
+            for metric, value in metrics.items():
+                fields[f'{metric}:{bucket(metric, value)}'] += 1
+                fields[f'{metric}:sum'] += value
+            for old in [m for m in self._minutes if m <= minute - settings.PROFILING_WINDOW_MINUTES]:
+                del self._minutes[old]
+
+    def merged(self, minutes):
+        merged = defaultdict(lambda: defaultdict(float))
+        with self._lock:
+            for minute in minutes:
+                for endpoint, fields in self._minutes.get(minute, {}).items():
+                    for field, value in fields.items():
+                        merged[endpoint][field] += value
+        return merged
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            if settings.PROFILING_BACKEND == 'local':
+                _store = LocalProfileStore()
+            else:
+                _store = RedisProfileStore()
+        return _store
+
+
+def current_minute():
+    return int(time.time() // 60)
+
+
+def endpoint_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return f"{request.method} {match.route if match else 'unmatched'}"
+
+
+def record_sample(request, metrics):
+    try:
+        get_store().record(endpoint_name(request), metrics, current_minute())
+    except Exception:
+        logger.warning('Profiling sample not recorded', exc_info=True)
+
+
+class ProfilingMiddleware:
+    """Outermost middleware, so `total` covers the whole stack"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        # Connections opened from now on (any thread) time their queries; so do the open ones
+        connection_created.connect(install, dispatch_uid='profiling-install')
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        token = current.set(Profile())
+        try:
+            response = self.get_response(request)
+            metrics = current.get().metrics()
+        finally:
+            current.reset(token)
+        response['Server-Timing'] = server_timing(metrics)
+        record_sample(request, metrics)
+        return response
+
+    async def __acall__(self, request):
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return await self.get_response(request)
+
+        # The view's sync_to_async calls copy the context, so their queries land here too
+        token = current.set(Profile())
+        try:
+            response = await self.get_response(request)
+            metrics = current.get().metrics()
+        finally:
+            current.reset(token)
+        response['Server-Timing'] = server_timing(metrics)
+        await sync_to_async(record_sample)(request, metrics)
+        return response
+
+
+class ProfilingStatsView(APIView):
+    """Per-endpoint latency percentiles of the profiled requests (staff only)"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        now = current_minute()
+        merged = get_store().merged(range(now - settings.PROFILING_WINDOW_MINUTES + 1, now + 1))
+        endpoints = [
+            {'endpoint': endpoint, 'requests': int(fields['requests']), **summarize(fields)}
+            for endpoint, fields in merged.items()
+        ]
+        # Where the time goes: endpoints by total time spent
+        endpoints.sort(key=lambda entry: -merged[entry['endpoint']]['total:sum'])
+        return Response({
+            'enabled': settings.PROFILING_ENABLED,
+            'sample_rate': settings.PROFILING_SAMPLE_RATE,
+            'window_minutes': settings.PROFILING_WINDOW_MINUTES,
+            'endpoints': endpoints,
+        })
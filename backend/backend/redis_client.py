@@ -0,0 +1,14 @@
+"""Shared Redis connection for features that need more than the cache API (sets, scripts)"""
+from django.conf import settings
+
+_client = None
+
+
+def get_redis():
+    global _client
+    if _client is None:
+        import redis
+
+        # The client is thread-safe and keeps its own connection pool
+        _client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _client
@@ -0,0 +1,124 @@
+"""
+Primary/replica database routing with read-your-writes consistency.
+
+Writes and most reads go to `default`. Views that opt in with ReplicaReadMixin
+(public listings and detail pages) send their reads to a random alias from
+settings.DATABASE_REPLICAS, unless the requesting user is pinned: any
+successful unsafe request by a user pins them to the primary for
+REPLICA_PIN_SECONDS, so their new upload or reaction is visible right away
+even if the replicas lag behind.
+
+The opt-in lives in a context variable, so it covers exactly the view that set
+it (and is safe under threads and ASGI tasks alike).
+
+Pins live in the shared cache. If it can't be read, the user counts as pinned
+(their reads go to the primary); if a pin can't be written, that is logged and
+the write's response is returned as usual, since the write itself committed.
+"""
+import logging
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+replica_reads = ContextVar('replica_reads', default=False)
+
+
+def pin_key(user_id):
+    return f'db:pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    try:
+        cache.set(pin_key(user_id), 1, settings.REPLICA_PIN_SECONDS)
+    except Exception:
+        logger.error('Could not pin user %s to the primary', user_id, exc_info=True)
+
+
+async def apin_to_primary(user_id):
+    try:
+        await cache.aset(pin_key(user_id), 1, settings.REPLICA_PIN_SECONDS)
+    except Exception:
+        logger.error('Could not pin user %s to the primary', user_id, exc_info=True)
+
+
+def is_pinned(user_id):
+    try:
+        return cache.get(pin_key(user_id)) is not None
+    except Exception:
+        logger.warning('Pin lookup failed, reading from the primary', exc_info=True)
+        return True
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if replica_reads.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """For read-heavy DRF views that tolerate replica lag (but never for a user's own fresh writes)"""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        user = request.user
+        if request.method in SAFE_METHODS and not (user.is_authenticated and is_pinned(user.pk)):
+            self._replica_token = replica_reads.set(True)
+
+    def dispatch(self, request, *args, **kwargs):
+        self._replica_token = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self._replica_token is not None:
+                replica_reads.reset(self._replica_token)
+
+
+class ReadYourWritesMiddleware:
+    """Pin users to the primary after a successful write (DRF sets request.user during the view)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def should_pin(self, request, response):
+        user = getattr(request, 'user', None)
+        return (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and user is not None
+            and user.is_authenticated
+        )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self.should_pin(request, response):
+            pin_to_primary(request.user.pk)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.should_pin(request, response):
+            await apin_to_primary(request.user.pk)
+        return response
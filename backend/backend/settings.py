@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.profiling.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -38,10 +39,14 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'backend.routers.ReadYourWritesMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
 
+# Set by asgi.py: serve downloads, conversion polling and reactions from async views
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -61,16 +66,43 @@ TEMPLATES = [
 WSGI_APPLICATION = 'backend.wsgi.application'
 
 # Database - works for both local and Docker
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('POSTGRES_DB', 'globe_scholars'),
-        'USER': os.getenv('POSTGRES_USER', 'globe_user'),
-        'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'yourpassword123'),
-        'HOST': os.getenv('DB_HOST', 'localhost'),  # 'localhost' locally, 'db' in Docker
-        'PORT': os.getenv('DB_PORT', '5432'),
+# DB_ENGINE=sqlite runs everything on local SQLite files (tests, no Postgres at hand)
+if os.getenv('DB_ENGINE') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        },
+        # Stand-in replica: a second file; in tests it mirrors default
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db_replica.sqlite3',
+            'TEST': {'MIRROR': 'default'},
+        },
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'globe_scholars'),
+            'USER': os.getenv('POSTGRES_USER', 'globe_user'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'yourpassword123'),
+            'HOST': os.getenv('DB_HOST', 'localhost'),  # 'localhost' locally, 'db' in Docker
+            'PORT': os.getenv('DB_PORT', '5432'),
+        }
+    }
+    # Streaming replicas, e.g. DB_REPLICA_HOSTS=replica1,replica2 (same credentials as the primary)
+    for index, host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+        DATABASES[f'replica{index}'] = {
+            **DATABASES['default'],
+            'HOST': host.strip(),
+            'TEST': {'MIRROR': 'default'},
+        }
+
+# Read replicas used by ReplicaReadMixin views (backend/routers.py)
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['backend.routers.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = 15  # users read from the primary this long after a write
 
 # Custom user model
 AUTH_USER_MODEL = 'accounts.User'
@@ -78,7 +110,7 @@ AUTH_USER_MODEL = 'accounts.User'
 # DRF
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -89,6 +121,9 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 5,
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Reverse proxies in front of the app, whose X-Forwarded-For entries are trusted for
+    # client IPs (throttling). 0: the backend is reached directly and clients set that header.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '0')),
 }
 
 # JWT
@@ -98,6 +133,7 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.serializers.CachedTokenRefreshSerializer',
 }
 
 # CORS
@@ -106,19 +142,152 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",   # React (if needed)
 ]
 CORS_ALLOW_CREDENTIALS = True
+CORS_EXPOSE_HEADERS = ['Retry-After', 'RateLimit-Limit', 'RateLimit-Remaining', 'RateLimit-Reset']
+
+# Redis - works for both local and Docker
+REDIS_URL = os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/0')
+
+# Shared cache; 'local' keeps it in process memory (tests, no Redis)
+if os.getenv('CACHE_BACKEND', 'redis') == 'local':
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'globe',
+        }
+    }
+
+# Authenticated users are cached for JWT requests (accounts/authentication.py)
+AUTH_USER_CACHE_TTL = 300
+AUTH_USER_CACHE_LOCAL_TTL = 5  # per process, not invalidated across processes: how long a deactivation or demotion may lag
+
+# Refresh-token blacklist (accounts/tokens.py): negative cache lookups are trusted while
+# the warm marker lives; the hourly prune task re-warms it
+TOKEN_BLACKLIST_WARM_TTL = 2 * 60 * 60
+TOKEN_BLACKLIST_PRUNE_BATCH_SIZE = 5000
 
 # Celery - works for both local and Docker
-CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/0')
-CELERY_RESULT_BACKEND = os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/0')
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
+CELERY_BEAT_SCHEDULE = {
+    'flush-reaction-buffer': {
+        'task': 'repository.tasks.flush_reaction_buffer',
+        'schedule': 5.0,
+    },
+    'refresh-trending-scores': {
+        'task': 'repository.tasks.refresh_trending_scores',
+        'schedule': 60.0,
+    },
+    'refresh-related-works': {
+        'task': 'repository.tasks.refresh_related_works',
+        'schedule': 300.0,
+    },
+    'prune-token-blacklist': {
+        'task': 'accounts.tasks.prune_token_blacklist',
+        'schedule': 3600.0,
+    },
+    'purge-deleted-works': {
+        'task': 'repository.tasks.purge_deleted_works',
+        'schedule': 300.0,
+    },
+    'collect-orphaned-files': {
+        'task': 'repository.tasks.collect_orphaned_files',
+        'schedule': 86400.0,
+    },
+    'rebuild-facet-rollups': {
+        'task': 'repository.tasks.rebuild_facet_rollups',
+        'schedule': 86400.0,
+    },
+}
+
+# Request profiling (backend/profiling.py): Server-Timing headers and per-endpoint latency
+# histograms at /api/profiling/ (staff only). In production, sample a small share of requests.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '1.0'))
+PROFILING_BACKEND = os.getenv('PROFILING_BACKEND', 'redis')  # 'local': per process, for development
+PROFILING_WINDOW_MINUTES = 15
+
+# Celery pipeline metrics (backend/metrics.py), served to Prometheus at /metrics/ when a token is set
+METRICS_BACKEND = os.getenv('METRICS_BACKEND', 'redis')  # 'local': per process, for tests
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_QUEUES = ['celery']
+
+# Token-bucket throttling of expensive endpoints (backend/throttling.py). Every client has an
+# 'ip' bucket, signed-in users a 'user' bucket too; a request spends its endpoint's cost from both.
+THROTTLE_BACKEND = os.getenv('THROTTLE_BACKEND', 'redis')  # 'local': per process, for tests and single nodes
+THROTTLE_BUCKETS = {
+    'ip': {'capacity': 200, 'per_minute': 100},
+    'user': {'capacity': 100, 'per_minute': 30},
+}
+THROTTLE_COSTS = {
+    'login': 5,  # password hashing
+    'upload': 10,  # storage, LibreOffice conversion, text extraction
+    'profile_pdf': 10,  # WeasyPrint rendering
+}
+
+# Works list: build the default JSON from values() instead of ScholarlyWorkListSerializer (see repository/fastpath.py)
+WORKS_LIST_FASTPATH = os.getenv('WORKS_LIST_FASTPATH', 'True') == 'True'
+
+# Batch endpoints (works and reaction state by id): most ids per request
+BATCH_MAX_IDS = 100
+
+# ZIP downloads (repository/archive.py): most works and stored bytes per archive
+ZIP_MAX_WORKS = 500
+ZIP_MAX_BYTES = 2 * 1024 ** 3
+
+# Metadata export (repository/export.py): rows per server-side cursor fetch
+EXPORT_CHUNK_SIZE = 2000
+
+# Reactions (RS4): toggles go to a Redis write-behind buffer, flushed by the beat job above.
+# 'local' keeps the buffer in process memory (tests, single-process setups).
+REACTION_WRITE_BEHIND = os.getenv('REACTION_WRITE_BEHIND', 'True') == 'True'
+REACTION_BUFFER_BACKEND = os.getenv('REACTION_BUFFER_BACKEND', 'redis')
+REACTION_FLUSH_BATCH_SIZE = 500  # works per flush transaction
+
+# Trending ranking (see repository/trending.py): downloads are counted in Redis ('local' for tests)
+TRENDING_COUNTER_BACKEND = os.getenv('TRENDING_COUNTER_BACKEND', 'redis')
+TRENDING_HALF_LIFE_HOURS = 72
+TRENDING_REACTION_WEIGHT = 1.0
+TRENDING_DOWNLOAD_WEIGHT = 0.5
+TRENDING_MIN_SCORE = 0.01  # decayed scores below this drop out of the table
+TRENDING_SETTLE_SECONDS = 60  # reactions younger than this wait for the next refresh
+TRENDING_BATCH_SIZE = 50_000  # reactions per refresh run
+
+# Related works (see repository/related.py)
+RELATED_TOP_K = 10
+RELATED_FEATURE_WEIGHTS = {'author': 3.0, 'keyword': 2.0, 'reactor': 1.0}
+RELATED_MAX_DOCUMENT_FREQUENCY = 5000  # features shared by more works than this are ignored
+RELATED_CASCADE_LIMIT = 50  # candidates recomputed when a work is added
+RELATED_REACTION_BATCH_SIZE = 20_000  # reactions per refresh run
+RELATED_SETTLE_SECONDS = 60  # reactions younger than this wait for the next refresh
+
+# Near-duplicate detection (see repository/duplicates.py). 16 bands of 8 rows make works
+# with a Jaccard similarity around 0.7 candidates; candidates are flagged at DUPLICATE_THRESHOLD.
+# Changing the band layout needs `index_duplicates --all`.
+DUPLICATE_BANDS = 16
+DUPLICATE_ROWS_PER_BAND = 8
+DUPLICATE_THRESHOLD = 0.8
+DUPLICATE_MAX_RESULTS = 5
 
 # File uploads
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 MAX_UPLOAD_SIZE = 20 * 1024 * 1024  # 20 MB (requirement RM19)
+
+# Deletion and media GC (see repository/cleanup.py)
+DELETION_BATCH_SIZE = 100  # soft-deleted works purged per round
+DELETION_CHUNK_SIZE = 5000  # reactions/features per DELETE statement
+MEDIA_GC_GRACE_SECONDS = 24 * 3600  # unreferenced files younger than this are kept
 ALLOWED_FILE_TYPES = ['application/pdf', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document']
 
+# Admin changelists of large tables (repository/admin.py)
+ADMIN_EXACT_COUNT_LIMIT = 10_000  # planner estimates above this are shown instead of COUNT(*)
+ADMIN_ACTION_CHUNK_SIZE = 500  # ids per Celery job queued by bulk actions
+
 # Static files
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
@@ -135,6 +304,17 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # LibreOffice path for DOCX→PDF conversion (RM14)
 LIBREOFFICE_PATH = '/usr/bin/libreoffice'
 
+# Full-text extraction from uploaded documents (poppler-utils for PDFs; DOCX is read straight from its word/document.xml)
+PDFTOTEXT_PATH = '/usr/bin/pdftotext'
+FULLTEXT_MAX_CHARS = 500_000  # keeps the tsvector well below PostgreSQL's 1 MB limit
+FULLTEXT_SEARCH_CONFIG = 'english'
+
+# First-page previews: width in pixels per size name, renderer is any class with render(path) -> PIL image
+THUMBNAIL_SIZES = {'small': 160, 'medium': 320, 'large': 640}
+THUMBNAIL_DEFAULT_SIZE = 'medium'
+THUMBNAIL_RENDERER = 'repository.thumbnails.LibreOfficeRenderer'
+THUMBNAIL_CACHE_SECONDS = 365 * 24 * 60 * 60  # for the versioned URLs (?v=) the API hands out; others revalidate
+
 # Swagger/OpenAPI
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Globe Scholars API',
@@ -0,0 +1,191 @@
+"""
+Token-bucket throttling for expensive endpoints.
+
+Every client has an 'ip' bucket and signed-in users a 'user' bucket as well.
+Each holds up to `capacity` tokens and refills at `per_minute` (THROTTLE_BUCKETS);
+a request spends its endpoint's cost (THROTTLE_COSTS, by the view's
+`throttle_scope`) from all of its buckets at once, or from none and is refused
+with a 429 and a Retry-After. Costs let one budget cover endpoints of very
+different weight: a PDF render spends more than a login. Responses carry
+RateLimit-Limit, RateLimit-Remaining (in requests of that endpoint) and
+RateLimit-Reset (seconds until the bucket is full) for the tightest bucket.
+
+The Redis backend checks and spends all buckets in one script, timed by the
+Redis clock, so every process shares the budget and concurrent requests can't
+both spend the last tokens; 'local' keeps the buckets in process memory (tests,
+single-node deployments). Client IPs come from DRF's get_ident: REMOTE_ADDR,
+or the X-Forwarded-For entry added by the outermost of NUM_PROXIES trusted
+proxies, never an address the client chose.
+
+The throttle fails open: if the bucket store can't be reached, the error is
+logged and the request goes through without rate-limit headers, so a Redis
+outage doesn't also take down login, registration and uploads.
+"""
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+# KEYS: buckets. ARGV: cost, then capacity and refill per second for each bucket.
+# Returns whether the cost was spent, then each bucket's tokens afterwards.
+TAKE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local levels = {}
+local allowed = 1
+for i, key in ipairs(KEYS) do
+    local capacity, rate = tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'at')
+    local tokens = capacity
+    if state[1] then
+        tokens = math.min(capacity, tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * rate)
+    end
+    levels[i] = tokens
+    if tokens < cost then
+        allowed = 0
+    end
+end
+local result = {allowed}
+for i, key in ipairs(KEYS) do
+    if allowed == 1 then
+        local capacity, rate = tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 + 1])
+        levels[i] = levels[i] - cost
+        redis.call('HSET', key, 'tokens', tostring(levels[i]), 'at', tostring(now))
+        -- A bucket that has refilled is the same as no bucket
+        redis.call('PEXPIRE', key, math.ceil((capacity - levels[i]) / rate * 1000) + 1000)
+    end
+    result[i + 1] = tostring(levels[i])
+end
+return result
+"""
+
+
+def refill(tokens, at, now, capacity, rate):
+    return min(capacity, tokens + max(0.0, now - at) * rate)
+
+
+class RedisTokenBuckets:
+    prefix = 'throttle'
+
+    def __init__(self, client=None):
+        if client is None:
+            from backend.redis_client import get_redis
+            client = get_redis()
+        self.redis = client
+        self._take = client.register_script(TAKE_SCRIPT)
+
+    def take(self, buckets, cost):
+        """
+        Spend `cost` from every bucket, or from none if one is short.
+        `buckets` is [(key, capacity, tokens per second)]; returns (spent, [tokens left per bucket]).
+        """
+        args = [cost]
+        for _, capacity, rate in buckets:
+            args += [capacity, rate]
+        allowed, *levels = self._take(keys=[f'{self.prefix}:{key}' for key, _, _ in buckets], args=args)
+        return bool(int(allowed)), [float(level) for level in levels]
+
+
+class LocalTokenBuckets:
+    """In-process equivalent of RedisTokenBuckets"""
+
+    PRUNE_AT = 10_000  # buckets kept before full ones are dropped
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, buckets, cost):
+        with self._lock:
+            now = self.clock()
+            levels = []
+            for key, capacity, rate in buckets:
+                tokens, at, _, _ = self._buckets.get(key, (capacity, now, capacity, rate))
+                levels.append(refill(tokens, at, now, capacity, rate))
+            allowed = all(level >= cost for level in levels)
+            if allowed:
+                if len(self._buckets) >= self.PRUNE_AT:
+                    self.prune(now)
+                levels = [level - cost for level in levels]
+                for (key, capacity, rate), level in zip(buckets, levels):
+                    self._buckets[key] = (level, now, capacity, rate)
+            return allowed, levels
+
+    def prune(self, now):
+        # A bucket that has refilled is the same as no bucket
+        self._buckets = {
+            key: state for key, state in self._buckets.items()
+            if refill(state[0], state[1], now, state[2], state[3]) < state[2]
+        }
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+_buckets = None
+_buckets_lock = threading.Lock()
+
+
+def get_buckets():
+    global _buckets
+    with _buckets_lock:
+        if _buckets is None:
+            if settings.THROTTLE_BACKEND == 'local':
+                _buckets = LocalTokenBuckets()
+            else:
+                _buckets = RedisTokenBuckets()
+        return _buckets
+
+
+class TokenBucketThrottle(BaseThrottle):
+    def allow_request(self, request, view):
+        scope = view.throttle_scope
+        cost = settings.THROTTLE_COSTS[scope]
+        kinds = [('ip', self.get_ident(request))]
+        if request.user and request.user.is_authenticated:
+            kinds.append(('user', request.user.pk))
+        buckets = []
+        for kind, ident in kinds:
+            size = settings.THROTTLE_BUCKETS[kind]
+            buckets.append((f'{kind}:{ident}', size['capacity'], size['per_minute'] / 60))
+
+        try:
+            allowed, levels = get_buckets().take(buckets, cost)
+        except Exception:
+            logger.error('Throttle buckets unavailable, allowing %s request', scope, exc_info=True)
+            return True
+        self.retry_after = max(
+            (math.ceil((cost - level) / rate) for (_, _, rate), level in zip(buckets, levels) if level < cost),
+            default=None,
+        )
+        # Headers describe the bucket with the fewest requests left
+        (_, capacity, rate), level = min(zip(buckets, levels), key=lambda pair: pair[1] // cost)
+        request.rate_limit = {
+            'RateLimit-Limit': str(int(capacity // cost)),
+            'RateLimit-Remaining': str(int(max(level, 0) // cost)),
+            'RateLimit-Reset': str(math.ceil((capacity - level) / rate)),
+        }
+        return allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+class TokenBucketMixin:
+    """Throttles a DRF view by its `throttle_scope` (a THROTTLE_COSTS key) and adds the rate-limit headers"""
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        for header, value in getattr(request, 'rate_limit', {}).items():
+            response[header] = value
+        return response
@@ -4,11 +4,16 @@ from django.conf import settings
 from django.conf.urls.static import static
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView 
 
+from backend.metrics import metrics_view
+from backend.profiling import ProfilingStatsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('accounts.urls')),
     path('api-auth/', include('rest_framework.urls')),
     path('api/repository/', include('repository.urls')),
+    path('api/profiling/', ProfilingStatsView.as_view(), name='profiling-stats'),
+    path('metrics/', metrics_view, name='metrics'),
 
     # Swagger
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
@@ -1,16 +1,112 @@
+import json
+
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from .cleanup import soft_delete
 from .models import ScholarlyWork, Reaction
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Takes the row count of a changelist from the PostgreSQL planner instead of
+    running COUNT(*) over millions of rows. Results estimated below
+    ADMIN_EXACT_COUNT_LIMIT are counted exactly; other databases always count.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            sql, params = queryset.order_by().query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = int(plan[0]['Plan']['Plan Rows'])
+            if estimate >= settings.ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+
+
+def enqueue_in_chunks(queryset, task, **kwargs):
+    """Hand the selected ids to a Celery task in chunks; nothing is processed inline"""
+    ids = queryset.values_list('pk', flat=True).order_by('pk')
+    chunk, queued = [], 0
+    for work_id in ids.iterator(chunk_size=settings.ADMIN_ACTION_CHUNK_SIZE):
+        chunk.append(work_id)
+        if len(chunk) == settings.ADMIN_ACTION_CHUNK_SIZE:
+            task.delay(chunk, **kwargs)
+            queued += len(chunk)
+            chunk = []
+    if chunk:
+        task.delay(chunk, **kwargs)
+        queued += len(chunk)
+    return queued
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables too big to count or to list in a dropdown"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
 @admin.register(ScholarlyWork)
-class ScholarlyWorkAdmin(admin.ModelAdmin):
+class ScholarlyWorkAdmin(LargeTableAdmin):
     list_display = ['title', 'authors', 'publication_year', 'uploader', 'file_type', 'conversion_status', 'uploaded_at']
     list_filter = ['file_type', 'conversion_status', 'publication_year']
+    list_select_related = ['uploader']
     search_fields = ['title', 'authors', 'keywords']
     readonly_fields = ['uploaded_at', 'updated_at', 'file_size', 'original_filename']
+    autocomplete_fields = ['uploader']
+    actions = ['rerun_conversion', 'recompute_related', 'reprocess', 'soft_delete']
+
+    def get_actions(self, request):
+        # Bulk deletes go through soft_delete; the stock action would cascade inline
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    @admin.action(description='Re-run DOCX to PDF conversion (queued)')
+    def rerun_conversion(self, request, queryset):
+        from .tasks import requeue_conversions
+        queued = enqueue_in_chunks(queryset.filter(file_type='docx'), requeue_conversions)
+        self.message_user(request, f'Queued {queued} DOCX works for conversion.')
+
+    @admin.action(description='Recompute related works (queued)')
+    def recompute_related(self, request, queryset):
+        from .tasks import update_related_works
+        queued = enqueue_in_chunks(queryset, update_related_works, cascade=False)
+        self.message_user(request, f'Queued related-works recompute for {queued} works.')
+
+    @admin.action(description='Re-extract full text and thumbnails (queued)')
+    def reprocess(self, request, queryset):
+        from .tasks import reprocess_works
+        queued = enqueue_in_chunks(queryset, reprocess_works)
+        self.message_user(request, f'Queued text extraction and thumbnails for {queued} works.')
+
+    @admin.action(description='Delete selected works (purged in the background)', permissions=['delete'])
+    def soft_delete(self, request, queryset):
+        from .tasks import purge_deleted_works
+        deleted = soft_delete(queryset)
+        purge_deleted_works.delay()
+        self.message_user(request, f'Deleted {deleted} works; files and reactions are purged in the background.')
+
+    def delete_model(self, request, obj):
+        from .tasks import purge_deleted_works
+        soft_delete(ScholarlyWork.objects.filter(pk=obj.pk))
+        purge_deleted_works.delay()
 
 
 @admin.register(Reaction)
-class ReactionAdmin(admin.ModelAdmin):
+class ReactionAdmin(LargeTableAdmin):
     list_display = ['user', 'scholarly_work', 'created_at']
-    list_filter = ['created_at']
\ No newline at end of file
+    list_filter = ['created_at']
+    list_select_related = ['user', 'scholarly_work']
+    autocomplete_fields = ['user', 'scholarly_work']
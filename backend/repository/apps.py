@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class RepositoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'repository'
\ No newline at end of file
+    name = 'repository'
+
+    def ready(self):
+        from . import signals  # noqa: F401
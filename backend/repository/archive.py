@@ -0,0 +1,117 @@
+"""
+ZIP archives of many works, built while they are sent.
+
+zipfile writes to anything with write() and tell(): `ChunkSink` keeps what it
+is given until `stream_archive` yields it, once per file chunk read, so the
+response starts right away and holds about one chunk in memory whatever the
+archive size. Without seek() zipfile puts each member's CRC and sizes in a data
+descriptor after its data, so nothing is rewritten. Members are stored rather
+than deflated (PDF and DOCX are compressed already) and always ZIP64, so members
+and archives past 4 GiB stay valid.
+
+`plan_archive` picks the members and checks the caps (ZIP_MAX_WORKS,
+ZIP_MAX_BYTES) before anything is sent: once a 200 has started streaming, an
+oversized request can only be cut off, not refused.
+"""
+import os
+import zipfile
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from django.utils.text import get_valid_filename
+from rest_framework.exceptions import ValidationError
+
+from .async_views import streaming_content
+from .models import ScholarlyWork
+from .trending import record_download
+
+ARCHIVE_FIELDS = ['file', 'converted_pdf', 'file_type', 'original_filename']
+
+
+class ChunkSink:
+    """Write-only, non-seekable file object for ZipFile"""
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def open_source(work, operation):
+    """`operation(preview_source)`, retrying once with fresh paths like the download view does"""
+    try:
+        return operation(work.preview_source)
+    except FileNotFoundError:
+        # migrate_media_layout may have moved the file since the row was read
+        work.refresh_from_db(fields=['file', 'converted_pdf'])
+        return operation(work.preview_source)
+
+
+def member_name(work):
+    # Uploaded names are user input: no directories, and the id keeps them unique
+    return f'{work.pk}-{get_valid_filename(os.path.basename(work.download_filename)) or "work"}'
+
+
+def plan_archive(queryset):
+    """(works, total bytes) for the works in `queryset`; ValidationError when over the caps"""
+    ids = list(queryset.order_by('-uploaded_at').values_list('pk', flat=True)[:settings.ZIP_MAX_WORKS + 1])
+    if len(ids) > settings.ZIP_MAX_WORKS:
+        raise ValidationError({'detail': f'At most {settings.ZIP_MAX_WORKS} works per archive; narrow the search.'})
+
+    works = ScholarlyWork.objects.only(*ARCHIVE_FIELDS).in_bulk(ids)
+    planned, total = [], 0
+    for work_id in ids:
+        work = works.get(work_id)
+        if work is None:
+            continue
+        try:
+            total += open_source(work, lambda field_file: field_file.size)
+        except (FileNotFoundError, ValueError):
+            # ValueError: no file set. Missing files are left out, as downloads answer 404 for them.
+            continue
+        planned.append(work)
+    if total > settings.ZIP_MAX_BYTES:
+        raise ValidationError({
+            'detail': f'The archive would hold {total} bytes, more than the {settings.ZIP_MAX_BYTES} allowed; '
+                      'narrow the search.'
+        })
+    return planned, total
+
+
+def stream_archive(works, chunk_size=64 * 1024):
+    sink = ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+        for work in works:
+            try:
+                source = open_source(work, lambda field_file: field_file.open('rb'))
+            except (FileNotFoundError, ValueError):
+                continue  # deleted or moved since the plan
+            with source, archive.open(member_name(work), 'w', force_zip64=True) as member:
+                while chunk := source.read(chunk_size):
+                    member.write(chunk)
+                    yield sink.drain()
+            record_download(work.pk)
+    # Central directory
+    yield sink.drain()
+
+
+def archive_response(works, filename):
+    response = StreamingHttpResponse(streaming_content(stream_archive(works)), content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
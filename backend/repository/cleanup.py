@@ -0,0 +1,149 @@
+"""
+Background deletion and media garbage collection.
+
+Deleting a work only stamps `deleted_at` (`soft_delete`; the default manager
+hides it from then on); `purge_deleted` later removes the rows and files. Reactions and reactor
+features, which grow without bound, are deleted in DELETION_CHUNK_SIZE slices
+so no single statement locks a popular work's whole history.
+
+`collect_orphans` walks MEDIA_ROOT with os.scandir and checks the files it finds
+against every FileField in chunks, so neither the tree nor the set of referenced
+names is ever held in memory. Files younger than MEDIA_GC_GRACE_SECONDS are left
+alone: they may belong to an upload or a conversion that hasn't saved its row yet.
+"""
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+from . import facets
+from .models import Reaction, ScholarlyWork, WorkFeature
+from .related import works_listing
+
+GC_CHUNK_SIZE = 1000
+
+
+def delete_in_chunks(queryset, chunk_size):
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += queryset.model._base_manager.filter(pk__in=ids).delete()[0]
+
+
+def soft_delete(queryset):
+    """Hide the live works in `queryset` and take them out of the facet rollups. Returns how many."""
+    with transaction.atomic():
+        # Locked, so two deletes of the same work don't both decrement its cell
+        ids = list(ScholarlyWork.objects.select_for_update().filter(pk__in=queryset.values('pk')).values_list('pk', flat=True))
+        if ids:
+            facets.add_works(facets.cell_groups(ScholarlyWork.objects.filter(pk__in=ids)), -1)
+            ScholarlyWork.objects.filter(pk__in=ids).update(deleted_at=timezone.now())
+    return len(ids)
+
+
+def stored_files(work):
+    files = [work.file, work.converted_pdf]
+    files.extend(thumbnail.image for thumbnail in work.thumbnails.all())
+    return [field_file for field_file in files if field_file]
+
+
+def purge_deleted(batch_size=None):
+    """
+    Remove up to `batch_size` soft-deleted works with everything that hangs off them.
+    Returns (works purged, works whose related lists need a recompute).
+    """
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    works = list(ScholarlyWork.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at')[:batch_size])
+    if not works:
+        return 0, set()
+
+    files = {}
+    listing = set()
+    for work in works:
+        listing.update(works_listing(work.pk))
+        files.update((field_file.name, field_file.storage) for field_file in stored_files(work))
+        delete_in_chunks(Reaction.objects.filter(scholarly_work_id=work.pk), settings.DELETION_CHUNK_SIZE)
+        delete_in_chunks(WorkFeature.objects.filter(scholarly_work_id=work.pk), settings.DELETION_CHUNK_SIZE)
+
+    # Files go once their rows are gone (unless another row shares them);
+    # if this fails midway the GC catches what's left
+    purged = [work.pk for work in works]
+    ScholarlyWork.all_objects.filter(pk__in=purged).delete()
+    shared = referenced(list(files), file_fields())
+    for name, storage in files.items():
+        if name not in shared:
+            storage.delete(name)
+    return len(purged), listing - set(purged)
+
+
+def file_fields():
+    """(model, field name) of every FileField, so the GC never reclaims a file some other app points at"""
+    return [
+        (model, field.name)
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.FileField)
+    ]
+
+
+def walk(path):
+    """Yield (relative name, stat) of every file below `path`, one directory listing at a time"""
+    stack = [path]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    name = os.path.relpath(entry.path, settings.MEDIA_ROOT).replace(os.sep, '/')
+                    yield name, entry.stat(follow_symlinks=False)
+
+
+def referenced(names, fields):
+    found = set()
+    for model, field_name in fields:
+        found.update(
+            model._base_manager.filter(**{f'{field_name}__in': names}).values_list(field_name, flat=True)
+        )
+    return found
+
+
+def collect_orphans(grace_seconds=None, dry_run=False):
+    """Delete media files no row references. Returns (files checked, orphans, bytes reclaimed)."""
+    grace_seconds = settings.MEDIA_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    if not os.path.isdir(settings.MEDIA_ROOT):
+        return 0, 0, 0
+    cutoff = time.time() - grace_seconds
+    fields = file_fields()
+    checked = orphans = reclaimed = 0
+
+    def sweep(chunk):
+        nonlocal orphans, reclaimed
+        keep = referenced(list(chunk), fields)
+        for name in chunk.keys() - keep:
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            orphans += 1
+            reclaimed += chunk[name]
+            if not dry_run:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    chunk = {}
+    for name, stat in walk(settings.MEDIA_ROOT):
+        checked += 1
+        if stat.st_mtime > cutoff:
+            continue
+        chunk[name] = stat.st_size
+        if len(chunk) >= GC_CHUNK_SIZE:
+            sweep(chunk)
+            chunk = {}
+    if chunk:
+        sweep(chunk)
+    return checked, orphans, reclaimed
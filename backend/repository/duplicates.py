@@ -0,0 +1,164 @@
+"""
+Near-duplicate detection with MinHash and LSH.
+
+A work is reduced to a set of shingles: character 5-grams of its normalized
+title, authors and description ('metadata'), and word 5-grams of its extracted
+text ('text', once extraction has run). Its MinHash signature keeps, for each
+of DUPLICATE_BANDS * DUPLICATE_ROWS_PER_BAND hash functions, the smallest hash
+over the set; two signatures agree in a position with probability equal to the
+Jaccard similarity of the sets. Each band of rows is hashed to a SignatureBand
+bucket, so finding candidates is one indexed lookup of DUPLICATE_BANDS
+(band, bucket) pairs instead of a comparison with every work. Candidates are
+scored by the share of positions their signatures agree in and flagged at
+DUPLICATE_THRESHOLD.
+
+Uploads are checked on metadata alone (the text isn't extracted yet); the
+extraction task adds the text signature, which `find_duplicates` also uses.
+The hash functions come from a fixed seed: changing it, or the band layout,
+invalidates every stored signature (`index_duplicates --all` rebuilds them).
+"""
+import hashlib
+import re
+import zlib
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import ScholarlyWork, SignatureBand, WorkSignature
+
+SEED = 1_000_003
+PRIME = 4_294_967_311  # smallest prime above 2**32
+CHAR_SHINGLE = 5
+WORD_SHINGLE = 5
+BLOCK = 4096  # shingles hashed per numpy step
+CANDIDATE_LIMIT = 500  # a bucket this crowded is noise, not a duplicate
+TOKEN = re.compile(r'\w+')
+
+
+@lru_cache(maxsize=None)
+def hash_parameters(num_perm):
+    # a < 2**31 keeps a * crc32 below 2**63, so uint64 arithmetic never wraps
+    rng = np.random.RandomState(SEED)
+    a = rng.randint(1, 1 << 31, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def metadata_shingles(title, authors, description):
+    text = ' '.join(TOKEN.findall(' '.join([title, authors, description or '']).lower()))
+    if len(text) <= CHAR_SHINGLE:
+        return {text} if text else set()
+    return {text[i:i + CHAR_SHINGLE] for i in range(len(text) - CHAR_SHINGLE + 1)}
+
+
+def text_shingles(body):
+    words = TOKEN.findall((body or '').lower())
+    if len(words) <= WORD_SHINGLE:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + WORD_SHINGLE]) for i in range(len(words) - WORD_SHINGLE + 1)}
+
+
+def signature(shingles):
+    """uint32 MinHash signature of a set of strings, None for an empty set"""
+    if not shingles:
+        return None
+    a, b = hash_parameters(settings.DUPLICATE_BANDS * settings.DUPLICATE_ROWS_PER_BAND)
+    hashes = np.fromiter((zlib.crc32(shingle.encode()) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    minimum = np.full(len(a), np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, len(hashes), BLOCK):
+        values = (hashes[start:start + BLOCK, None] * a + b) % PRIME
+        np.minimum(minimum, values.min(axis=0), out=minimum)
+    return (minimum & 0xFFFFFFFF).astype(np.uint32)
+
+
+def band_buckets(sig):
+    rows = settings.DUPLICATE_ROWS_PER_BAND
+    return [
+        int.from_bytes(hashlib.blake2b(sig[band * rows:(band + 1) * rows].tobytes(), digest_size=8).digest(),
+                       'big', signed=True)
+        for band in range(settings.DUPLICATE_BANDS)
+    ]
+
+
+def similarity(sig, other):
+    return float(np.mean(sig == other))
+
+
+def matches(kind, sig, exclude=None):
+    """{work id: estimated similarity} of live works at or above DUPLICATE_THRESHOLD"""
+    if sig is None:
+        return {}
+    query = Q()
+    for band, bucket in enumerate(band_buckets(sig)):
+        query |= Q(band=band, bucket=bucket)
+    candidates = SignatureBand.objects.filter(query, kind=kind).exclude(scholarly_work_id=exclude)
+    ids = list(candidates.values_list('scholarly_work_id', flat=True).distinct()[:CANDIDATE_LIMIT])
+
+    found = {}
+    stored = WorkSignature.objects.filter(scholarly_work_id__in=ids, scholarly_work__deleted_at__isnull=True)
+    for work_id, other in stored.values_list('scholarly_work_id', kind):
+        if other is not None:
+            score = similarity(sig, np.frombuffer(other, dtype=np.uint32))
+            if score >= settings.DUPLICATE_THRESHOLD:
+                found[work_id] = score
+    return found
+
+
+def store(work_id, kind, sig):
+    with transaction.atomic():
+        SignatureBand.objects.filter(scholarly_work_id=work_id, kind=kind).delete()
+        if sig is None:
+            return
+        SignatureBand.objects.bulk_create([
+            SignatureBand(scholarly_work_id=work_id, kind=kind, band=band, bucket=bucket)
+            for band, bucket in enumerate(band_buckets(sig))
+        ])
+
+
+def index_work(work_id, title, authors, description, body=None):
+    """Store the work's metadata signature, and its text signature when `body` is given"""
+    metadata = signature(metadata_shingles(title, authors, description))
+    defaults = {'metadata': None if metadata is None else metadata.tobytes()}
+    text = None
+    if body is not None:
+        text = signature(text_shingles(body))
+        defaults['text'] = None if text is None else text.tobytes()
+    WorkSignature.objects.update_or_create(scholarly_work_id=work_id, defaults=defaults)
+    store(work_id, 'metadata', metadata)
+    if body is not None:
+        store(work_id, 'text', text)
+
+
+def find_duplicates(work_id):
+    """[(work id, similarity)] of likely duplicates by metadata or text, most similar first"""
+    row = WorkSignature.objects.filter(scholarly_work_id=work_id).values_list('metadata', 'text').first()
+    if row is None:
+        return []
+    found = {}
+    for kind, stored in zip(['metadata', 'text'], row):
+        if stored is not None:
+            for other, score in matches(kind, np.frombuffer(stored, dtype=np.uint32), exclude=work_id).items():
+                found[other] = max(score, found.get(other, 0))
+    return ranked(found)
+
+
+def ranked(found):
+    return sorted(found.items(), key=lambda item: (-item[1], item[0]))[:settings.DUPLICATE_MAX_RESULTS]
+
+
+def describe(found):
+    """API shape of ranked matches"""
+    works = ScholarlyWork.objects.only('title', 'authors', 'publication_year').in_bulk([work_id for work_id, _ in found])
+    return [
+        {
+            'id': work_id,
+            'title': works[work_id].title,
+            'authors': works[work_id].authors,
+            'publication_year': works[work_id].publication_year,
+            'similarity': round(score, 2),
+        }
+        for work_id, score in found if work_id in works
+    ]
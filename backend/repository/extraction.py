@@ -0,0 +1,123 @@
+"""
+Plain-text extraction from uploaded documents.
+
+Extractors are generators that yield text in chunks, so the caller decides
+how much to keep: a 500-page PDF never has to fit in memory, the text is
+read from pdftotext's stdout as it is produced and the subprocess is killed
+as soon as enough has been collected.
+"""
+import io
+import subprocess
+import zipfile
+from xml.etree import ElementTree
+
+from django.conf import settings
+
+
+def iter_pdf_text(path, chunk_size=64 * 1024):
+    """Stream text out of a PDF via poppler's pdftotext"""
+    process = subprocess.Popen(
+        [settings.PDFTOTEXT_PATH, '-enc', 'UTF-8', '-q', path, '-'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        reader = io.TextIOWrapper(process.stdout, encoding='utf-8', errors='replace')
+        while True:
+            chunk = reader.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        # Stop pdftotext early when the caller has collected enough text
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        process.wait()
+
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+def iter_docx_text(path):
+    """
+    Yield paragraph and table-row text from a DOCX file, in document order.
+    word/document.xml is decompressed and parsed incrementally, and finished
+    elements are dropped, so only the current paragraph or table row is held.
+    """
+    with zipfile.ZipFile(path) as archive, archive.open('word/document.xml') as document:
+        body = None
+        paragraphs, cells, row = [], [], []  # paragraphs: run texts of each open (possibly nested) paragraph
+        tables = 0
+        for event, element in ElementTree.iterparse(document, events=('start', 'end')):
+            tag = element.tag
+            if event == 'start':
+                if tag == f'{W}body':
+                    body = element
+                elif tag == f'{W}p':
+                    paragraphs.append([])
+                elif tag == f'{W}tbl':
+                    tables += 1
+                continue
+
+            if tag == f'{W}t' and paragraphs:
+                paragraphs[-1].append(element.text or '')
+            elif tag == f'{W}tab' and paragraphs:
+                paragraphs[-1].append('\t')
+            elif tag in (f'{W}br', f'{W}cr') and paragraphs:
+                paragraphs[-1].append('\n')
+            elif tag == f'{W}p':
+                text = ''.join(paragraphs.pop())
+                if tables:
+                    cells.append(text)
+                elif text:
+                    yield text + '\n'
+            elif tag == f'{W}tc':
+                cell = '\n'.join(cells)
+                cells = []
+                if cell:
+                    row.append(cell)
+            elif tag == f'{W}tr':
+                if row:
+                    yield ' | '.join(row) + '\n'
+                row = []
+            elif tag == f'{W}tbl':
+                tables -= 1
+
+            # Top-level blocks are done with once they end
+            if body is not None and tag in (f'{W}p', f'{W}tbl') and not tables:
+                body.clear()
+
+
+def collect_text(chunks, max_chars):
+    """
+    Join chunks up to `max_chars`, closing the generator once the cap is hit.
+    Returns (text, truncated).
+    """
+    parts = []
+    total = 0
+    truncated = False
+    try:
+        for chunk in chunks:
+            # PostgreSQL text columns cannot store NUL bytes
+            chunk = chunk.replace('\x00', '')
+            if total + len(chunk) >= max_chars:
+                parts.append(chunk[:max_chars - total])
+                truncated = True
+                break
+            parts.append(chunk)
+            total += len(chunk)
+    finally:
+        chunks.close()
+    return ''.join(parts), truncated
+
+
+def extract_text(path, file_type, max_chars):
+    """Extract up to `max_chars` characters of text from a stored PDF or DOCX"""
+    if file_type == 'docx':
+        chunks = iter_docx_text(path)
+    elif file_type == 'pdf':
+        chunks = iter_pdf_text(path)
+    else:
+        raise ValueError(f"Unsupported file type for text extraction: {file_type}")
+    return collect_text(chunks, max_chars)
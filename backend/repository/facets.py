@@ -0,0 +1,160 @@
+"""
+Facet counts for the works list and per-country rollups for the globe view.
+
+FacetCell holds the number of live works per (publication year, file type,
+uploader country); CountryRollup the listed scholars and live works per
+country. Signal handlers (repository/signals.py) and `cleanup.soft_delete` keep both
+current: a work entering or leaving the live set moves one cell by one, a
+scholar changing country moves their works between cells. `rebuild` recomputes
+everything from scratch (daily, via Celery beat), which also repairs anything
+written with bulk `update()` calls that bypass signals.
+
+`rollup_counts` answers from the cells, which is exact as long as a request
+filters on these three dimensions only. Text search, author and uploader
+filters fall back to `live_counts`, a GROUP BY over the filtered works.
+Each dimension is counted under every selected filter except its own, so the
+client can show the alternatives to the current selection.
+"""
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from rest_framework.exceptions import ValidationError
+
+from .models import CountryRollup, FacetCell, ScholarlyWork
+
+User = get_user_model()
+
+# Facet name -> lookup on ScholarlyWork (the FacetCell field has the facet's name)
+DIMENSIONS = {
+    'publication_year': 'publication_year',
+    'file_type': 'file_type',
+    'country': 'uploader__country',
+}
+# List parameters the cells can't answer
+LIVE_PARAMS = ('q', 'search', 'author', 'uploader')
+
+
+def is_listed(user):
+    """Scholars shown in the scholar list (and counted on the globe)"""
+    return user.is_active and not user.is_staff
+
+
+def bump(model, lookup, **deltas):
+    # Insert-if-missing then increment: safe against a concurrent first insert
+    model.objects.bulk_create([model(**lookup)], ignore_conflicts=True)
+    model.objects.filter(**lookup).update(**{field: F(field) + delta for field, delta in deltas.items()})
+
+
+def add_works(groups, sign=1):
+    """Apply (year, file type, country, works) groups to the cells and country totals"""
+    per_country = defaultdict(int)
+    for year, file_type, country, works in groups:
+        bump(FacetCell, {'publication_year': year, 'file_type': file_type, 'country': country}, works=sign * works)
+        per_country[country] += sign * works
+    for country, works in per_country.items():
+        bump(CountryRollup, {'country': country}, works=works)
+
+
+def cell_groups(queryset):
+    return list(
+        queryset.values_list('publication_year', 'file_type', 'uploader__country')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+
+
+def move_work(old_key, new_key):
+    """A work's (year, file type, country) changed; None means not live"""
+    if old_key == new_key:
+        return
+    if old_key is not None:
+        add_works([(*old_key, 1)], -1)
+    if new_key is not None:
+        add_works([(*new_key, 1)])
+
+
+def move_scholar(user_id, old, new):
+    """(country, listed) of a user before and after a save; None when created or deleted"""
+    if old == new:
+        return
+    if old is not None and old[1]:
+        bump(CountryRollup, {'country': old[0]}, scholars=-1)
+    if new is not None and new[1]:
+        bump(CountryRollup, {'country': new[0]}, scholars=1)
+
+    if old is not None and new is not None and old[0] != new[0]:
+        groups = list(
+            ScholarlyWork.objects.filter(uploader_id=user_id)
+            .values_list('publication_year', 'file_type')
+            .annotate(n=Count('id'))
+            .order_by()
+        )
+        add_works([(year, file_type, old[0], n) for year, file_type, n in groups], -1)
+        add_works([(year, file_type, new[0], n) for year, file_type, n in groups])
+
+
+def rebuild():
+    """Recompute both rollups from the works and users tables. Returns (cells, countries)."""
+    cells = cell_groups(ScholarlyWork.objects.all())
+    scholars = dict(
+        User.objects.filter(is_active=True, is_staff=False).values_list('country').annotate(n=Count('id')).order_by()
+    )
+    countries = defaultdict(lambda: [0, 0])
+    for _, _, country, works in cells:
+        countries[country][1] += works
+    for country, n in scholars.items():
+        countries[country][0] = n
+
+    with transaction.atomic():
+        FacetCell.objects.all().delete()
+        CountryRollup.objects.all().delete()
+        FacetCell.objects.bulk_create([
+            FacetCell(publication_year=year, file_type=file_type, country=country, works=works)
+            for year, file_type, country, works in cells
+        ])
+        CountryRollup.objects.bulk_create([
+            CountryRollup(country=country, scholars=n_scholars, works=works)
+            for country, (n_scholars, works) in countries.items()
+        ])
+    return len(cells), len(countries)
+
+
+def selected_filters(params):
+    """{facet: value} of the facet dimensions the request filters on"""
+    selected = {name: params[name] for name in DIMENSIONS if params.get(name)}
+    if 'publication_year' in selected:
+        try:
+            selected['publication_year'] = int(selected['publication_year'])
+        except ValueError:
+            raise ValidationError({'publication_year': 'Enter a whole number.'})
+    return selected
+
+
+def shape(rows):
+    return [{'value': value, 'count': count} for value, count in sorted(rows, key=lambda row: (-row[1], row[0]))]
+
+
+def rollup_counts(selected):
+    cells = FacetCell.objects.filter(works__gt=0)
+    facets = {}
+    for dimension in DIMENSIONS:
+        others = {name: value for name, value in selected.items() if name != dimension}
+        facets[dimension] = shape(
+            cells.filter(**others).values_list(dimension).annotate(n=Sum('works')).order_by()
+        )
+    total = cells.filter(**selected).aggregate(n=Sum('works'))['n'] or 0
+    return {'count': total, 'source': 'rollup', 'facets': facets}
+
+
+def live_counts(queryset, selected):
+    queryset = queryset.order_by()
+    facets = {}
+    for dimension, lookup in DIMENSIONS.items():
+        others = {DIMENSIONS[name]: value for name, value in selected.items() if name != dimension}
+        facets[dimension] = shape(
+            queryset.filter(**others).values_list(lookup).annotate(n=Count('id', distinct=True)).order_by()
+        )
+    total = queryset.filter(**{DIMENSIONS[name]: value for name, value in selected.items()}).count()
+    return {'count': total, 'source': 'live', 'facets': facets}
@@ -0,0 +1,111 @@
+"""
+Serializer-free rendering of the works list.
+
+ScholarlyWorkListSerializer builds a serializer and a dozen field objects per
+row. For the default field set the list view can instead read plain dicts with
+`values()` (uploader columns joined, reaction data annotated) and build each
+item directly, in the serializer's key order and with its value formatting, then
+encode them in one call, with orjson when it is installed.
+The bytes are the same as JSONRenderer's; `benchmark_list_serialization` checks
+that and compares the per-row cost of both paths.
+
+Requests with `fields`/`omit`/`expand`, or that negotiate anything but compact
+JSON (browsable API, `; indent=`), take the serializer path.
+"""
+import json
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from backend.fieldsets import query_list
+
+try:
+    import orjson
+except ImportError:  # optional: json.dumps gives the same bytes, only slower
+    orjson = None
+
+COLUMNS = [
+    'id', 'title', 'authors', 'publication_year', 'file_type', 'file_size', 'uploaded_at',
+    'uploader_id', 'uploader__username', 'uploader__first_name', 'uploader__last_name', 'uploader__affiliation',
+    'num_reactions', 'has_reacted', 'conversion_status', 'thumbnails_generated_at',
+]
+
+
+def datetime_formatter():
+    """DateTimeField.to_representation with its per-call timezone lookup hoisted out of the row loop"""
+    output_format = api_settings.DATETIME_FORMAT
+    if not settings.USE_TZ or not isinstance(output_format, str) or output_format.lower() != ISO_8601:
+        return serializers.DateTimeField().to_representation
+    current = timezone.get_current_timezone()
+
+    def to_iso(value):
+        if not value:
+            return None
+        value = value.astimezone(current).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return to_iso
+
+
+def eligible(request):
+    """Only the default, compact JSON representation is reproduced here"""
+    if not settings.WORKS_LIST_FASTPATH:
+        return False
+    if any(query_list(request, name) is not None for name in ('fields', 'omit', 'expand')):
+        return False
+    renderer = getattr(request, 'accepted_renderer', None)
+    return (
+        type(renderer) is JSONRenderer
+        and renderer.get_indent(request.accepted_media_type, {}) is None
+    )
+
+
+def build_rows(queryset, request):
+    """List items for an already filtered, sparse (annotated) queryset or a page of its values()"""
+    thumbnail_prefix = request.build_absolute_uri('/api/repository/')
+    to_datetime = datetime_formatter()
+    rows = []
+    for values in queryset:
+        generated_at = values['thumbnails_generated_at']
+        full_name = f"{values['uploader__first_name']} {values['uploader__last_name']}".strip()
+        rows.append({
+            'id': values['id'],
+            'title': values['title'],
+            'authors': values['authors'],
+            'publication_year': values['publication_year'],
+            'file_type': values['file_type'],
+            'file_size': values['file_size'],
+            'uploaded_at': to_datetime(values['uploaded_at']),
+            'uploader': {
+                'id': values['uploader_id'],
+                'username': values['uploader__username'],
+                'full_name': full_name or values['uploader__username'],
+                'affiliation': values['uploader__affiliation'],
+            },
+            'reaction_count': values['num_reactions'],
+            'user_has_reacted': values['has_reacted'],
+            'conversion_status': values['conversion_status'],
+            'snippet': values.get('snippet'),
+            'thumbnail_url': (
+                f"{thumbnail_prefix}{values['id']}/thumbnail/?v={int(generated_at.timestamp())}"
+                if generated_at else None
+            ),
+        })
+    return rows
+
+
+def list_values(queryset):
+    columns = COLUMNS + (['snippet'] if 'snippet' in queryset.query.annotations else [])
+    return queryset.values(*columns)
+
+
+def encode(data):
+    """Byte-for-byte what JSONRenderer produces with UNICODE_JSON and COMPACT_JSON"""
+    if orjson is not None:
+        content = orjson.dumps(data)
+    else:
+        content = json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+    # JSONRenderer escapes these two for JavaScript embedding
+    return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
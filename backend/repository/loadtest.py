@@ -0,0 +1,153 @@
+"""
+In-process load scenarios against the real URLconf.
+
+Requests go through Django's test client (WSGI path) or the async test
+client (ASGI path), so middleware, authentication, serializers and the
+database are all exercised exactly as in production, minus the network.
+"""
+import math
+import random
+import statistics
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an unsorted list of numbers"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies_ms, query_counts=None, statuses=None):
+    """Condense raw samples into the numbers we compare between runs"""
+    summary = {
+        'requests': len(latencies_ms),
+        'p50_ms': round(percentile(latencies_ms, 50), 3),
+        'p95_ms': round(percentile(latencies_ms, 95), 3),
+        'p99_ms': round(percentile(latencies_ms, 99), 3),
+        'mean_ms': round(statistics.fmean(latencies_ms), 3),
+        'max_ms': round(max(latencies_ms), 3),
+    }
+    if query_counts:
+        summary['queries_per_request'] = round(statistics.fmean(query_counts), 2)
+        summary['max_queries'] = max(query_counts)
+    if statuses:
+        summary['statuses'] = {str(code): statuses.count(code) for code in sorted(set(statuses))}
+    return summary
+
+
+class QueryCounter:
+    """
+    Counts queries on every connection. Under ASGI each request runs in its own
+    context and gets its own connection, so wrapping only the current
+    connection (as CaptureQueriesContext does) would miss them.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self):
+        connection_created.connect(self._wrap, weak=False)
+        for conn in connections.all():
+            self._wrap(None, conn)
+
+    def _wrap(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class ScenarioRunner:
+    """Replays named request scenarios and records latency and queries per request"""
+
+    def __init__(self, work_ids, scholar_ids, token=None, use_asgi=False, seed=0):
+        self.work_ids = work_ids
+        self.scholar_ids = scholar_ids
+        self.use_asgi = use_asgi
+        self.rng = random.Random(seed)
+        self.headers = {'Authorization': f'Bearer {token}'} if token else {}
+        self.client = AsyncClient() if use_asgi else Client()
+        self.queries = QueryCounter()
+        self.queries.install()
+
+    def scenarios(self):
+        return {
+            'list_search': self.list_search,
+            'detail': self.detail,
+            'react_toggle': self.react_toggle,
+            'download': self.download,
+            'profile_export': self.profile_export,
+        }
+
+    def list_search(self):
+        term = self.rng.choice(['analysis', 'model', 'learning', 'climate', 'robust'])
+        return 'get', reverse('work-list'), {'search': term}
+
+    def detail(self):
+        return 'get', reverse('work-detail', args=[self.rng.choice(self.work_ids)]), {}
+
+    def react_toggle(self):
+        return 'post', reverse('work-react', args=[self.rng.choice(self.work_ids)]), {}
+
+    def download(self):
+        return 'get', reverse('work-download', args=[self.rng.choice(self.work_ids)]), {}
+
+    def profile_export(self):
+        return 'get', reverse('scholar-export', args=[self.rng.choice(self.scholar_ids)]), {}
+
+    def run(self, names, iterations, warmup=2):
+        available = self.scenarios()
+        results = {}
+        for name in names:
+            build = available[name]
+            for _ in range(warmup):
+                self.send(*build())
+
+            latencies, queries, statuses = [], [], []
+            for _ in range(iterations):
+                method, url, data = build()
+                queries_before = self.queries.count
+                started = time.perf_counter()
+                status_code = self.send(method, url, data)
+                latencies.append((time.perf_counter() - started) * 1000)
+                queries.append(self.queries.count - queries_before)
+                statuses.append(status_code)
+            results[name] = summarize(latencies, queries, statuses)
+        return results
+
+    def send(self, method, url, data):
+        if self.use_asgi:
+            return async_to_sync(self._send_async)(method, url, data)
+
+        response = getattr(self.client, method)(url, data, headers=self.headers)
+        if response.streaming:
+            # The test client closes the response once it is drained; closing it again would fire
+            # request_finished with connection cleanup attached and drop the database connection
+            for _ in response.streaming_content:
+                pass
+        return response.status_code
+
+    async def _send_async(self, method, url, data):
+        response = await getattr(self.client, method)(url, data, headers=self.headers)
+        if response.streaming:
+            if response.is_async:
+                async for _ in response.streaming_content:
+                    pass
+            else:
+                for _ in response.streaming_content:
+                    pass
+        return response.status_code
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from rest_framework_simplejwt.tokens import AccessToken
+
+from repository.loadtest import summarize
+from repository.models import ScholarlyWork
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Starts many simultaneous downloads from bandwidth-limited clients and reports latency, '
+        'wall time and peak thread count. --server wsgi models a threaded WSGI server '
+        '(one thread per in-flight download); --server asgi drives the ASGI application. '
+        'Run with ASYNC_VIEWS=True to route the async views.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=['wsgi', 'asgi'], default='asgi')
+        parser.add_argument('--concurrency', type=int, default=2000, help='Simultaneous downloads')
+        parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads / size of the asyncio default executor')
+        parser.add_argument('--bandwidth', type=int, default=1024 * 1024,
+                            help='Bytes per second each simulated client can receive')
+        parser.add_argument('--work', type=int, help='Work to download (default: first work with a file)')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        work = ScholarlyWork.objects.order_by('id')
+        if options['work']:
+            work = work.filter(pk=options['work'])
+        work = work.exclude(file='').first()
+        if work is None:
+            raise CommandError('No work with a file to download.')
+        user = User.objects.filter(is_active=True).order_by('id').first()
+        if user is None:
+            raise CommandError('No active user to authenticate as.')
+
+        self.url = f'/api/repository/{work.pk}/download/'
+        self.token = str(AccessToken.for_user(user))
+        self.bandwidth = options['bandwidth']
+        self.peak_threads = threading.active_count()
+
+        started = time.perf_counter()
+        if options['server'] == 'wsgi':
+            results = self.run_threaded(options['concurrency'], options['threads'])
+        else:
+            results = asyncio.run(self.run_async(options['concurrency'], options['threads']))
+        wall = time.perf_counter() - started
+
+        latencies = [latency for latency, _, _ in results]
+        report = {
+            'server': options['server'],
+            'async_views': settings.ASYNC_VIEWS,
+            'concurrency': options['concurrency'],
+            'threads': options['threads'],
+            'bandwidth': self.bandwidth,
+            'bytes_per_download': max(size for _, _, size in results),
+            'wall_seconds': round(wall, 3),
+            'peak_threads': self.peak_threads,
+            # Sync views under ASGI buffer each streamed file in memory; this shows it
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'downloads': summarize(latencies, statuses=[code for _, code, _ in results]),
+        }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def track_threads(self):
+        self.peak_threads = max(self.peak_threads, threading.active_count())
+
+    def run_threaded(self, concurrency, threads):
+        """A slow download keeps its worker thread busy until the last byte is sent"""
+        submitted = time.perf_counter()
+
+        def download():
+            client = Client()
+            response = client.get(self.url, headers={'Authorization': f'Bearer {self.token}'})
+            size = 0
+            for chunk in response.streaming_content if response.streaming else [response.content]:
+                size += len(chunk)
+                time.sleep(len(chunk) / self.bandwidth)
+            response.close()
+            self.track_threads()
+            return (time.perf_counter() - submitted) * 1000, response.status_code, size
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            return list(pool.map(lambda _: download(), range(concurrency)))
+
+    async def run_async(self, concurrency, threads):
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=threads))
+        application = get_asgi_application()
+        submitted = time.perf_counter()
+
+        async def download():
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': self.url,
+                'raw_path': self.url.encode(),
+                'query_string': b'',
+                'root_path': '',
+                'headers': [
+                    (b'host', b'testserver'),
+                    (b'authorization', f'Bearer {self.token}'.encode()),
+                ],
+                'client': ('127.0.0.1', 0),
+                'server': ('testserver', 80),
+            }
+            request_sent = False
+            disconnected = asyncio.Event()
+            result = {'status': None, 'size': 0}
+
+            async def receive():
+                nonlocal request_sent
+                if not request_sent:
+                    request_sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    result['status'] = message['status']
+                elif message['type'] == 'http.response.body':
+                    body = message.get('body', b'')
+                    result['size'] += len(body)
+                    await asyncio.sleep(len(body) / self.bandwidth)
+                    self.track_threads()
+
+            await application(scope, receive, send)
+            disconnected.set()
+            return (time.perf_counter() - submitted) * 1000, result['status'], result['size']
+
+        return await asyncio.gather(*(download() for _ in range(concurrency)))
@@ -0,0 +1,83 @@
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from backend.fieldsets import sparse_queryset
+from repository import fastpath
+from repository.models import ScholarlyWork
+from repository.serializers import ScholarlyWorkListSerializer
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Renders the same works through ScholarlyWorkListSerializer + JSONRenderer and through the '
+        'values() fast path, checks the bytes are identical and reports the CPU time per row of each '
+        '(fetching and rendering measured separately, best of --repeat).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Works to render')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--anonymous', action='store_true', help='Render for a guest instead of the first user')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        request = Request(APIRequestFactory().get('/api/repository/'))
+        user = None if options['anonymous'] else User.objects.filter(is_active=True).order_by('id').first()
+        force_authenticate(request, user=user)
+        request.user = user or AnonymousUser()
+
+        serializer = ScholarlyWorkListSerializer(context={'request': request})
+        queryset = sparse_queryset(ScholarlyWork.objects.order_by('-uploaded_at'), serializer)[:options['rows']]
+        if not queryset.exists():
+            raise CommandError('No works found. Run generate_dataset first.')
+
+        def serializer_path(instances):
+            data = ScholarlyWorkListSerializer(instances, many=True, context={'request': request}).data
+            return JSONRenderer().render(data)
+
+        def fast_path(values):
+            return fastpath.encode(fastpath.build_rows(values, request))
+
+        paths = {
+            'serializer': (lambda: list(queryset.all()), serializer_path),
+            'fastpath': (lambda: list(fastpath.list_values(queryset)), fast_path),
+        }
+        report = {'rows': 0, 'repeat': options['repeat'], 'orjson': fastpath.orjson is not None}
+        outputs = {}
+        for name, (fetch, render) in paths.items():
+            fetch_times, render_times = [], []
+            for _ in range(options['repeat']):
+                started = time.process_time()
+                rows = fetch()
+                fetch_times.append(time.process_time() - started)
+                started = time.process_time()
+                outputs[name] = render(rows)
+                render_times.append(time.process_time() - started)
+            report['rows'] = len(rows)
+            report[name] = {
+                'fetch_ms': round(min(fetch_times) * 1000, 3),
+                'render_ms': round(min(render_times) * 1000, 3),
+                'cpu_us_per_row': round((min(fetch_times) + min(render_times)) / len(rows) * 1e6, 2),
+            }
+
+        report['speedup'] = round(report['serializer']['cpu_us_per_row'] / report['fastpath']['cpu_us_per_row'], 2)
+        report['identical'] = outputs['serializer'] == outputs['fastpath']
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+        if not report['identical']:
+            raise CommandError('Fast path output differs from the serializer output.')
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from repository.cleanup import collect_orphans
+
+
+class Command(BaseCommand):
+    help = 'Deletes media files that no row references and that are older than the grace period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=float, help='Seconds a file must be old (default MEDIA_GC_GRACE_SECONDS)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        checked, orphans, reclaimed = collect_orphans(grace_seconds=options['grace'], dry_run=options['dry_run'])
+        elapsed = time.perf_counter() - started
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {orphans} of {checked} files ({reclaimed / 1024 / 1024:.1f} MB) in {elapsed:.1f}s'
+        ))
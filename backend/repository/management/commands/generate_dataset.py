@@ -0,0 +1,178 @@
+import itertools
+import os
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from repository import facets, search
+from repository.models import ScholarlyWork, Reaction
+
+User = get_user_model()
+
+SAMPLE_FILE_NAME = 'scholarly_works/synthetic/sample.pdf'
+
+COUNTRIES = [
+    'Germany', 'Nigeria', 'India', 'Brazil', 'United States', 'China', 'Kenya',
+    'France', 'Japan', 'Canada', 'Ghana', 'Mexico', 'Poland', 'Egypt', 'Australia',
+]
+AFFILIATIONS = [
+    'Test University', 'Institute of Technology', 'National Research Centre',
+    'School of Medicine', 'Polytechnic Institute', 'Open University',
+]
+KEYWORDS = [
+    'machine learning', 'climate', 'genomics', 'economics', 'linguistics', 'optics',
+    'public health', 'robotics', 'agriculture', 'education', 'energy', 'statistics',
+    'history', 'materials', 'neuroscience', 'security', 'ecology', 'finance',
+]
+TITLE_WORDS = [
+    'analysis', 'survey', 'model', 'approach', 'framework', 'evidence', 'study',
+    'dynamics', 'networks', 'learning', 'systems', 'impact', 'estimation', 'design',
+    'distributed', 'adaptive', 'global', 'regional', 'sparse', 'robust', 'efficient',
+]
+
+
+def zipf_weights(n, alpha):
+    """Cumulative Zipf weights for ranks 1..n, usable with random.choices(cum_weights=...)"""
+    return list(itertools.accumulate(1.0 / (rank ** alpha) for rank in range(1, n + 1)))
+
+
+class Command(BaseCommand):
+    help = 'Generates a large synthetic dataset (users, works, reactions) for performance work'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users to create')
+        parser.add_argument('--works', type=int, default=10000, help='Number of works to create')
+        parser.add_argument('--reactions', type=int, default=50000, help='Target number of reactions')
+        parser.add_argument('--alpha', type=float, default=1.1,
+                            help='Zipf exponent for work popularity and uploader activity')
+        parser.add_argument('--docx-share', type=float, default=0.2,
+                            help='Fraction of works recorded as converted DOCX uploads')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='synth', help='Username prefix for generated users')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['works'] < 0 or options['reactions'] < 0:
+            raise CommandError('--users must be positive, --works and --reactions non-negative.')
+
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        users = self.create_users(rng, options['users'], options['prefix'], batch_size)
+        self.stdout.write(f'Created {len(users)} users')
+
+        works = self.create_works(rng, users, options['works'], options['alpha'],
+                                  options['docx_share'], batch_size)
+        self.stdout.write(f'Created {len(works)} works')
+
+        reactions = self.create_reactions(rng, users, works, options['reactions'],
+                                          options['alpha'], batch_size)
+        self.stdout.write(f'Created {reactions} reactions')
+
+        # bulk_create skips the signals that keep the facet rollups current
+        facets.rebuild()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Dataset generated in {elapsed:.1f}s'))
+
+    def create_users(self, rng, count, prefix, batch_size):
+        # Continue numbering after a previous run so the command can be re-run to grow the dataset
+        start = User.objects.filter(username__startswith=f'{prefix}_').count()
+        password = make_password('TestPass123!')  # hash once, the hasher is deliberately slow
+
+        new_users = []
+        for i in range(start, start + count):
+            new_users.append(User(
+                username=f'{prefix}_{i}',
+                email=f'{prefix}_{i}@example.com',
+                password=password,
+                first_name='Synthetic',
+                last_name=f'Scholar{i}',
+                bio='Generated for performance testing',
+                affiliation=rng.choice(AFFILIATIONS),
+                country=rng.choice(COUNTRIES),
+            ))
+        User.objects.bulk_create(new_users, batch_size=batch_size)
+
+        return list(
+            User.objects.filter(username__startswith=f'{prefix}_')
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+
+    def create_works(self, rng, user_ids, count, alpha, docx_share, batch_size):
+        sample_name, sample_size = self.ensure_sample_file()
+
+        # A few heavy uploaders, a long tail of occasional ones
+        uploader_weights = zipf_weights(len(user_ids), alpha)
+        uploaders = rng.choices(user_ids, cum_weights=uploader_weights, k=count)
+
+        new_works = []
+        for uploader_id in uploaders:
+            is_docx = rng.random() < docx_share
+            stem = '-'.join(rng.sample(TITLE_WORDS, 2))
+            new_works.append(ScholarlyWork(
+                title=' '.join(w.capitalize() for w in rng.sample(TITLE_WORDS, rng.randint(3, 7))),
+                authors=', '.join(f'Author {rng.randint(1, count // 3 + 1)}' for _ in range(rng.randint(1, 4))),
+                publication_year=rng.randint(1990, 2026),
+                description=' '.join(rng.choices(TITLE_WORDS, k=rng.randint(20, 80))),
+                keywords=', '.join(rng.sample(KEYWORDS, rng.randint(1, 4))),
+                file=sample_name,
+                converted_pdf=sample_name if is_docx else None,
+                original_filename=f'{stem}.docx' if is_docx else f'{stem}.pdf',
+                file_size=sample_size,
+                file_type='docx' if is_docx else 'pdf',
+                conversion_status='completed',
+                conversion_progress=100 if is_docx else 0,
+                uploader_id=uploader_id,
+            ))
+
+        created = ScholarlyWork.objects.bulk_create(new_works, batch_size=batch_size)
+        work_ids = [work.id for work in created]
+        # Searchable with ?q= by their metadata, as uploads are
+        for start in range(0, len(work_ids), batch_size):
+            search.index_new_works(work_ids[start:start + batch_size])
+        return work_ids
+
+    def create_reactions(self, rng, user_ids, work_ids, target, alpha, batch_size):
+        if not work_ids:
+            return 0
+
+        # Popularity rank is independent of upload order
+        ranked = list(work_ids)
+        rng.shuffle(ranked)
+        work_weights = zipf_weights(len(ranked), alpha)
+
+        target = min(target, len(user_ids) * len(work_ids))
+        pairs = set()
+        # Draw in rounds: popular works saturate, so duplicates are discarded and redrawn
+        while len(pairs) < target:
+            missing = target - len(pairs)
+            works = rng.choices(ranked, cum_weights=work_weights, k=missing)
+            users = rng.choices(user_ids, k=missing)
+            before = len(pairs)
+            pairs.update(zip(users, works))
+            if len(pairs) == before:
+                break
+
+        Reaction.objects.bulk_create(
+            (Reaction(user_id=user_id, scholarly_work_id=work_id) for user_id, work_id in pairs),
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        return len(pairs)
+
+    def ensure_sample_file(self):
+        """All generated works share one stored PDF so downloads work without bloating MEDIA_ROOT"""
+        fixtures_dir = os.path.join(os.path.dirname(__file__), 'fixtures')
+        with open(os.path.join(fixtures_dir, 'test.pdf'), 'rb') as f:
+            pdf_content = f.read()
+
+        if not default_storage.exists(SAMPLE_FILE_NAME):
+            default_storage.save(SAMPLE_FILE_NAME, ContentFile(pdf_content))
+        return SAMPLE_FILE_NAME, len(pdf_content)
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from repository import duplicates
+from repository.models import ScholarlyWork
+
+
+class Command(BaseCommand):
+    help = (
+        'Computes the MinHash signatures and LSH buckets used to flag near-duplicate uploads for works '
+        'that have none yet (--all: for every work, e.g. after changing the band layout). Works whose '
+        'text has been extracted get a text signature too. --report then lists the likely duplicates.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Recompute existing signatures as well')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Works loaded per batch')
+        parser.add_argument('--report', action='store_true', help='Print pairs of likely duplicates')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        works = ScholarlyWork.objects.order_by('id')
+        if not options['all']:
+            works = works.filter(signature__isnull=True)
+
+        indexed, last_id = 0, 0
+        while True:
+            # Bodies can be large: one chunk of them in memory at a time
+            batch = list(
+                works.filter(id__gt=last_id)
+                .values_list('id', 'title', 'authors', 'description', 'fulltext__body')[:options['chunk_size']]
+            )
+            if not batch:
+                break
+            for work_id, title, authors, description, body in batch:
+                duplicates.index_work(work_id, title, authors, description, body=body)
+            indexed += len(batch)
+            last_id = batch[-1][0]
+            self.stdout.write(f'  {indexed} works indexed')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} works in {elapsed:.1f}s'))
+
+        if options['report']:
+            pairs = 0
+            for work_id in ScholarlyWork.objects.order_by('id').values_list('id', flat=True).iterator():
+                for other, score in duplicates.find_duplicates(work_id):
+                    if other > work_id:
+                        pairs += 1
+                        self.stdout.write(f'{work_id} ~ {other}  similarity {score:.2f}')
+            self.stdout.write(f'{pairs} likely duplicate pairs')
@@ -0,0 +1,103 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from repository.cleanup import referenced
+from repository.models import ScholarlyWork, WorkThumbnail
+
+# (model, field, prefix of the sharded layout); any other stored name is moved.
+# Thumbnails kept their prefix, so names are matched on the whole <prefix>/ab/cd/<uuid> shape.
+LAYOUT_FIELDS = [
+    (ScholarlyWork, 'file', 'works'),
+    (ScholarlyWork, 'converted_pdf', 'converted'),
+    (WorkThumbnail, 'image', 'thumbnails'),
+]
+
+
+def sharded(prefix):
+    return rf'^{prefix}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/[0-9a-f]{{32}}(\.[^/]*)?$'
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves files from the old scholarly_works/<user_id>/, converted_pdfs/ and '
+        'thumbnails/<work_id>/ layout to the sharded one, in batches, while the site keeps '
+        'running. Each file is copied, the row is repointed, and the old copy is removed after '
+        '--grace seconds once nothing references it, so requests that read the old path keep '
+        'working. Safe to interrupt and re-run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--pause', type=float, default=0.5, help='Seconds to sleep between batches')
+        parser.add_argument('--grace', type=float, default=30, help='Seconds to keep old copies around')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the files left to move')
+
+    def handle(self, *args, **options):
+        self.grace = options['grace']
+        self.pending = []  # (deadline, old name)
+
+        for model, field_name, prefix in LAYOUT_FIELDS:
+            label = f'{model._meta.model_name}.{field_name}'
+            legacy = (
+                model._base_manager.exclude(**{f'{field_name}__regex': sharded(prefix)})
+                .exclude(**{f'{field_name}__isnull': True})
+                .exclude(**{field_name: ''})
+            )
+            if options['dry_run']:
+                self.stdout.write(f"{label}: {legacy.count()} rows to move")
+                continue
+            moved, missing = self.migrate_field(model, field_name, legacy, options['batch_size'], options['pause'])
+            self.stdout.write(f"{label}: {moved} rows moved, {missing} files missing")
+
+        if self.pending:
+            time.sleep(max(0, self.pending[-1][0] - time.monotonic()))
+            self.delete_expired()
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Media layout migrated.'))
+
+    def migrate_field(self, model, field_name, legacy, batch_size, pause):
+        field = model._meta.get_field(field_name)
+        copies = {}  # old name -> new name, so shared files are copied once
+        moved = missing = 0
+        last_id = 0
+
+        while True:
+            batch = list(legacy.filter(id__gt=last_id).order_by('id').values_list('id', field_name)[:batch_size])
+            if not batch:
+                return moved, missing
+            last_id = batch[-1][0]
+
+            for pk, old_name in batch:
+                new_name = copies.get(old_name)
+                created = new_name is None
+                if created:
+                    if not field.storage.exists(old_name):
+                        missing += 1
+                        continue
+                    with field.storage.open(old_name, 'rb') as source:
+                        new_name = field.storage.save(field.generate_filename(None, os.path.basename(old_name)), source)
+
+                # Conditional update: a row edited or deleted meanwhile is left alone
+                if model._base_manager.filter(pk=pk, **{field_name: old_name}).update(**{field_name: new_name}):
+                    copies[old_name] = new_name
+                    self.pending.append((time.monotonic() + self.grace, old_name))
+                    moved += 1
+                elif created:
+                    field.storage.delete(new_name)
+
+            self.delete_expired()
+            self.stdout.write(f"  {field_name}: {moved} moved (last id {last_id})")
+            time.sleep(pause)
+
+    def delete_expired(self):
+        now = time.monotonic()
+        fields = [(model, field_name) for model, field_name, _ in LAYOUT_FIELDS]
+        while self.pending and self.pending[0][0] <= now:
+            _, old_name = self.pending.pop(0)
+            # Old files may be shared between rows; keep them until the last one is repointed
+            if not referenced([old_name], fields):
+                storage = ScholarlyWork._meta.get_field('file').storage
+                if storage.exists(old_name):
+                    storage.delete(old_name)
@@ -0,0 +1,92 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from backend import metrics
+
+
+def seconds(value):
+    return '-' if value is None else f'{value:.2f}s'
+
+
+class Command(BaseCommand):
+    help = (
+        'Prints a live summary of the Celery pipeline metrics aggregated from all workers: queue depth, '
+        'per-task throughput, queue wait and runtime percentiles, and conversion outcomes, LibreOffice time '
+        'and output size ratio. Use it to size the worker pool from real traffic.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between refreshes')
+        parser.add_argument('--once', action='store_true', help='Print one summary and exit')
+
+    def handle(self, *args, **options):
+        previous, previous_at = None, None
+        while True:
+            snapshot, gauges, now = metrics.collect(), metrics.gauges(), time.monotonic()
+            elapsed = now - previous_at if previous_at else None
+            self.print_summary(snapshot, gauges, previous, elapsed)
+            if options['once']:
+                return
+            previous, previous_at = snapshot, now
+            time.sleep(options['interval'])
+
+    def print_summary(self, snapshot, gauges, previous, elapsed):
+        queues = ', '.join(
+            f"{metrics.labels_dict(labels)['queue']} {int(length)}"
+            for labels, length in sorted(gauges['celery_queue_length'].items())
+        ) or 'n/a'
+        in_progress = {metrics.labels_dict(labels)['status']: int(n) for labels, n in gauges['conversions_in_progress'].items()}
+        self.stdout.write(
+            f"\n{timezone.now():%Y-%m-%d %H:%M:%S}  queued: {queues}  "
+            f"conversions pending {in_progress.get('pending', 0)}, processing {in_progress.get('processing', 0)}"
+        )
+
+        finished = {}
+        for labels, count in snapshot['celery_tasks_total'].items():
+            label = metrics.labels_dict(labels)
+            finished.setdefault(label['task'], {}).setdefault(label['state'], 0)
+            finished[label['task']][label['state']] += count
+        before = {}
+        for labels, count in (previous or {}).get('celery_tasks_total', {}).items():
+            task = metrics.labels_dict(labels)['task']
+            before[task] = before.get(task, 0) + count
+
+        self.stdout.write(
+            f"{'task':<45} {'success':>7} {'failed':>7} {'rate/s':>7} {'wait p50':>9} {'wait p95':>9} "
+            f"{'run p50':>9} {'run p95':>9}"
+        )
+        for task, states in sorted(finished.items()):
+            total = sum(states.values())
+            rate = f'{(total - before.get(task, 0)) / elapsed:.2f}' if elapsed else '-'
+            wait = snapshot['celery_task_queue_wait_seconds'].get(metrics.label_string({'task': task}))
+            run = snapshot['celery_task_runtime_seconds'].get(metrics.label_string({'task': task}))
+            self.stdout.write(
+                f"{task:<45} {int(states.get('success', 0)):>7} {int(states.get('failure', 0)):>7} {rate:>7} "
+                + ' '.join(
+                    f'{seconds(self.quantile(name, histogram, q)):>9}'
+                    for name, histogram in [('celery_task_queue_wait_seconds', wait), ('celery_task_runtime_seconds', run)]
+                    for q in (0.5, 0.95)
+                )
+            )
+
+        outcomes = {
+            metrics.labels_dict(labels)['outcome']: int(count)
+            for labels, count in snapshot['conversions_total'].items()
+        }
+        conversions = sum(outcomes.values())
+        if conversions:
+            failed = conversions - outcomes.get('completed', 0)
+            libreoffice = snapshot['conversion_libreoffice_seconds'].get('')
+            ratio = snapshot['conversion_output_ratio'].get('')
+            self.stdout.write(
+                'conversions: ' + ', '.join(f'{n} {outcome}' for outcome, n in sorted(outcomes.items()))
+                + f' ({failed / conversions:.1%} not completed)'
+                + f"; LibreOffice p50 {seconds(self.quantile('conversion_libreoffice_seconds', libreoffice, 0.5))}"
+                + f" p95 {seconds(self.quantile('conversion_libreoffice_seconds', libreoffice, 0.95))}"
+                + (f"; PDF/DOCX size ratio mean {ratio['sum'] / ratio['count']:.2f}" if ratio and ratio['count'] else '')
+            )
+
+    def quantile(self, name, histogram, q):
+        return metrics.quantile(name, histogram, q) if histogram else None
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from repository.related import rebuild_all
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the related-works feature index and every top-K neighbour list'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Works per indexing/scoring batch')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = rebuild_all(chunk_size=options['chunk_size'], stdout=self.stdout)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt related works for {total} works in {elapsed:.1f}s'))
@@ -0,0 +1,104 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from repository.loadtest import ScenarioRunner
+from repository.models import ScholarlyWork
+
+User = get_user_model()
+
+SCENARIOS = ['list_search', 'detail', 'react_toggle', 'download', 'profile_export']
+
+
+class Command(BaseCommand):
+    help = 'Replays API scenarios in-process and reports latency percentiles and queries per request as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per scenario')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                            help='Scenario to run (repeatable, default: all)')
+        parser.add_argument('--client', choices=['wsgi', 'asgi'], default='wsgi',
+                            help='Drive the URLconf through the sync test client or the ASGI handler')
+        parser.add_argument('--username', help='User to authenticate as (default: first active user)')
+        parser.add_argument('--sample', type=int, default=500, help='Number of work/scholar ids to sample from')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--compare', help='Previous JSON report to print p95 and query deltas against')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1.')
+
+        user = self.get_user(options['username'])
+        work_ids = list(ScholarlyWork.objects.order_by('?').values_list('id', flat=True)[:options['sample']])
+        scholar_ids = list(
+            User.objects.filter(is_active=True).order_by('?').values_list('id', flat=True)[:options['sample']]
+        )
+        if not work_ids:
+            raise CommandError('No works found. Run generate_dataset first.')
+
+        runner = ScenarioRunner(
+            work_ids,
+            scholar_ids,
+            token=str(AccessToken.for_user(user)),
+            use_asgi=options['client'] == 'asgi',
+            seed=options['seed'],
+        )
+        results = runner.run(options['scenario'] or SCENARIOS, options['iterations'], warmup=options['warmup'])
+
+        report = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'client': options['client'],
+                'iterations': options['iterations'],
+                'database': connection.vendor,
+                'works': ScholarlyWork.objects.count(),
+                'users': User.objects.count(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'scenarios': results,
+        }
+
+        payload = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(payload + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(payload)
+
+        if options['compare']:
+            self.print_comparison(options['compare'], results)
+
+    def get_user(self, username):
+        users = User.objects.filter(is_active=True)
+        if username:
+            users = users.filter(username=username)
+        user = users.order_by('id').first()
+        if user is None:
+            raise CommandError('No active user to authenticate as.')
+        return user
+
+    def print_comparison(self, path, results):
+        with open(path) as f:
+            baseline = json.load(f)['scenarios']
+
+        for name, current in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            p95_delta = current['p95_ms'] - previous['p95_ms']
+            query_delta = current.get('queries_per_request', 0) - previous.get('queries_per_request', 0)
+            self.stderr.write(
+                f"{name:15} p95 {previous['p95_ms']:9.2f} -> {current['p95_ms']:9.2f} ms ({p95_delta:+.2f})  "
+                f"queries {previous.get('queries_per_request', 0):6.2f} -> "
+                f"{current.get('queries_per_request', 0):6.2f} ({query_delta:+.2f})"
+            )
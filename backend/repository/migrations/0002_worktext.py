@@ -0,0 +1,54 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:07
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def add_postgres_search_storage(apps, schema_editor):
+    """GIN index for the tsvector and lz4 TOAST compression for the body (PostgreSQL only)"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS repository_worktext_search_vector_gin '
+        'ON repository_worktext USING gin (search_vector)'
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 'lz4' = ANY(enumvals) FROM pg_settings WHERE name = 'default_toast_compression'"
+        )
+        row = cursor.fetchone()
+    if row and row[0]:
+        schema_editor.execute('ALTER TABLE repository_worktext ALTER COLUMN body SET COMPRESSION lz4')
+
+
+def remove_postgres_search_storage(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS repository_worktext_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkText',
+            fields=[
+                ('scholarly_work', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fulltext', serialize=False, to='repository.scholarlywork')),
+                ('body', models.TextField(blank=True)),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+                ('char_count', models.IntegerField(default=0)),
+                ('truncated', models.BooleanField(default=False, help_text='Body was cut at FULLTEXT_MAX_CHARS')),
+                ('extracted_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Work Text',
+                'verbose_name_plural': 'Work Texts',
+            },
+        ),
+        migrations.RunPython(add_postgres_search_storage, remove_postgres_search_storage),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:10
+
+import django.db.models.deletion
+import repository.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0002_worktext'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scholarlywork',
+            name='thumbnails_generated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='WorkThumbnail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.CharField(max_length=20)),
+                ('format', models.CharField(choices=[('webp', 'WebP'), ('jpeg', 'JPEG')], max_length=10)),
+                ('image', models.FileField(upload_to=repository.models.thumbnail_upload_path)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('scholarly_work', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thumbnails', to='repository.scholarlywork')),
+            ],
+            options={
+                'unique_together': {('scholarly_work', 'size', 'format')},
+            },
+        ),
+    ]
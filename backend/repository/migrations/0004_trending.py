@@ -0,0 +1,37 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0003_workthumbnail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('scholarly_work', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='repository.scholarlywork')),
+                ('score', models.FloatField(db_index=True, default=0)),
+                ('reactions', models.PositiveIntegerField(default=0, help_text='Reactions counted into the score')),
+                ('downloads', models.PositiveIntegerField(default=0, help_text='Downloads counted into the score')),
+                ('last_activity_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-score'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TrendingState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_reaction_id', models.BigIntegerField(default=0)),
+                ('epoch', models.DateTimeField()),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
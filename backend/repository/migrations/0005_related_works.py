@@ -0,0 +1,46 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0004_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedWorks',
+            fields=[
+                ('scholarly_work', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='related', serialize=False, to='repository.scholarlywork')),
+                ('neighbours', models.JSONField(default=list)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Related Works',
+            },
+        ),
+        migrations.CreateModel(
+            name='RelatedWorksState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_reaction_id', models.BigIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WorkFeature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('author', 'Author'), ('keyword', 'Keyword'), ('reactor', 'Reacting user')], max_length=10)),
+                ('value', models.CharField(max_length=255)),
+                ('scholarly_work', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='features', to='repository.scholarlywork')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'value'], name='repository__kind_6c15d7_idx')],
+                'unique_together': {('scholarly_work', 'kind', 'value')},
+            },
+        ),
+    ]
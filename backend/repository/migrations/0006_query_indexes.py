@@ -0,0 +1,47 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0005_related_works'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reaction',
+            index=models.Index(fields=['scholarly_work', '-created_at'], name='reaction_work_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reaction',
+            index=models.Index(fields=['user', '-created_at'], name='reaction_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scholarlywork',
+            index=models.Index(fields=['-uploaded_at'], name='work_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scholarlywork',
+            index=models.Index(fields=['publication_year', '-uploaded_at'], name='work_year_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scholarlywork',
+            index=models.Index(fields=['file_type', '-uploaded_at'], name='work_type_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scholarlywork',
+            index=models.Index(fields=['uploader', '-uploaded_at'], name='work_uploader_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scholarlywork',
+            index=models.Index(fields=['title'], name='work_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scholarlywork',
+            index=models.Index(condition=models.Q(('conversion_status__in', ['pending', 'processing'])), fields=['conversion_status', 'uploaded_at'], name='work_conversion_pending_idx'),
+        ),
+    ]
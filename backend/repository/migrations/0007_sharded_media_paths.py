@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:30
+
+import repository.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0006_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='scholarlywork',
+            name='converted_pdf',
+            field=models.FileField(blank=True, null=True, upload_to=repository.models.converted_pdf_upload_path),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0007_sharded_media_paths'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='scholarlywork',
+            name='work_uploaded_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='scholarlywork',
+            name='work_year_uploaded_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='scholarlywork',
+            name='work_type_uploaded_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='scholarlywork',
+            name='work_uploader_uploaded_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='scholarlywork',
+            name='work_title_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='scholarlywork',
+            name='work_conversion_pending_idx',
+        ),
+        migrations.AddField(
+            model_name='scholarlywork',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='scholarlywork',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['-uploaded_at'], name='work_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scholarlywork',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['publication_year', '-uploaded_at'], name='work_year_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scholarlywork',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['file_type', '-uploaded_at'], name='work_type_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scholarlywork',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['uploader', '-uploaded_at'], name='work_uploader_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scholarlywork',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['title'], name='work_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scholarlywork',
+            index=models.Index(condition=models.Q(('conversion_status__in', ['pending', 'processing']), ('deleted_at__isnull', True)), fields=['uploaded_at'], name='work_conversion_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scholarlywork',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='work_deleted_idx'),
+        ),
+    ]
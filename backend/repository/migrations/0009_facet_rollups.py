@@ -0,0 +1,73 @@
+# Generated by Django 5.0.1 on 2026-10-19 05:58
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_rollups(apps, schema_editor):
+    """Same as repository.facets.rebuild, with the historical models"""
+    ScholarlyWork = apps.get_model('repository', 'ScholarlyWork')
+    FacetCell = apps.get_model('repository', 'FacetCell')
+    CountryRollup = apps.get_model('repository', 'CountryRollup')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+
+    cells = (
+        ScholarlyWork.objects.filter(deleted_at__isnull=True)
+        .values_list('publication_year', 'file_type', 'uploader__country')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    countries = defaultdict(lambda: [0, 0])
+    new_cells = []
+    for year, file_type, country, works in cells:
+        new_cells.append(FacetCell(publication_year=year, file_type=file_type, country=country, works=works))
+        countries[country][1] += works
+    scholars = User.objects.filter(is_active=True, is_staff=False).values_list('country').annotate(n=Count('id')).order_by()
+    for country, n in scholars:
+        countries[country][0] = n
+
+    FacetCell.objects.bulk_create(new_cells, batch_size=1000)
+    CountryRollup.objects.bulk_create(
+        [CountryRollup(country=country, scholars=n, works=works) for country, (n, works) in countries.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0008_soft_delete'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CountryRollup',
+            fields=[
+                ('country', models.CharField(blank=True, max_length=100, primary_key=True, serialize=False)),
+                ('scholars', models.IntegerField(default=0)),
+                ('works', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FacetCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('publication_year', models.IntegerField()),
+                ('file_type', models.CharField(max_length=10)),
+                ('country', models.CharField(blank=True, max_length=100)),
+                ('works', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['file_type', 'publication_year'], name='facet_cell_type_year_idx'), models.Index(fields=['country', 'publication_year'], name='facet_cell_country_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='facetcell',
+            constraint=models.UniqueConstraint(fields=('publication_year', 'file_type', 'country'), name='facet_cell_unique'),
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.1 on 2026-10-19 06:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0010_export_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkSignature',
+            fields=[
+                ('scholarly_work', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='repository.scholarlywork')),
+                ('metadata', models.BinaryField()),
+                ('text', models.BinaryField(blank=True, null=True)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SignatureBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('metadata', 'Title, authors and description'), ('text', 'Extracted text')], max_length=10)),
+                ('band', models.SmallIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('scholarly_work', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='signature_bands', to='repository.scholarlywork')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'band', 'bucket'], name='signature_band_bucket_idx')],
+                'unique_together': {('scholarly_work', 'kind', 'band')},
+            },
+        ),
+    ]
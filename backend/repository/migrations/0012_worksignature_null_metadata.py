@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-19 06:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0011_duplicate_signatures'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='worksignature',
+            name='metadata',
+            field=models.BinaryField(null=True),
+        ),
+    ]
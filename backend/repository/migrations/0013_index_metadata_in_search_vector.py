@@ -0,0 +1,39 @@
+# Generated by Django 5.0.1 on 2026-10-19 09:12
+
+from django.conf import settings
+from django.db import migrations
+
+
+def index_metadata(apps, schema_editor):
+    """
+    Give every work a WorkText row and put its metadata into the search vector,
+    so ?q= can be answered from the GIN index alone (PostgreSQL only)
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    config = settings.FULLTEXT_SEARCH_CONFIG
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO repository_worktext (scholarly_work_id, body, char_count, truncated, extracted_at) "
+            "SELECT w.id, '', 0, false, now() FROM repository_scholarlywork w "
+            "WHERE NOT EXISTS (SELECT 1 FROM repository_worktext t WHERE t.scholarly_work_id = w.id)"
+        )
+        cursor.execute(
+            "UPDATE repository_worktext t SET search_vector = "
+            "setweight(to_tsvector(%s::regconfig, coalesce(w.title, '')), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, coalesce(w.authors, '') || ' ' || coalesce(w.keywords, '')), 'B') || "
+            "setweight(to_tsvector(%s::regconfig, coalesce(t.body, '')), 'D') "
+            "FROM repository_scholarlywork w WHERE w.id = t.scholarly_work_id",
+            [config, config, config],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0012_worksignature_null_metadata'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_metadata, migrations.RunPython.noop),
+    ]
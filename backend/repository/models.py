@@ -1,11 +1,45 @@
+import os
+import uuid
+
 from django.db import models
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import FileExtensionValidator
 
 
+def sharded_path(prefix, filename):
+    """
+    <prefix>/ab/cd/<uuid>.<ext>: two hashed directory levels keep every directory
+    small and uuid names never collide. The user-facing name lives in original_filename.
+    """
+    name = uuid.uuid4().hex
+    extension = os.path.splitext(filename)[1].lower()
+    return f'{prefix}/{name[:2]}/{name[2:4]}/{name}{extension}'
+
+
 def scholarly_work_upload_path(instance, filename):
-    """Generate upload path: media/scholarly_works/user_id/filename"""
-    return f'scholarly_works/{instance.uploader.id}/{filename}'
+    """Generate upload path: media/works/ab/cd/<uuid>.<ext> (was scholarly_works/user_id/filename)"""
+    return sharded_path('works', filename)
+
+
+def converted_pdf_upload_path(instance, filename):
+    """Generate upload path: media/converted/ab/cd/<uuid>.pdf (was converted_pdfs/filename)"""
+    return sharded_path('converted', filename)
+
+
+def thumbnail_upload_path(instance, filename):
+    """Generate upload path: media/thumbnails/ab/cd/<uuid>.<ext> (was thumbnails/work_id/filename)"""
+    return sharded_path('thumbnails', filename)
+
+
+LIVE = models.Q(deleted_at__isnull=True)
+
+
+class LiveWorkManager(models.Manager):
+    """Hides soft-deleted works; they only wait for purge_deleted_works to remove them"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(LIVE)
 
 
 class ScholarlyWork(models.Model):
@@ -24,7 +58,7 @@ class ScholarlyWork(models.Model):
     file_type       = models.CharField(max_length=50)  # 'pdf' or 'docx'
     
     # DOCX conversion tracking (RM14, RM15)
-    converted_pdf   = models.FileField(upload_to='converted_pdfs/', blank=True, null=True)
+    converted_pdf   = models.FileField(upload_to=converted_pdf_upload_path, blank=True, null=True)
     conversion_status = models.CharField(
         max_length=20,
         choices=[
@@ -36,6 +70,7 @@ class ScholarlyWork(models.Model):
         default='completed'  # PDFs don't need conversion
     )
     conversion_progress = models.IntegerField(default=0, help_text="Percentage 0-100")
+    thumbnails_generated_at = models.DateTimeField(blank=True, null=True)
     
     # Metadata
     uploader        = models.ForeignKey(
@@ -49,11 +84,36 @@ class ScholarlyWork(models.Model):
     # Additional fields
     description     = models.TextField(blank=True)
     keywords        = models.CharField(max_length=500, blank=True, help_text="Comma-separated keywords")
+
+    # Set by the delete endpoint (RM16); rows and files are removed in the background
+    deleted_at      = models.DateTimeField(blank=True, null=True)
+
+    objects = LiveWorkManager()
+    all_objects = models.Manager()
     
     class Meta:
         ordering = ['-uploaded_at']
         verbose_name = 'Scholarly Work'
         verbose_name_plural = 'Scholarly Works'
+        # One index per filter + order combination the list endpoint exposes (RM7, RS6),
+        # covering live works only since that is all the default manager ever reads
+        indexes = [
+            models.Index(fields=['-uploaded_at'], name='work_uploaded_idx', condition=LIVE),
+            models.Index(fields=['publication_year', '-uploaded_at'], name='work_year_uploaded_idx', condition=LIVE),
+            models.Index(fields=['file_type', '-uploaded_at'], name='work_type_uploaded_idx', condition=LIVE),
+            models.Index(fields=['uploader', '-uploaded_at'], name='work_uploader_uploaded_idx', condition=LIVE),
+            models.Index(fields=['title'], name='work_title_idx', condition=LIVE),
+            # Harvest order of the metadata export, and its from/until window
+            models.Index(fields=['updated_at', 'id'], name='work_updated_idx', condition=LIVE),
+            # Only the few works still waiting for conversion (pollers, admin)
+            models.Index(
+                fields=['uploaded_at'],
+                name='work_conversion_pending_idx',
+                condition=models.Q(conversion_status__in=['pending', 'processing']) & LIVE,
+            ),
+            # Only the works waiting to be purged
+            models.Index(fields=['deleted_at'], name='work_deleted_idx', condition=models.Q(deleted_at__isnull=False)),
+        ]
     
     def __str__(self):
         return f"{self.title} ({self.publication_year})"
@@ -69,6 +129,20 @@ class ScholarlyWork(models.Model):
         """Return authors as a list"""
         return [author.strip() for author in self.authors.split(',')]
 
+    @property
+    def preview_source(self):
+        """File to render previews from - converted PDF if available, otherwise original"""
+        if self.file_type == 'docx' and self.converted_pdf:
+            return self.converted_pdf
+        return self.file
+
+    @property
+    def download_filename(self):
+        """Name the download is offered under - stored paths are opaque, the original name is kept here"""
+        if self.file_type == 'docx' and self.converted_pdf:
+            return f"{self.original_filename.rsplit('.', 1)[0]}.pdf"
+        return self.original_filename
+
 
 class Reaction(models.Model):
     """Like/reaction system (RS4)"""
@@ -87,6 +161,227 @@ class Reaction(models.Model):
     class Meta:
         unique_together = ['user', 'scholarly_work']  # One reaction per user per work
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['scholarly_work', '-created_at'], name='reaction_work_created_idx'),
+            models.Index(fields=['user', '-created_at'], name='reaction_user_created_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.user.username} reacted to {self.scholarly_work.title}"
\ No newline at end of file
+        return f"{self.user.username} reacted to {self.scholarly_work.title}"
+
+
+class WorkThumbnail(models.Model):
+    """Pre-rendered first-page preview of a work in one size and image format"""
+    FORMAT_CHOICES = [
+        ('webp', 'WebP'),
+        ('jpeg', 'JPEG'),
+    ]
+
+    scholarly_work  = models.ForeignKey(
+        ScholarlyWork,
+        on_delete=models.CASCADE,
+        related_name='thumbnails'
+    )
+    size            = models.CharField(max_length=20)  # key of settings.THUMBNAIL_SIZES
+    format          = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    image           = models.FileField(upload_to=thumbnail_upload_path)
+    width           = models.PositiveIntegerField()
+    height          = models.PositiveIntegerField()
+    updated_at      = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['scholarly_work', 'size', 'format']
+
+    def __str__(self):
+        return f"{self.size} {self.format} thumbnail of work {self.scholarly_work_id}"
+
+
+class TrendingScore(models.Model):
+    """
+    Precomputed trending rank of a work, refreshed incrementally by Celery beat.
+
+    `score` uses forward decay: every event adds weight * 2^((t - epoch) / half-life),
+    so rows only change when their work has new activity and ordering by `score` is
+    the same as ordering by the decayed value. See repository/trending.py.
+    """
+    scholarly_work  = models.OneToOneField(
+        ScholarlyWork,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending'
+    )
+    score           = models.FloatField(default=0, db_index=True)
+    reactions       = models.PositiveIntegerField(default=0, help_text="Reactions counted into the score")
+    downloads       = models.PositiveIntegerField(default=0, help_text="Downloads counted into the score")
+    last_activity_at = models.DateTimeField()
+    updated_at      = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-score']
+
+    def __str__(self):
+        return f"Trending score of work {self.scholarly_work_id}"
+
+
+class TrendingState(models.Model):
+    """Single row: high-water mark of processed reactions and the decay epoch"""
+    last_reaction_id = models.BigIntegerField(default=0)
+    epoch           = models.DateTimeField()
+    refreshed_at    = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Trending state (reactions up to {self.last_reaction_id})"
+
+
+class WorkFeature(models.Model):
+    """
+    Inverted index row for related-works scoring: one normalized author, keyword
+    or reacting user of a work. Looking up (kind, value) gives every work sharing it.
+    """
+    KIND_CHOICES = [
+        ('author', 'Author'),
+        ('keyword', 'Keyword'),
+        ('reactor', 'Reacting user'),
+    ]
+
+    scholarly_work  = models.ForeignKey(
+        ScholarlyWork,
+        on_delete=models.CASCADE,
+        related_name='features'
+    )
+    kind            = models.CharField(max_length=10, choices=KIND_CHOICES)
+    value           = models.CharField(max_length=255)
+
+    class Meta:
+        unique_together = ['scholarly_work', 'kind', 'value']
+        indexes = [models.Index(fields=['kind', 'value'])]
+
+    def __str__(self):
+        return f"{self.kind}={self.value} of work {self.scholarly_work_id}"
+
+
+class RelatedWorks(models.Model):
+    """Precomputed top-K neighbours of a work: [[work_id, score], ...] best first"""
+    scholarly_work  = models.OneToOneField(
+        ScholarlyWork,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='related'
+    )
+    neighbours      = models.JSONField(default=list)
+    computed_at     = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Related Works'
+
+    def __str__(self):
+        return f"Related works of work {self.scholarly_work_id}"
+
+
+class RelatedWorksState(models.Model):
+    """Single row: high-water mark of reactions already folded into reactor features"""
+    last_reaction_id = models.BigIntegerField(default=0)
+    refreshed_at    = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Related works state (reactions up to {self.last_reaction_id})"
+
+
+class WorkText(models.Model):
+    """Extracted document body for full-text search (kept out of ScholarlyWork so list queries never load it)"""
+    scholarly_work  = models.OneToOneField(
+        ScholarlyWork,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='fulltext'
+    )
+    body            = models.TextField(blank=True)
+    # Maintained by the extraction task on PostgreSQL; GIN-indexed in the migration
+    search_vector   = SearchVectorField(null=True, editable=False)
+    char_count      = models.IntegerField(default=0)
+    truncated       = models.BooleanField(default=False, help_text="Body was cut at FULLTEXT_MAX_CHARS")
+    extracted_at    = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Work Text'
+        verbose_name_plural = 'Work Texts'
+
+    def __str__(self):
+        return f"Text of work {self.scholarly_work_id} ({self.char_count} chars)"
+
+
+class WorkSignature(models.Model):
+    """MinHash signatures of a work's metadata and extracted text, for near-duplicate detection (duplicates.py)"""
+    scholarly_work  = models.OneToOneField(
+        ScholarlyWork,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='signature'
+    )
+    metadata        = models.BinaryField(null=True)  # null: no word characters to shingle
+    text            = models.BinaryField(blank=True, null=True)  # set once the text is extracted
+    computed_at     = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Signature of work {self.scholarly_work_id}"
+
+
+class SignatureBand(models.Model):
+    """
+    LSH bucket of one band of a work's signature. Works with a row in the same
+    (kind, band, bucket) are candidate duplicates; nothing else is compared.
+    """
+    KIND_CHOICES = [
+        ('metadata', 'Title, authors and description'),
+        ('text', 'Extracted text'),
+    ]
+
+    scholarly_work  = models.ForeignKey(
+        ScholarlyWork,
+        on_delete=models.CASCADE,
+        related_name='signature_bands'
+    )
+    kind            = models.CharField(max_length=10, choices=KIND_CHOICES)
+    band            = models.SmallIntegerField()
+    bucket          = models.BigIntegerField()
+
+    class Meta:
+        unique_together = ['scholarly_work', 'kind', 'band']
+        indexes = [models.Index(fields=['kind', 'band', 'bucket'], name='signature_band_bucket_idx')]
+
+    def __str__(self):
+        return f"{self.kind} band {self.band} of work {self.scholarly_work_id}"
+
+
+class FacetCell(models.Model):
+    """
+    Live works per (publication year, file type, uploader country). Facet counts
+    for filters on these three dimensions are sums over cells; kept current by
+    repository/facets.py on upload, edit and delete.
+    """
+    publication_year = models.IntegerField()
+    file_type       = models.CharField(max_length=10)
+    country         = models.CharField(max_length=100, blank=True)
+    works           = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['publication_year', 'file_type', 'country'], name='facet_cell_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['file_type', 'publication_year'], name='facet_cell_type_year_idx'),
+            models.Index(fields=['country', 'publication_year'], name='facet_cell_country_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.works} works ({self.publication_year}, {self.file_type}, {self.country or 'no country'})"
+
+
+class CountryRollup(models.Model):
+    """Listed scholars and their live works per country, for the globe view"""
+    country         = models.CharField(max_length=100, primary_key=True, blank=True)
+    scholars        = models.IntegerField(default=0)
+    works           = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.country or 'No country'}: {self.scholars} scholars, {self.works} works"
@@ -0,0 +1,290 @@
+"""
+Write-behind buffer for reaction toggles.
+
+A toggle flips the user's membership in a per-work set and records the new
+state in a per-work pending map, both in one atomic step, so the API can
+answer with the current state and count without touching the Reaction
+table. `flush_reaction_buffer` (Celery beat) later drains the pending maps
+into the database with bulk inserts and deletes.
+
+The Redis backend is shared by all web processes. The local backend keeps
+the same structures in process memory for tests and single-process setups.
+"""
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+from .models import Reaction, ScholarlyWork
+
+User = get_user_model()
+
+# Sets expire this long after a work's last flush and are re-seeded from the database on the
+# next toggle. They never expire while toggles are pending or flushing: a re-seed would lose them.
+MEMBERS_TTL = 24 * 60 * 60
+
+TOGGLE_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    return {-1, 0}
+end
+local reacted = 1
+if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 1 then
+    redis.call('SREM', KEYS[1], ARGV[1])
+    reacted = 0
+else
+    redis.call('SADD', KEYS[1], ARGV[1])
+end
+redis.call('HSET', KEYS[3], ARGV[1], reacted)
+redis.call('SADD', KEYS[4], ARGV[2])
+redis.call('PERSIST', KEYS[1])
+redis.call('PERSIST', KEYS[2])
+return {reacted, redis.call('SCARD', KEYS[1])}
+"""
+
+SEED_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+if #ARGV > 1 then
+    redis.call('SADD', KEYS[1], unpack(ARGV, 2))
+end
+redis.call('SET', KEYS[2], 1)
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+return 1
+"""
+
+# Pending toggles are merged into a per-work "flushing" map before the database write,
+# so a crash mid-flush leaves them in Redis to be retried instead of losing them
+DRAIN_SCRIPT = """
+local pending = redis.call('HGETALL', KEYS[1])
+for i = 1, #pending, 2 do
+    redis.call('HSET', KEYS[2], pending[i], pending[i + 1])
+end
+redis.call('DEL', KEYS[1])
+return redis.call('HGETALL', KEYS[2])
+"""
+
+# The set may expire again once nothing is left to flush; a toggle since the drain keeps it
+ACKNOWLEDGE_SCRIPT = """
+redis.call('DEL', KEYS[1])
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    redis.call('EXPIRE', KEYS[3], ARGV[1])
+    redis.call('EXPIRE', KEYS[4], ARGV[1])
+end
+"""
+
+
+def reactor_ids(work_id):
+    return list(Reaction.objects.filter(scholarly_work_id=work_id).values_list('user_id', flat=True))
+
+
+class RedisReactionBuffer:
+    prefix = 'reactions'
+
+    def __init__(self, client=None):
+        if client is None:
+            from backend.redis_client import get_redis
+            client = get_redis()
+        self.redis = client
+        self._toggle = client.register_script(TOGGLE_SCRIPT)
+        self._seed = client.register_script(SEED_SCRIPT)
+        self._drain = client.register_script(DRAIN_SCRIPT)
+        self._acknowledge = client.register_script(ACKNOWLEDGE_SCRIPT)
+
+    def _keys(self, work_id):
+        return {
+            'members': f'{self.prefix}:members:{work_id}',
+            'seeded': f'{self.prefix}:seeded:{work_id}',
+            'pending': f'{self.prefix}:pending:{work_id}',
+            'flushing': f'{self.prefix}:flushing:{work_id}',
+        }
+
+    def toggle(self, work_id, user_id):
+        """Flip the user's reaction. Returns (user_has_reacted, reaction_count)."""
+        keys = self._keys(work_id)
+        toggle_keys = [keys['members'], keys['seeded'], keys['pending'], f'{self.prefix}:dirty']
+        args = [user_id, work_id]
+
+        reacted, count = self._toggle(keys=toggle_keys, args=args)
+        if reacted == -1:
+            self._seed(keys=[keys['members'], keys['seeded']], args=[MEMBERS_TTL, *reactor_ids(work_id)])
+            reacted, count = self._toggle(keys=toggle_keys, args=args)
+        return bool(reacted), count
+
+    def state(self, work_ids, user_id=None):
+        """
+        {work_id: (user_has_reacted, reaction_count)} for the works whose set is seeded,
+        i.e. the ones toggled lately; the database is current for all the others
+        """
+        pipe = self.redis.pipeline()
+        for work_id in work_ids:
+            keys = self._keys(work_id)
+            pipe.exists(keys['seeded'])
+            pipe.scard(keys['members'])
+            pipe.sismember(keys['members'], user_id or 0)
+        replies = pipe.execute()
+
+        found = {}
+        for i, work_id in enumerate(work_ids):
+            seeded, count, reacted = replies[3 * i:3 * i + 3]
+            if seeded:
+                found[work_id] = (bool(reacted) and user_id is not None, count)
+        return found
+
+    def drain(self, limit=500):
+        """Hand pending toggles over for flushing: {work_id: {user_id: reacted}}"""
+        work_ids = self.redis.spop(f'{self.prefix}:dirty', limit) or []
+        # Works whose previous flush failed are retried as well
+        work_ids = set(work_ids) | set(self.redis.smembers(f'{self.prefix}:flushing'))
+
+        batch = {}
+        for work_id in work_ids:
+            keys = self._keys(work_id)
+            self.redis.sadd(f'{self.prefix}:flushing', work_id)
+            state = self._drain(keys=[keys['pending'], keys['flushing']])
+            changes = {int(state[i]): state[i + 1] == '1' for i in range(0, len(state), 2)}
+            if changes:
+                batch[int(work_id)] = changes
+            else:
+                self.redis.srem(f'{self.prefix}:flushing', work_id)
+        return batch
+
+    def acknowledge(self, work_ids):
+        """Forget flushed toggles once they are committed"""
+        if not work_ids:
+            return
+        pipe = self.redis.pipeline()
+        for work_id in work_ids:
+            keys = self._keys(work_id)
+            self._acknowledge(
+                keys=[keys['flushing'], keys['pending'], keys['members'], keys['seeded']],
+                args=[MEMBERS_TTL],
+                client=pipe,
+            )
+        pipe.srem(f'{self.prefix}:flushing', *work_ids)
+        pipe.execute()
+
+    def pending_count(self):
+        return self.redis.scard(f'{self.prefix}:dirty')
+
+    def acquire_flush_lock(self, timeout=60):
+        """Only one flusher may apply a work's toggles at a time, or an older state could win"""
+        return bool(self.redis.set(f'{self.prefix}:flush-lock', 1, nx=True, ex=timeout))
+
+    def release_flush_lock(self):
+        self.redis.delete(f'{self.prefix}:flush-lock')
+
+
+class LocalReactionBuffer:
+    """In-process equivalent of RedisReactionBuffer"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._members = {}
+        self._pending = {}
+        self._flushing = {}
+        self._flush_lock = threading.Lock()
+
+    def toggle(self, work_id, user_id):
+        if work_id not in self._members:
+            # Read outside the lock; the first seed wins if two requests race
+            seed = set(reactor_ids(work_id))
+            with self._lock:
+                self._members.setdefault(work_id, seed)
+
+        with self._lock:
+            members = self._members[work_id]
+            reacted = user_id not in members
+            if reacted:
+                members.add(user_id)
+            else:
+                members.discard(user_id)
+            self._pending.setdefault(work_id, {})[user_id] = reacted
+            return reacted, len(members)
+
+    def state(self, work_ids, user_id=None):
+        with self._lock:
+            return {
+                work_id: (user_id in self._members[work_id], len(self._members[work_id]))
+                for work_id in work_ids
+                if work_id in self._members
+            }
+
+    def drain(self, limit=500):
+        with self._lock:
+            for work_id in list(self._pending)[:limit]:
+                self._flushing.setdefault(work_id, {}).update(self._pending.pop(work_id))
+            return {work_id: dict(changes) for work_id, changes in self._flushing.items()}
+
+    def acknowledge(self, work_ids):
+        with self._lock:
+            for work_id in work_ids:
+                self._flushing.pop(work_id, None)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def acquire_flush_lock(self, timeout=60):
+        return self._flush_lock.acquire(blocking=False)
+
+    def release_flush_lock(self):
+        self._flush_lock.release()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_reaction_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            if settings.REACTION_BUFFER_BACKEND == 'local':
+                _buffer = LocalReactionBuffer()
+            else:
+                _buffer = RedisReactionBuffer()
+        return _buffer
+
+
+def apply_reaction_changes(batch):
+    """
+    Write drained toggles to the Reaction table. Pairs that already have a row are
+    skipped and not counted (the unique constraint still settles a concurrent
+    insert), toggles for works or users that were deleted in the meantime are dropped.
+    Returns (created, deleted).
+    """
+    if not batch:
+        return 0, 0
+
+    user_ids = {user_id for changes in batch.values() for user_id in changes}
+    live_works = set(ScholarlyWork.objects.filter(id__in=batch).values_list('id', flat=True))
+    live_users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+
+    additions = []
+    removals = Q()
+    for work_id, changes in batch.items():
+        if work_id not in live_works:
+            continue
+        removed = [user_id for user_id, reacted in changes.items() if not reacted]
+        if removed:
+            removals |= Q(scholarly_work_id=work_id, user_id__in=removed)
+        additions.extend(
+            Reaction(scholarly_work_id=work_id, user_id=user_id)
+            for user_id, reacted in changes.items()
+            if reacted and user_id in live_users
+        )
+
+    deleted = Reaction.objects.filter(removals).delete()[0] if removals else 0
+    if additions:
+        existing = set(
+            Reaction.objects.filter(
+                scholarly_work_id__in={r.scholarly_work_id for r in additions},
+                user_id__in={r.user_id for r in additions},
+            ).values_list('scholarly_work_id', 'user_id')
+        )
+        additions = [r for r in additions if (r.scholarly_work_id, r.user_id) not in existing]
+    created = len(Reaction.objects.bulk_create(additions, ignore_conflicts=True))
+    return created, deleted
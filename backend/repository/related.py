@@ -0,0 +1,250 @@
+"""
+Related-works recommendations.
+
+Each work is described by a sparse set of features: its normalized authors and
+keywords and the users who reacted to it, stored as WorkFeature rows indexed on
+(kind, value). Two works are related by the features they share, each weighted by
+RELATED_FEATURE_WEIGHTS[kind] * idf, and the sum is damped by the square root
+of the candidate's feature count so hub works with huge reactor lists don't win
+everything. Only live works reachable through a shared feature are ever scored,
+SCORE_BATCH_SIZE works per four queries.
+
+The top RELATED_TOP_K neighbours are stored in one RelatedWorks row per work,
+so the `related/` endpoint reads a single row. Rows are refreshed incrementally:
+on upload (the new work plus its best candidates), on delete (the works that
+listed it) and by a beat job for works with new reactions. `rebuild_related_works`
+recomputes everything.
+"""
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Reaction, RelatedWorks, RelatedWorksState, ScholarlyWork, WorkFeature
+
+LIVE = Q(scholarly_work__deleted_at__isnull=True)
+SCORE_BATCH_SIZE = 200  # works scored per set of queries
+IN_CHUNK_SIZE = 5000  # ids per IN (...) list
+
+
+def split_values(text):
+    """Normalize a comma-separated field: lowercased, whitespace collapsed, no duplicates"""
+    values = {' '.join(part.lower().split())[:255] for part in (text or '').split(',')}
+    values.discard('')
+    return values
+
+
+def sync_features(work_ids):
+    """Rewrite the feature rows of the given works from their current fields and reactions"""
+    rows = []
+    works = ScholarlyWork.objects.filter(id__in=work_ids).values_list('id', 'authors', 'keywords')
+    for work_id, authors, keywords in works:
+        rows.extend(WorkFeature(scholarly_work_id=work_id, kind='author', value=value) for value in split_values(authors))
+        rows.extend(WorkFeature(scholarly_work_id=work_id, kind='keyword', value=value) for value in split_values(keywords))
+
+    reactions = Reaction.objects.filter(scholarly_work_id__in=work_ids).values_list('scholarly_work_id', 'user_id')
+    rows.extend(WorkFeature(scholarly_work_id=work_id, kind='reactor', value=str(user_id)) for work_id, user_id in reactions)
+
+    with transaction.atomic():
+        WorkFeature.objects.filter(scholarly_work_id__in=work_ids).delete()
+        WorkFeature.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+
+def features_filter(features):
+    """One clause per kind instead of one per (kind, value) pair"""
+    by_kind = {}
+    for kind, value in features:
+        by_kind.setdefault(kind, []).append(value)
+    query = Q()
+    for kind, values in by_kind.items():
+        query |= Q(kind=kind, value__in=values)
+    return query
+
+
+def score_many(work_ids, total_works):
+    """
+    {work id: (candidate ids, scores)} for every work sharing a useful feature with
+    each of `work_ids`, in four queries for the whole batch. Only live works count:
+    soft-deleted ones keep their features until they are purged. Features held by only
+    one work or by more than RELATED_MAX_DOCUMENT_FREQUENCY works are ignored: the
+    first can't match anything, the second match too much to mean anything.
+    """
+    # Imported on first use, so processes that never score (web, most commands) don't load numpy
+    import numpy as np
+
+    features = {}
+    own = WorkFeature.objects.filter(scholarly_work_id__in=work_ids).values_list('scholarly_work_id', 'kind', 'value')
+    for work_id, kind, value in own:
+        features.setdefault(work_id, []).append((kind, value))
+    wanted = {feature for work_features in features.values() for feature in work_features}
+
+    weights = {}
+    if wanted:
+        frequencies = (
+            WorkFeature.objects.filter(LIVE, features_filter(wanted))
+            .values_list('kind', 'value')
+            .annotate(df=Count('id'))
+            .order_by()
+        )
+        for kind, value, df in frequencies:
+            if 1 < df <= settings.RELATED_MAX_DOCUMENT_FREQUENCY:
+                weights[(kind, value)] = settings.RELATED_FEATURE_WEIGHTS[kind] * math.log(total_works / df)
+
+    postings = {}
+    if weights:
+        rows = WorkFeature.objects.filter(LIVE, features_filter(weights)).values_list('scholarly_work_id', 'kind', 'value')
+        for other, kind, value in rows:
+            postings.setdefault((kind, value), []).append(other)
+    sizes = feature_counts({other for others in postings.values() for other in others})
+
+    scored = {}
+    for work_id in work_ids:
+        matches = [
+            (other, weights[feature])
+            for feature in features.get(work_id, ()) if feature in weights
+            for other in postings.get(feature, ()) if other != work_id
+        ]
+        if not matches:
+            scored[work_id] = (np.array([], dtype=np.int64), np.array([]))
+            continue
+        posting_works = np.fromiter((other for other, _ in matches), dtype=np.int64, count=len(matches))
+        posting_weights = np.fromiter((weight for _, weight in matches), dtype=np.float64, count=len(matches))
+        candidates, inverse = np.unique(posting_works, return_inverse=True)
+        scores = np.bincount(inverse, weights=posting_weights)
+        scores /= np.sqrt(np.array([sizes.get(candidate, 1) for candidate in candidates.tolist()], dtype=np.float64))
+        scored[work_id] = (candidates, scores)
+    return scored
+
+
+def feature_counts(work_ids):
+    counts = {}
+    work_ids = list(work_ids)
+    for start in range(0, len(work_ids), IN_CHUNK_SIZE):
+        counts.update(
+            WorkFeature.objects.filter(scholarly_work_id__in=work_ids[start:start + IN_CHUNK_SIZE])
+            .values_list('scholarly_work_id')
+            .annotate(n=Count('id'))
+            .order_by()
+        )
+    return counts
+
+
+def score_candidates(work_id, total_works):
+    """(candidate ids, scores) of one work; see score_many"""
+    return score_many([work_id], total_works)[work_id]
+
+
+def top_k(candidates, scores, k):
+    """Best k candidates, highest score first (ties by lower id)"""
+    import numpy as np
+
+    if len(candidates) > k:
+        keep = np.argpartition(-scores, k - 1)[:k]
+        candidates, scores = candidates[keep], scores[keep]
+    order = np.lexsort((candidates, -scores))
+    return [[int(candidates[i]), round(float(scores[i]), 4)] for i in order]
+
+
+def recompute(work_ids, total_works=None):
+    """Recompute and store the top-K neighbours of the given works. Returns the number of rows written."""
+    live = list(ScholarlyWork.objects.filter(id__in=work_ids).values_list('id', flat=True))
+    if not live:
+        return 0
+    total_works = total_works or ScholarlyWork.objects.count()
+    now = timezone.now()
+
+    rows = []
+    for start in range(0, len(live), SCORE_BATCH_SIZE):
+        scored = score_many(live[start:start + SCORE_BATCH_SIZE], total_works)
+        rows.extend(
+            RelatedWorks(
+                scholarly_work_id=work_id,
+                neighbours=top_k(candidates, scores, settings.RELATED_TOP_K),
+                computed_at=now
+            )
+            for work_id, (candidates, scores) in scored.items()
+        )
+
+    RelatedWorks.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['scholarly_work'],
+        update_fields=['neighbours', 'computed_at']
+    )
+    return len(rows)
+
+
+def update_related(work_ids, cascade=True):
+    """
+    Index the given (new or edited) works and recompute their neighbours. With
+    `cascade`, their RELATED_CASCADE_LIMIT best candidates are recomputed too,
+    since the new work is likely to enter those lists.
+    """
+    sync_features(work_ids)
+    total_works = ScholarlyWork.objects.count()
+    affected = set(work_ids)
+    if cascade:
+        for candidates, scores in score_many(list(work_ids), total_works).values():
+            affected.update(work for work, _ in top_k(candidates, scores, settings.RELATED_CASCADE_LIMIT))
+    return recompute(affected, total_works)
+
+
+def works_listing(work_id):
+    """Works whose stored neighbours probably include `work_id` (scores are nearly symmetric)"""
+    neighbours = RelatedWorks.objects.filter(pk=work_id).values_list('neighbours', flat=True).first()
+    return [work for work, _ in neighbours or []]
+
+
+def refresh_related(batch_size=None):
+    """
+    Re-index works that received reactions since the last run and recompute their
+    neighbours. Reactions younger than RELATED_SETTLE_SECONDS are left for the next
+    run, as in trending.refresh_trending, so rows from transactions that commit out of
+    id order are not skipped. Removed reactions are picked up the next time their work
+    is touched (or by a full rebuild). Returns (reactions seen, works recomputed).
+    """
+    batch_size = batch_size or settings.RELATED_REACTION_BATCH_SIZE
+    now = timezone.now()
+    settled = now - timedelta(seconds=settings.RELATED_SETTLE_SECONDS)
+    with transaction.atomic():
+        state, _ = RelatedWorksState.objects.select_for_update().get_or_create(pk=1)
+        new_reactions = list(
+            Reaction.objects.filter(id__gt=state.last_reaction_id, created_at__lt=settled)
+            .order_by('id')
+            .values_list('id', 'scholarly_work_id')[:batch_size]
+        )
+        if new_reactions:
+            state.last_reaction_id = new_reactions[-1][0]
+        state.refreshed_at = now
+        state.save()
+
+    touched = {work_id for _, work_id in new_reactions}
+    if not touched:
+        return 0, 0
+    sync_features(touched)
+    return len(new_reactions), recompute(touched)
+
+
+def rebuild_all(chunk_size=1000, stdout=None):
+    """Index every work, then recompute every neighbour list. Returns the number of works."""
+    # Everything up to here gets indexed below; the beat job continues from this mark. Unsettled
+    # reactions stay above it, so one that commits late is still seen (re-indexing is harmless).
+    settled = timezone.now() - timedelta(seconds=settings.RELATED_SETTLE_SECONDS)
+    last_reaction = (
+        Reaction.objects.filter(created_at__lt=settled).order_by('-id').values_list('id', flat=True).first() or 0
+    )
+    RelatedWorksState.objects.update_or_create(pk=1, defaults={'last_reaction_id': last_reaction})
+
+    work_ids = list(ScholarlyWork.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(work_ids), chunk_size):
+        sync_features(work_ids[start:start + chunk_size])
+
+    total_works = len(work_ids)
+    for start in range(0, total_works, chunk_size):
+        recompute(work_ids[start:start + chunk_size], total_works)
+        if stdout:
+            stdout.write(f"  {min(start + chunk_size, total_works)}/{total_works} works")
+    return total_works
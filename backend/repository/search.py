@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchVector
+from django.db import connections
+from django.db.models import Q, TextField, Value
+from rest_framework.filters import BaseFilterBackend
+
+from .models import WorkText
+
+
+def index_text(work):
+    """
+    Store the work's search vector: title (weight A), authors and keywords (B) and
+    the extracted body (D), so one GIN-indexed match covers metadata and document.
+    Computed in the database so the body is not sent back and forth; PostgreSQL only.
+    """
+    texts = WorkText.objects.filter(scholarly_work=work)
+    if connections[texts.db].vendor != 'postgresql':
+        return
+    config = settings.FULLTEXT_SEARCH_CONFIG
+    texts.update(search_vector=(
+        SearchVector(Value(work.title), weight='A', config=config)
+        + SearchVector(Value(work.authors), Value(work.keywords), weight='B', config=config)
+        + SearchVector('body', weight='D', config=config)
+    ))
+
+
+def index_new_works(work_ids):
+    """Metadata-only WorkText rows for bulk-created works (bulk_create skips the upload path)"""
+    WorkText.objects.bulk_create([WorkText(scholarly_work_id=work_id) for work_id in work_ids], ignore_conflicts=True)
+    connection = connections[WorkText.objects.db]
+    if connection.vendor != 'postgresql' or not work_ids:
+        return
+    config = settings.FULLTEXT_SEARCH_CONFIG
+    with connection.cursor() as cursor:
+        # Same weights as index_text, for every row in one statement
+        cursor.execute(
+            "UPDATE repository_worktext t SET search_vector = "
+            "setweight(to_tsvector(%s::regconfig, w.title), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, w.authors || ' ' || w.keywords), 'B') || "
+            "setweight(to_tsvector(%s::regconfig, t.body), 'D') "
+            "FROM repository_scholarlywork w WHERE w.id = t.scholarly_work_id AND w.id = ANY(%s)",
+            [config, config, config, list(work_ids)],
+        )
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """
+    `?q=` search over title, authors and keywords plus the extracted document body.
+
+    On PostgreSQL only the GIN-indexed tsvector is matched (it holds the metadata
+    too, see index_text; every work gets its row on upload), so the index drives
+    the query, and each hit is annotated with a highlighted `snippet`. Other
+    databases fall back to a substring match without snippets.
+    """
+    search_param = 'q'
+
+    def get_search_terms(self, request):
+        return request.query_params.get(self.search_param, '').strip()
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        if connections[queryset.db].vendor != 'postgresql':
+            matches = (
+                Q(title__icontains=terms) | Q(authors__icontains=terms) | Q(keywords__icontains=terms)
+                | Q(fulltext__body__icontains=terms)
+            )
+            return queryset.filter(matches).annotate(snippet=Value(None, output_field=TextField()))
+
+        config = settings.FULLTEXT_SEARCH_CONFIG
+        query = SearchQuery(terms, config=config, search_type='websearch')
+        return queryset.filter(fulltext__search_vector=query).annotate(
+            snippet=SearchHeadline(
+                'fulltext__body',
+                query,
+                config=config,
+                start_sel='<mark>',
+                stop_sel='</mark>',
+                max_words=35,
+                min_words=15,
+                max_fragments=2,
+                fragment_delimiter=' … ',
+            )
+        )
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.search_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Full-text search in metadata and document body; matches include a highlighted snippet',
+                'schema': {'type': 'string'},
+            },
+        ]
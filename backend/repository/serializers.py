@@ -1,14 +1,75 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import ScholarlyWork, Reaction
-from .tasks import convert_docx_to_pdf
+from django.db.models import BooleanField, Count, Exists, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from backend.fieldsets import DynamicFieldsMixin
+from .models import ScholarlyWork, Reaction, WorkSignature, WorkText
+from .search import index_text
 
 User = get_user_model()
 
 
-class UploaderSerializer(serializers.ModelSerializer):
+def reaction_count_annotation(request):
+    # Correlated subquery: evaluated for the page only, where a JOIN + GROUP BY would aggregate every match
+    counts = (
+        Reaction.objects.filter(scholarly_work=OuterRef('pk'))
+        .order_by().values('scholarly_work').annotate(n=Count('*')).values('n')
+    )
+    return {'num_reactions': Coalesce(Subquery(counts), 0)}
+
+
+def has_reacted_annotation(request):
+    if request is None or not request.user.is_authenticated:
+        return {'has_reacted': Value(False, output_field=BooleanField())}
+    return {'has_reacted': Exists(Reaction.objects.filter(scholarly_work=OuterRef('pk'), user=request.user))}
+
+
+WORK_FIELD_SOURCES = {
+    'author_list': ['authors'],
+    'download_url': [],
+    'thumbnail_url': ['thumbnails_generated_at'],
+    'reaction_count': [],
+    'user_has_reacted': [],
+    'snippet': [],
+}
+
+WORK_FIELD_ANNOTATIONS = {
+    'reaction_count': reaction_count_annotation,
+    'user_has_reacted': has_reacted_annotation,
+}
+
+
+def build_thumbnail_url(work, request):
+    """Versioned preview URL, so the endpoint can be cached as immutable"""
+    if not request or not work.thumbnails_generated_at:
+        return None
+    version = int(work.thumbnails_generated_at.timestamp())
+    return request.build_absolute_uri(f'/api/repository/{work.id}/thumbnail/?v={version}')
+
+
+class ReactionFieldsMixin:
+    """reaction_count / user_has_reacted, from the sparse queryset's annotations when present"""
+
+    def get_reaction_count(self, obj):
+        # Annotated by sparse_queryset when requested (the async views can't query lazily)
+        if hasattr(obj, 'num_reactions'):
+            return obj.num_reactions
+        return obj.reactions.count()
+
+    def get_user_has_reacted(self, obj):
+        if hasattr(obj, 'has_reacted'):
+            return obj.has_reacted
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            return obj.reactions.filter(user=request.user).exists()
+        return False
+
+
+class UploaderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Nested serializer for uploader info"""
     full_name = serializers.SerializerMethodField()
+    field_sources = {'full_name': ['first_name', 'last_name']}
     
     class Meta:
         model = User
@@ -18,11 +79,17 @@ class UploaderSerializer(serializers.ModelSerializer):
         return obj.get_full_name()
 
 
-class ScholarlyWorkListSerializer(serializers.ModelSerializer):
+class ScholarlyWorkListSerializer(ReactionFieldsMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     """For list view — lightweight"""
     uploader = UploaderSerializer(read_only=True)
     reaction_count = serializers.SerializerMethodField()
     user_has_reacted = serializers.SerializerMethodField()
+    snippet = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+
+    expandable_fields = default_expand = ('uploader',)
+    field_sources = WORK_FIELD_SOURCES
+    field_annotations = WORK_FIELD_ANNOTATIONS
     
     class Meta:
         model = ScholarlyWork
@@ -30,26 +97,53 @@ class ScholarlyWorkListSerializer(serializers.ModelSerializer):
             'id', 'title', 'authors', 'publication_year',
             'file_type', 'file_size', 'uploaded_at',
             'uploader', 'reaction_count', 'user_has_reacted',
-            'conversion_status'
+            'conversion_status', 'snippet', 'thumbnail_url'
         ]
     
-    def get_reaction_count(self, obj):
-        return obj.reactions.count()
-    
-    def get_user_has_reacted(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.reactions.filter(user=request.user).exists()
-        return False
+    def get_snippet(self, obj):
+        # Highlighted document excerpt, annotated by FullTextSearchFilter for `?q=` searches
+        return getattr(obj, 'snippet', None)
 
+    def get_thumbnail_url(self, obj):
+        return build_thumbnail_url(obj, self.context.get('request'))
 
-class ScholarlyWorkDetailSerializer(serializers.ModelSerializer):
+
+class TrendingWorkSerializer(ScholarlyWorkListSerializer):
+    """List item plus its current (decayed) trending score"""
+    trending_score = serializers.SerializerMethodField()
+    field_sources = {**WORK_FIELD_SOURCES, 'trending_score': ['trending__score']}
+
+    class Meta(ScholarlyWorkListSerializer.Meta):
+        fields = ScholarlyWorkListSerializer.Meta.fields + ['trending_score']
+
+    def get_trending_score(self, obj):
+        return round(obj.trending.score * self.context.get('decay_factor', 1), 4)
+
+
+class RelatedWorkSerializer(ScholarlyWorkListSerializer):
+    """List item plus its similarity to the work it was recommended for"""
+    similarity = serializers.SerializerMethodField()
+    field_sources = {**WORK_FIELD_SOURCES, 'similarity': []}
+
+    class Meta(ScholarlyWorkListSerializer.Meta):
+        fields = ScholarlyWorkListSerializer.Meta.fields + ['similarity']
+
+    def get_similarity(self, obj):
+        return self.context.get('similarities', {}).get(obj.id)
+
+
+class ScholarlyWorkDetailSerializer(ReactionFieldsMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     """For detail view — full info"""
     uploader = UploaderSerializer(read_only=True)
     reaction_count = serializers.SerializerMethodField()
     user_has_reacted = serializers.SerializerMethodField()
     author_list = serializers.SerializerMethodField()
     download_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+
+    expandable_fields = default_expand = ('uploader',)
+    field_sources = WORK_FIELD_SOURCES
+    field_annotations = WORK_FIELD_ANNOTATIONS
     
     class Meta:
         model = ScholarlyWork
@@ -58,18 +152,9 @@ class ScholarlyWorkDetailSerializer(serializers.ModelSerializer):
             'description', 'keywords', 'file_type', 'file_size',
             'original_filename', 'uploader', 'uploaded_at', 'updated_at',
             'reaction_count', 'user_has_reacted', 'download_url',
-            'conversion_status', 'conversion_progress'
+            'thumbnail_url', 'conversion_status', 'conversion_progress'
         ]
     
-    def get_reaction_count(self, obj):
-        return obj.reactions.count()
-    
-    def get_user_has_reacted(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.reactions.filter(user=request.user).exists()
-        return False
-    
     def get_author_list(self, obj):
         return obj.get_author_list()
     
@@ -79,6 +164,22 @@ class ScholarlyWorkDetailSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(f'/api/repository/{obj.id}/download/')
         return None
 
+    def get_thumbnail_url(self, obj):
+        return build_thumbnail_url(obj, self.context.get('request'))
+
+
+class ReactionStateSerializer(ReactionFieldsMixin, DynamicFieldsMixin, serializers.ModelSerializer):
+    """Reaction count and the user's flag for one work, as the react endpoint reports them"""
+    reaction_count = serializers.SerializerMethodField()
+    user_has_reacted = serializers.SerializerMethodField()
+
+    field_sources = WORK_FIELD_SOURCES
+    field_annotations = WORK_FIELD_ANNOTATIONS
+
+    class Meta:
+        model = ScholarlyWork
+        fields = ['id', 'reaction_count', 'user_has_reacted']
+
 
 class ScholarlyWorkUploadSerializer(serializers.ModelSerializer):
     """For file upload (RM22)"""
@@ -116,6 +217,13 @@ class ScholarlyWorkUploadSerializer(serializers.ModelSerializer):
         
         # Set conversion status
         conversion_status = 'completed' if file_extension == 'pdf' else 'pending'
+
+        # Likely re-uploads of existing works, by metadata (see duplicates.py)
+        from . import duplicates
+        metadata = duplicates.signature(duplicates.metadata_shingles(
+            validated_data['title'], validated_data['authors'], validated_data.get('description', '')
+        ))
+        found = duplicates.ranked(duplicates.matches('metadata', metadata))
         
         scholarly_work = ScholarlyWork.objects.create(
             title=validated_data['title'],
@@ -130,11 +238,25 @@ class ScholarlyWorkUploadSerializer(serializers.ModelSerializer):
             conversion_status=conversion_status,
             uploader=self.context['request'].user
         )
+        WorkSignature.objects.create(
+            scholarly_work=scholarly_work, metadata=None if metadata is None else metadata.tobytes()
+        )
+        duplicates.store(scholarly_work.id, 'metadata', metadata)
+        # Searchable by its metadata until the body is extracted (or if extraction fails)
+        WorkText.objects.create(scholarly_work=scholarly_work)
+        index_text(scholarly_work)
+        scholarly_work.possible_duplicates = duplicates.describe(found)
         
-        # Trigger DOCX to PDF conversion task if needed
+        # Trigger DOCX to PDF conversion task if needed; text extraction etc. follow it
         if file_extension == 'docx':
             from .tasks import convert_docx_to_pdf
             convert_docx_to_pdf.delay(scholarly_work.id)
+        else:
+            from .tasks import enqueue_post_processing
+            enqueue_post_processing(scholarly_work.id)
+
+        from .tasks import update_related_works
+        update_related_works.delay([scholarly_work.id])
         
         return scholarly_work
 
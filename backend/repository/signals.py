@@ -0,0 +1,85 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import facets
+from .models import ScholarlyWork
+
+User = get_user_model()
+
+# Saves that touch none of these can't move a work or a scholar between facet cells
+WORK_FIELDS = {'publication_year', 'file_type', 'uploader', 'deleted_at'}
+USER_FIELDS = {'country', 'is_active', 'is_staff'}
+
+
+def tracked(update_fields, fields):
+    return update_fields is None or not fields.isdisjoint(update_fields)
+
+
+def work_key(work):
+    if work.deleted_at is not None:
+        return None
+    return work.publication_year, work.file_type, work.uploader.country
+
+
+@receiver(pre_save, sender=ScholarlyWork)
+def remember_work_key(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._facet_key, instance._facet_tracked = None, False
+    if raw or instance._state.adding or not tracked(update_fields, WORK_FIELDS):
+        return
+    row = (
+        ScholarlyWork.all_objects.filter(pk=instance.pk)
+        .values_list('publication_year', 'file_type', 'uploader__country', 'deleted_at')
+        .first()
+    )
+    if row is not None and row[3] is None:
+        instance._facet_key = row[:3]
+    instance._facet_tracked = True
+
+
+@receiver(post_save, sender=ScholarlyWork)
+def update_work_facets(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        facets.move_work(None, work_key(instance))
+    elif getattr(instance, '_facet_tracked', False):
+        facets.move_work(instance._facet_key, work_key(instance))
+
+
+@receiver(post_delete, sender=ScholarlyWork)
+def remove_work_facets(sender, instance, **kwargs):
+    # Purged works left the rollups when they were soft-deleted
+    if instance.deleted_at is None:
+        facets.move_work(work_key(instance), None)
+
+
+def scholar_state(user):
+    return user.country, facets.is_listed(user)
+
+
+@receiver(pre_save, sender=User)
+def remember_scholar_state(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._facet_state = None
+    if raw or instance._state.adding or not tracked(update_fields, USER_FIELDS):
+        return
+    row = User.objects.filter(pk=instance.pk).values_list('country', 'is_active', 'is_staff').first()
+    if row is not None:
+        instance._facet_state = row[0], row[1] and not row[2]
+
+
+@receiver(post_save, sender=User)
+def update_scholar_facets(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        facets.move_scholar(instance.pk, None, scholar_state(instance))
+    elif getattr(instance, '_facet_state', None) is not None:
+        facets.move_scholar(instance.pk, instance._facet_state, scholar_state(instance))
+    instance._facet_state = None
+
+
+@receiver(post_delete, sender=User)
+def remove_scholar_facets(sender, instance, **kwargs):
+    # Their works are deleted first, each through remove_work_facets
+    facets.move_scholar(instance.pk, scholar_state(instance), None)
@@ -1,10 +1,33 @@
 from celery import shared_task
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
 import subprocess
 import os
 import time
 
-from .models import ScholarlyWork
+from backend import metrics
+
+from . import facets
+from .cleanup import collect_orphans, purge_deleted
+from .extraction import extract_text
+from .models import ScholarlyWork, WorkText, WorkThumbnail
+from .reactions import apply_reaction_changes, get_reaction_buffer
+from .related import refresh_related, update_related
+from .search import index_text
+from .thumbnails import encode_thumbnails, get_renderer
+from .trending import refresh_trending
+
+
+def enqueue_post_processing(work_id):
+    """Background stages that run once a work has a readable document (after upload or conversion)"""
+    extract_fulltext.delay(work_id)
+    generate_thumbnails.delay(work_id)
+
+
+# Conversion never saves other columns: a full save would undo a delete made while it ran
+CONVERSION_FIELDS = ['converted_pdf', 'conversion_status', 'conversion_progress', 'updated_at']
 
 
 @shared_task(bind=True)
@@ -13,23 +36,28 @@ def convert_docx_to_pdf(self, work_id):
     Convert DOCX file to PDF using LibreOffice
     Updates conversion status and progress
     """
+    pdf_path = None
+    outcome = 'failed'
     try:
         work = ScholarlyWork.objects.get(id=work_id)
         
         # Update status to processing
         work.conversion_status = 'processing'
         work.conversion_progress = 0
-        work.save()
+        work.save(update_fields=CONVERSION_FIELDS)
         
         # Get file paths
         docx_path = work.file.path
         output_dir = os.path.dirname(docx_path)
+        pdf_filename = os.path.splitext(os.path.basename(docx_path))[0] + '.pdf'
+        pdf_path = os.path.join(output_dir, pdf_filename)
         
         # Progress: 25% - Starting conversion
         work.conversion_progress = 25
-        work.save()
+        work.save(update_fields=CONVERSION_FIELDS)
         
         # Run LibreOffice conversion
+        started = time.monotonic()
         result = subprocess.run([
             'libreoffice',
             '--headless',
@@ -37,18 +65,17 @@ def convert_docx_to_pdf(self, work_id):
             '--outdir', output_dir,
             docx_path
         ], capture_output=True, text=True, timeout=300)
+        with metrics.best_effort():
+            metrics.observe('conversion_libreoffice_seconds', time.monotonic() - started)
         
         # Progress: 75% - Conversion complete
         work.conversion_progress = 75
-        work.save()
+        work.save(update_fields=CONVERSION_FIELDS)
         
         if result.returncode != 0:
             raise Exception(f"LibreOffice conversion failed: {result.stderr}")
         
         # Find generated PDF
-        pdf_filename = os.path.splitext(os.path.basename(docx_path))[0] + '.pdf'
-        pdf_path = os.path.join(output_dir, pdf_filename)
-        
         if not os.path.exists(pdf_path):
             raise Exception(f"PDF file not found at {pdf_path}")
         
@@ -60,25 +87,206 @@ def convert_docx_to_pdf(self, work_id):
                 save=False
             )
         
-        # Clean up temporary PDF (it's now in media/converted_pdfs/)
-        os.remove(pdf_path)
-        
         # Progress: 100% - Complete
         work.conversion_status = 'completed'
         work.conversion_progress = 100
-        work.save()
+        work.save(update_fields=CONVERSION_FIELDS)
+        outcome = 'completed'
+        if work.file_size:
+            with metrics.best_effort():
+                metrics.observe('conversion_output_ratio', work.converted_pdf.size / work.file_size)
+
+        enqueue_post_processing(work_id)
         
         return f"Successfully converted work {work_id}"
         
     except ScholarlyWork.DoesNotExist:
+        outcome = 'missing'
         return f"ScholarlyWork {work_id} not found"
         
     except subprocess.TimeoutExpired:
+        outcome = 'timeout'
         work.conversion_status = 'failed'
-        work.save()
+        work.save(update_fields=CONVERSION_FIELDS)
         return f"Conversion timeout for work {work_id}"
         
     except Exception as e:
         work.conversion_status = 'failed'
-        work.save()
-        return f"Conversion failed for work {work_id}: {str(e)}"
\ No newline at end of file
+        work.save(update_fields=CONVERSION_FIELDS)
+        return f"Conversion failed for work {work_id}: {str(e)}"
+
+    finally:
+        # LibreOffice's output is only a staging copy next to the original; never leave it behind
+        if pdf_path and os.path.exists(pdf_path):
+            os.remove(pdf_path)
+        with metrics.best_effort():
+            metrics.increment('conversions_total', {'outcome': outcome})
+
+
+@shared_task
+def requeue_conversions(work_ids):
+    """Convert the given DOCX works again (admin bulk action)"""
+    works = ScholarlyWork.objects.filter(id__in=work_ids, file_type='docx')
+    ids = list(works.values_list('id', flat=True))
+    works.update(conversion_status='pending', conversion_progress=0, updated_at=timezone.now())
+    for work_id in ids:
+        convert_docx_to_pdf.delay(work_id)
+    return f"Queued conversion of {len(ids)} works"
+
+
+@shared_task
+def reprocess_works(work_ids):
+    """Extract text and render thumbnails again for the given works (admin bulk action)"""
+    ids = list(ScholarlyWork.objects.filter(id__in=work_ids).values_list('id', flat=True))
+    for work_id in ids:
+        enqueue_post_processing(work_id)
+    return f"Queued post-processing of {len(ids)} works"
+
+
+@shared_task
+def extract_fulltext(work_id):
+    """
+    Extract the document body into WorkText and refresh its search vector and
+    duplicate-detection signature. DOCX text is read from the original file, PDFs are streamed through pdftotext.
+    """
+    try:
+        work = ScholarlyWork.objects.get(id=work_id)
+        text, truncated = extract_text(work.file.path, work.file_type, settings.FULLTEXT_MAX_CHARS)
+
+        WorkText.objects.update_or_create(
+            scholarly_work=work,
+            defaults={
+                'body': text,
+                'char_count': len(text),
+                'truncated': truncated,
+            }
+        )
+
+        index_text(work)
+
+        from . import duplicates
+        duplicates.index_work(work.id, work.title, work.authors, work.description, body=text)
+
+        return f"Extracted {len(text)} characters from work {work_id}"
+
+    except ScholarlyWork.DoesNotExist:
+        return f"ScholarlyWork {work_id} not found"
+
+    except Exception as e:
+        return f"Text extraction failed for work {work_id}: {str(e)}"
+
+
+@shared_task
+def generate_thumbnails(work_id):
+    """
+    Render the first page once and store it in every THUMBNAIL_SIZES size as WebP and JPEG.
+    Existing thumbnails are replaced in place.
+    """
+    try:
+        work = ScholarlyWork.objects.get(id=work_id)
+        page = get_renderer().render(work.preview_source.path)
+
+        existing = {(t.size, t.format): t for t in work.thumbnails.all()}
+        for size, image_format, width, height, content in encode_thumbnails(page):
+            thumbnail = existing.get((size, image_format))
+            if thumbnail is None:
+                thumbnail = WorkThumbnail(scholarly_work=work, size=size, format=image_format)
+            elif thumbnail.image:
+                thumbnail.image.delete(save=False)
+            thumbnail.width = width
+            thumbnail.height = height
+            thumbnail.image.save(f'{size}.{image_format}', ContentFile(content), save=False)
+            thumbnail.save()
+
+        # Also busts client caches: the timestamp is part of the thumbnail URL
+        ScholarlyWork.objects.filter(id=work_id).update(thumbnails_generated_at=timezone.now())
+
+        return f"Generated thumbnails for work {work_id}"
+
+    except ScholarlyWork.DoesNotExist:
+        return f"ScholarlyWork {work_id} not found"
+
+    except Exception as e:
+        return f"Thumbnail generation failed for work {work_id}: {str(e)}"
+
+
+@shared_task
+def flush_reaction_buffer(max_rounds=20):
+    """Write buffered reaction toggles to the Reaction table (scheduled by Celery beat)"""
+    buffer = get_reaction_buffer()
+    if not buffer.acquire_flush_lock():
+        return "Another flush is in progress"
+
+    created = deleted = works = 0
+    try:
+        for _ in range(max_rounds):
+            batch = buffer.drain(limit=settings.REACTION_FLUSH_BATCH_SIZE)
+            if not batch:
+                break
+            with transaction.atomic():
+                batch_created, batch_deleted = apply_reaction_changes(batch)
+            buffer.acknowledge(list(batch))
+            created += batch_created
+            deleted += batch_deleted
+            works += len(batch)
+    finally:
+        buffer.release_flush_lock()
+
+    return f"Flushed reactions for {works} works: {created} added, {deleted} removed"
+
+
+@shared_task
+def refresh_trending_scores():
+    """Fold new reactions and downloads into TrendingScore (scheduled by Celery beat)"""
+    reactions, downloads, works = refresh_trending()
+    return f"Trending refresh: {reactions} reactions, {downloads} downloads, {works} works updated"
+
+
+@shared_task
+def update_related_works(work_ids, cascade=True):
+    """Re-index works and recompute their related-works lists (after upload or delete)"""
+    try:
+        written = update_related(work_ids, cascade=cascade)
+        return f"Recomputed related works for {written} works"
+
+    except Exception as e:
+        return f"Related works update failed for {work_ids}: {str(e)}"
+
+
+@shared_task
+def refresh_related_works():
+    """Fold new reactions into related-works lists (scheduled by Celery beat)"""
+    reactions, works = refresh_related()
+    return f"Related works refresh: {reactions} reactions, {works} works recomputed"
+
+
+@shared_task
+def purge_deleted_works(max_rounds=20):
+    """Remove soft-deleted works, their reactions and files (queued on delete and scheduled by Celery beat)"""
+    purged = 0
+    listing = set()
+    for _ in range(max_rounds):
+        batch_purged, batch_listing = purge_deleted()
+        if not batch_purged:
+            break
+        purged += batch_purged
+        listing |= batch_listing
+
+    # Recompute the lists that recommended them
+    if listing:
+        update_related_works.delay(sorted(listing), cascade=False)
+    return f"Purged {purged} deleted works"
+
+
+@shared_task
+def collect_orphaned_files():
+    """Delete media files no row references any more (scheduled by Celery beat)"""
+    checked, orphans, reclaimed = collect_orphans()
+    return f"Media GC: {checked} files checked, {orphans} orphans removed ({reclaimed} bytes)"
+
+
+@shared_task
+def rebuild_facet_rollups():
+    """Recompute facet cells and country totals, correcting any drift (scheduled by Celery beat)"""
+    cells, countries = facets.rebuild()
+    return f"Facet rollups rebuilt: {cells} cells, {countries} countries"
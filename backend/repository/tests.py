@@ -1,3 +1,1845 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import timedelta
+from importlib.util import find_spec
+from unittest import skipUnless
+from unittest.mock import patch
+from xml.sax.saxutils import escape
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, connections
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User
+from backend import metrics, profiling, throttling
+from backend.fieldsets import sparse_queryset
+from backend.routers import PrimaryReplicaRouter, ReadYourWritesMiddleware, replica_reads
+from . import (
+    async_views, duplicates, extraction, facets, fastpath, reactions, related, search, tasks, thumbnails, trending,
+)
+from .cleanup import collect_orphans, soft_delete, walk
+from .management.commands import migrate_media_layout
+from .models import (
+    CountryRollup, FacetCell, Reaction, RelatedWorks, RelatedWorksState, ScholarlyWork, SignatureBand, TrendingScore,
+    TrendingState, WorkText, WorkThumbnail,
+)
+from .serializers import ScholarlyWorkListSerializer
+
+# Tables that grow with usage; a full scan of these on a request path is a regression
+LARGE_TABLES = {'repository_scholarlywork', 'repository_reaction'}
+
+# Names written by models.sharded_path
+SHARDED_NAME = re.compile(r'^(works|converted|thumbnails)/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}\.\w+$')
+
+
+@skipUnless('replica' in settings.DATABASES, "needs DB_ENGINE=sqlite (or a configured 'replica' alias)")
+@override_settings(DATABASE_REPLICAS=['replica'], REACTION_WRITE_BEHIND=False)
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Runs with DB_ENGINE=sqlite, where 'replica' is a second SQLite connection mirroring
+    default. Not a TestCase: data must be committed for the replica connection to see it.
+    """
+    databases = {'default', 'replica'} if 'replica' in settings.DATABASES else {'default'}
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'Password123!')
+        self.work = ScholarlyWork.objects.create(
+            title='Replica routing', authors='A. Author', publication_year=2024,
+            file='scholarly_works/test.pdf', original_filename='test.pdf',
+            file_size=1, file_type='pdf', uploader=self.user
+        )
+        self.client = APIClient()
+
+    def replica_queries(self, method, url):
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = getattr(self.client, method)(url)
+        return response, len(queries)
+
+    def test_public_reads_use_replica(self):
+        for url in ['/api/repository/', f'/api/repository/{self.work.pk}/',
+                    '/api/auth/scholars/', f'/api/auth/scholars/{self.user.pk}/']:
+            response, replica_queries = self.replica_queries('get', url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertGreater(replica_queries, 0, url)
+
+    def test_other_views_use_primary(self):
+        response, replica_queries = self.replica_queries('get', '/api/repository/trending/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica_queries, 0)
+        self.assertFalse(replica_reads.get())
+
+    def test_user_is_pinned_to_primary_after_write(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        _, replica_queries = self.replica_queries('get', '/api/repository/')
+        self.assertGreater(replica_queries, 0)
+
+        response, _ = self.replica_queries('post', f'/api/repository/{self.work.pk}/react/')
+        self.assertEqual(response.status_code, 200)
+
+        response, replica_queries = self.replica_queries('get', '/api/repository/')
+        self.assertEqual(replica_queries, 0)
+        self.assertEqual(response.json()['results'][0]['reaction_count'], 1)
+
+    def test_cache_outage_routes_to_primary(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        with patch('backend.routers.cache', BrokenCache()):
+            # The reaction is saved and reported as such, unpinned
+            with self.assertLogs('backend.routers', 'ERROR'):
+                response, _ = self.replica_queries('post', f'/api/repository/{self.work.pk}/react/')
+            self.assertEqual(response.status_code, 200)
+            with self.assertLogs('backend.routers', 'WARNING'):
+                response, replica_queries = self.replica_queries('get', '/api/repository/')
+            self.assertEqual(replica_queries, 0)
+            self.assertEqual(response.json()['results'][0]['reaction_count'], 1)
+
+            async def get_response(request):
+                return HttpResponse(status=201)
+
+            request = AsyncRequestFactory().post('/')
+            request.user = self.user
+            with self.assertLogs('backend.routers', 'ERROR'):
+                response = async_to_sync(ReadYourWritesMiddleware(get_response))(request)
+            self.assertEqual(response.status_code, 201)
+
+    def test_writes_go_to_primary(self):
+        router = PrimaryReplicaRouter()
+        token = replica_reads.set(True)
+        try:
+            self.assertEqual(router.db_for_read(ScholarlyWork), 'replica')
+            self.assertEqual(router.db_for_write(ScholarlyWork), 'default')
+        finally:
+            replica_reads.reset(token)
+        self.assertEqual(router.db_for_read(ScholarlyWork), 'default')
+
+
+class BrokenCache:
+    def get(self, *args, **kwargs):
+        raise ConnectionError('cache unavailable')
+
+    set = get
+
+    async def aset(self, *args, **kwargs):
+        raise ConnectionError('cache unavailable')
+
+
+def query_plan(sql):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN {sql}')
+            return [row[0] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(plan):
+    """Large tables read without an index (PostgreSQL 'Seq Scan', SQLite 'SCAN <table>' with no index)"""
+    if connection.vendor == 'postgresql':
+        pattern = re.compile(r'Seq Scan on (\w+)')
+    else:
+        pattern = re.compile(r'^SCAN (\w+)(?!.*USING)')
+    return {match.group(1) for line in plan for match in [pattern.search(line)] if match} & LARGE_TABLES
+
+
+# Plans are checked on default; replica routing has its own tests above
+@override_settings(REACTION_WRITE_BEHIND=False, DATABASE_REPLICAS=[])
+class QueryPlanTests(TestCase):
+    """
+    EXPLAINs every query the list/detail/reaction endpoints run and fails on full scans
+    of large tables. On PostgreSQL sequential scans are disabled for the session, so
+    the planner only picks one when no index can serve the query at all; tiny test
+    tables can't hide a missing index that way.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner', 'planner@example.com', 'Password123!')
+        cls.works = ScholarlyWork.objects.bulk_create([
+            ScholarlyWork(
+                title=f'Work {i}', authors='A. Author', publication_year=2000 + i % 20,
+                file=f'scholarly_works/{i}.pdf', original_filename=f'{i}.pdf', file_size=1,
+                file_type='pdf' if i % 3 else 'docx', uploader=cls.user,
+                conversion_status='completed' if i % 3 else 'pending'
+            )
+            for i in range(200)
+        ])
+        Reaction.objects.bulk_create([Reaction(user=cls.user, scholarly_work=work) for work in cls.works[:50]])
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def tearDown(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('RESET enable_seqscan')
+
+    def assertNoFullScans(self, method, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400, url)
+
+        for query in queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            plan = query_plan(sql)
+            self.assertFalse(full_scans(plan), f"{url}\n{sql}\n" + '\n'.join(plan))
+
+    def test_work_list(self):
+        work = self.works[0]
+        for query in ['', '?publication_year=2005', '?file_type=pdf', f'?uploader={self.user.pk}',
+                      '?publication_year=2005&file_type=docx', '?ordering=title', '?ordering=-publication_year']:
+            self.assertNoFullScans('get', f'/api/repository/{query}')
+        self.assertNoFullScans('get', f'/api/repository/{work.pk}/')
+
+    def test_work_endpoints(self):
+        work = self.works[1]
+        self.assertNoFullScans('get', f'/api/repository/{work.pk}/conversion-status/')
+        self.assertNoFullScans('get', f'/api/repository/{work.pk}/related/')
+        self.assertNoFullScans('get', '/api/repository/trending/')
+        self.assertNoFullScans('post', f'/api/repository/{work.pk}/react/')
+        self.assertNoFullScans('post', f'/api/repository/{work.pk}/react/')
+        ids = ','.join(str(work.pk) for work in self.works[:20])
+        self.assertNoFullScans('get', f'/api/repository/batch/?ids={ids}')
+        self.assertNoFullScans('get', f'/api/repository/reactions/?ids={ids}')
+        self.assertNoFullScans('get', '/api/repository/export/?from=2024-01-01&until=2030-01-01')
+
+    def test_batch_endpoints_run_fixed_queries(self):
+        self.client.get('/api/repository/batch/?ids=1')  # warm up the user lookup
+        for url in ['/api/repository/batch/', '/api/repository/reactions/']:
+            counts = []
+            for works in [self.works[:2], self.works[:50]]:
+                ids = [work.pk for work in reversed(works)] + [0]
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, {'ids': ','.join(map(str, ids))})
+                self.assertEqual([item['id'] for item in response.json()], ids[:-1], url)
+                counts.append(len(queries))
+            self.assertEqual(counts[0], counts[1], url)
+
+        detail = self.client.get(f'/api/repository/{self.works[0].pk}/').json()
+        self.assertEqual(self.client.get('/api/repository/batch/', {'ids': self.works[0].pk}).json(), [detail])
+        state = self.client.get('/api/repository/reactions/', {'ids': self.works[0].pk}).json()
+        self.assertEqual(state, [{'id': self.works[0].pk, 'reaction_count': 1, 'user_has_reacted': True}])
+
+    def test_pending_conversions_use_partial_index(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('SQLite only matches partial indexes against literal values, not bound parameters')
+        pending = ScholarlyWork.objects.filter(conversion_status__in=['pending', 'processing'])
+        plan = pending.order_by('uploaded_at').explain()
+        self.assertIn('work_conversion_pending_idx', plan)
+
+
+# Admin pages link static files; the manifest only exists after collectstatic
+@override_settings(
+    DATABASE_REPLICAS=[], ADMIN_EXACT_COUNT_LIMIT=0,
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'
+)
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser('admin@example.com', 'admin', 'Password123!')
+        work = ScholarlyWork.objects.create(
+            title='Admin', authors='A. Author', publication_year=2024,
+            file='scholarly_works/test.pdf', original_filename='test.pdf',
+            file_size=1, file_type='pdf', uploader=admin
+        )
+        Reaction.objects.create(user=admin, scholarly_work=work)
+        self.client.force_login(admin)
+
+    def test_changelists_skip_exact_counts(self):
+        for url in ['/admin/repository/scholarlywork/', '/admin/repository/reaction/']:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            counts = [query['sql'] for query in queries if 'COUNT(' in query['sql']]
+            if connection.vendor == 'postgresql':
+                self.assertEqual(counts, [], url)
+            else:
+                self.assertEqual(len(counts), 1, url)  # no planner estimate; the full-result count is still gone
+
+    def test_bulk_delete_is_soft(self):
+        response = self.client.get('/admin/repository/scholarlywork/')
+        actions = dict(response.context['action_form'].fields['action'].choices)
+        self.assertNotIn('delete_selected', actions)
+        self.assertIn('soft_delete', actions)
+
+
+@override_settings(
+    PROFILING_ENABLED=True, PROFILING_BACKEND='local', PROFILING_SAMPLE_RATE=1.0, DATABASE_REPLICAS=[]
+)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        profiling._store = profiling.LocalProfileStore()
+        self.user = User.objects.create_user('profiler', 'profiler@example.com', 'Password123!')
+        ScholarlyWork.objects.create(
+            title='Profiled', authors='A. Author', publication_year=2024,
+            file='scholarly_works/test.pdf', original_filename='test.pdf',
+            file_size=1, file_type='pdf', uploader=self.user
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/repository/')
+        timing = dict(entry.split(';', 1) for entry in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timing), {'total', 'db', 'serialize'})
+
+        with self.settings(PROFILING_SAMPLE_RATE=0):
+            self.assertNotIn('Server-Timing', self.client.get('/api/repository/'))
+
+    def test_stats_are_staff_only(self):
+        for _ in range(3):
+            self.client.get('/api/repository/')
+        self.assertEqual(self.client.get('/api/profiling/').status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        endpoints = {entry['endpoint']: entry for entry in self.client.get('/api/profiling/').json()['endpoints']}
+        works = endpoints['GET api/repository/']
+        self.assertEqual(works['requests'], 3)
+        self.assertEqual(set(works['total']), {'mean', 'p50', 'p95', 'p99'})
+        self.assertLessEqual(works['total']['p50'], works['total']['p99'])
+
+    def test_store_outage_does_not_fail_the_request(self):
+        profiling._store = BrokenProfileStore()
+        self.addCleanup(setattr, profiling, '_store', None)
+        with self.assertLogs('backend.profiling', 'WARNING'):
+            response = self.client.get('/api/repository/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Server-Timing', response)
+
+        async def get_response(request):
+            return HttpResponse('ok')
+
+        middleware = profiling.ProfilingMiddleware(get_response)
+        with self.assertLogs('backend.profiling', 'WARNING'):
+            response = async_to_sync(middleware)(AsyncRequestFactory().get('/'))
+        self.assertEqual(response.content, b'ok')
+        self.assertIn('Server-Timing', response)
+
+
+class BrokenProfileStore:
+    def record(self, endpoint, metrics, minute):
+        raise ConnectionError('profiling store unavailable')
+
+
+@override_settings(METRICS_BACKEND='local', METRICS_TOKEN='scrape-token', DATABASE_REPLICAS=[])
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics._store = metrics.LocalMetricsStore()
+
+    def test_prometheus_endpoint(self):
+        for value in [0.2, 0.3, 4, 40]:
+            metrics.observe('celery_task_runtime_seconds', value, {'task': 'repository.tasks.convert_docx_to_pdf'})
+        metrics.increment('conversions_total', {'outcome': 'completed'}, 3)
+
+        self.assertEqual(self.client.get('/metrics/').status_code, 401)
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scrape-token')
+        lines = response.content.decode().splitlines()
+        self.assertIn('conversions_total{outcome="completed"} 3', lines)
+        self.assertIn('conversions_in_progress{status="pending"} 0', lines)
+        task = 'task="repository.tasks.convert_docx_to_pdf"'
+        self.assertIn(f'celery_task_runtime_seconds_bucket{{{task},le="0.25"}} 1', lines)
+        self.assertIn(f'celery_task_runtime_seconds_bucket{{{task},le="+Inf"}} 4', lines)
+        self.assertIn(f'celery_task_runtime_seconds_count{{{task}}} 4', lines)
+
+        histogram = metrics.collect()['celery_task_runtime_seconds'][task]
+        self.assertAlmostEqual(metrics.quantile('celery_task_runtime_seconds', histogram, 0.5), 0.5)
+
+
+class BrokenMetricsStore:
+    def add(self, name, increments):
+        raise ConnectionError('metrics store unavailable')
+
+
+def fake_libreoffice(args, **kwargs):
+    docx_path = args[-1]
+    with open(docx_path.rsplit('.', 1)[0] + '.pdf', 'wb') as pdf:
+        pdf.write(b'%PDF converted')
+    return subprocess.CompletedProcess(args, 0, '', '')
+
+
+@override_settings(DATABASE_REPLICAS=[], MEDIA_ROOT=tempfile.mkdtemp())
+class ConversionMetricsTests(TestCase):
+    def setUp(self):
+        metrics._store = BrokenMetricsStore()
+        user = User.objects.create_user('converter', 'converter@example.com', 'Password123!')
+        self.work = ScholarlyWork(
+            title='Draft', authors='A. Author', publication_year=2024, original_filename='draft.docx',
+            file_size=4, file_type='docx', conversion_status='pending', uploader=user
+        )
+        self.work.file.save('draft.docx', ContentFile(b'docx'), save=False)
+        self.work.save()
+
+    def tearDown(self):
+        metrics._store = None
+
+    @patch('repository.tasks.enqueue_post_processing')
+    def test_store_outage_does_not_change_the_result(self, post_processing):
+        with patch('repository.tasks.subprocess.run', fake_libreoffice), self.assertLogs('backend.metrics', 'WARNING'):
+            result = tasks.convert_docx_to_pdf(self.work.pk)
+        self.assertEqual(result, f'Successfully converted work {self.work.pk}')
+        self.work.refresh_from_db()
+        self.assertEqual(self.work.conversion_status, 'completed')
+        post_processing.assert_called_once_with(self.work.pk)
+
+        failed = subprocess.CompletedProcess([], 1, '', 'no filter')
+        with patch('repository.tasks.subprocess.run', return_value=failed), self.assertLogs('backend.metrics', 'WARNING'):
+            result = tasks.convert_docx_to_pdf(self.work.pk)
+        self.assertTrue(result.startswith('Conversion failed'))
+        self.work.refresh_from_db()
+        self.assertEqual(self.work.conversion_status, 'failed')
+
+
+@override_settings(REACTION_WRITE_BEHIND=True, REACTION_BUFFER_BACKEND='local', DATABASE_REPLICAS=[])
+class ReactionBufferTests(TestCase):
+    def setUp(self):
+        reactions._buffer = reactions.LocalReactionBuffer()
+        self.buffer = reactions.get_reaction_buffer()
+        self.ada = User.objects.create_user('ada', 'ada@example.com', 'Password123!')
+        self.bo = User.objects.create_user('bo', 'bo@example.com', 'Password123!')
+        self.work, self.other = [
+            ScholarlyWork.objects.create(
+                title=f'Reacted {i}', authors='A. Author', publication_year=2024, file='scholarly_works/test.pdf',
+                original_filename='test.pdf', file_size=1, file_type='pdf', uploader=self.ada
+            )
+            for i in range(2)
+        ]
+        Reaction.objects.create(user=self.bo, scholarly_work=self.work)
+
+    def tearDown(self):
+        reactions._buffer = None
+
+    def reactors(self, work):
+        return set(Reaction.objects.filter(scholarly_work=work).values_list('user_id', flat=True))
+
+    def test_toggle_and_double_toggle(self):
+        # Seeded from the database: bo's reaction counts
+        self.assertEqual(self.buffer.toggle(self.work.pk, self.ada.pk), (True, 2))
+        self.assertEqual(self.buffer.state([self.work.pk, self.other.pk], self.ada.pk), {self.work.pk: (True, 2)})
+        self.assertEqual(self.buffer.toggle(self.work.pk, self.ada.pk), (False, 1))
+        self.assertEqual(self.buffer.state([self.work.pk], self.bo.pk), {self.work.pk: (True, 1)})
+
+        client = APIClient()
+        client.force_authenticate(self.ada)
+        response = client.post(f'/api/repository/{self.work.pk}/react/')
+        self.assertEqual((response.data['user_has_reacted'], response.data['reaction_count']), (True, 2))
+        self.assertEqual(self.reactors(self.work), {self.bo.pk})  # not flushed yet
+
+    def test_flush_applies_and_acknowledges(self):
+        self.buffer.toggle(self.work.pk, self.ada.pk)
+        self.buffer.toggle(self.work.pk, self.bo.pk)
+        self.buffer.toggle(self.other.pk, self.bo.pk)
+        self.assertEqual(self.buffer.pending_count(), 2)
+
+        self.assertEqual(tasks.flush_reaction_buffer(), 'Flushed reactions for 2 works: 2 added, 1 removed')
+        self.assertEqual(self.reactors(self.work), {self.ada.pk})
+        self.assertEqual(self.reactors(self.other), {self.bo.pk})
+        self.assertEqual(self.buffer.pending_count(), 0)
+        self.assertEqual(self.buffer.drain(), {})
+        # Counts keep coming from the buffer, which agrees with the table
+        self.assertEqual(self.buffer.state([self.work.pk], self.ada.pk), {self.work.pk: (True, 1)})
+
+    def test_failed_flush_is_retried(self):
+        self.buffer.toggle(self.work.pk, self.ada.pk)
+        with patch('repository.tasks.apply_reaction_changes', side_effect=DatabaseError('connection lost')):
+            with self.assertRaises(DatabaseError):
+                tasks.flush_reaction_buffer()
+        self.assertEqual(self.reactors(self.work), {self.bo.pk})
+
+        # Kept for the next flush and merged with toggles made since; the lock was released
+        self.buffer.toggle(self.work.pk, self.bo.pk)
+        self.assertEqual(self.buffer.drain(), {self.work.pk: {self.ada.pk: True, self.bo.pk: False}})
+        self.assertEqual(tasks.flush_reaction_buffer(), 'Flushed reactions for 1 works: 1 added, 1 removed')
+        self.assertEqual(self.reactors(self.work), {self.ada.pk})
+
+    def test_deleted_works_and_users_are_dropped(self):
+        carl = User.objects.create_user('carl', 'carl@example.com', 'Password123!')
+        batch = {
+            self.work.pk: {self.ada.pk: True, carl.pk: True, self.bo.pk: False},
+            self.other.pk: {self.ada.pk: True},
+        }
+        soft_delete(ScholarlyWork.objects.filter(pk=self.other.pk))
+        carl.delete()
+        self.assertEqual(reactions.apply_reaction_changes(batch), (1, 1))
+        self.assertEqual(self.reactors(self.work), {self.ada.pk})
+        self.assertEqual(self.reactors(self.other), set())
+
+    def test_existing_reactions_are_not_counted(self):
+        # bo's reaction is already in the table, e.g. written by the synchronous path
+        batch = {self.work.pk: {self.ada.pk: True, self.bo.pk: True}}
+        self.assertEqual(reactions.apply_reaction_changes(batch), (1, 0))
+        self.assertEqual(self.reactors(self.work), {self.ada.pk, self.bo.pk})
+        self.assertEqual(reactions.apply_reaction_changes(batch), (0, 0))
+
+
+@skipUnless(find_spec('fakeredis') and find_spec('lupa'), 'needs fakeredis with Lua support')
+@override_settings(DATABASE_REPLICAS=[])
+class RedisReactionBufferTests(TestCase):
+    def setUp(self):
+        import fakeredis
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        self.buffer = reactions.RedisReactionBuffer(self.redis)
+        self.user = User.objects.create_user('ada', 'ada@example.com', 'Password123!')
+        self.work = ScholarlyWork.objects.create(
+            title='Reacted', authors='A. Author', publication_year=2024, file='scholarly_works/test.pdf',
+            original_filename='test.pdf', file_size=1, file_type='pdf', uploader=self.user
+        )
+
+    def test_set_only_expires_once_flushed(self):
+        seeded = f'reactions:seeded:{self.work.pk}'
+        self.assertEqual(self.buffer.toggle(self.work.pk, self.user.pk), (True, 1))
+        self.assertEqual(self.redis.ttl(seeded), -1)
+
+        batch = self.buffer.drain()
+        self.assertEqual(batch, {self.work.pk: {self.user.pk: True}})
+        self.assertEqual(self.redis.ttl(seeded), -1)  # flushing
+
+        # A toggle between drain and acknowledge keeps the set alive
+        self.buffer.toggle(self.work.pk, self.user.pk)
+        self.buffer.acknowledge(list(batch))
+        self.assertEqual(self.redis.ttl(seeded), -1)
+
+        batch = self.buffer.drain()
+        self.assertEqual(batch, {self.work.pk: {self.user.pk: False}})
+        self.buffer.acknowledge(list(batch))
+        self.assertGreater(self.redis.ttl(seeded), 0)
+        self.assertEqual(self.buffer.drain(), {})
+
+
+@override_settings(DATABASE_REPLICAS=[], RELATED_FEATURE_WEIGHTS={'author': 3.0, 'keyword': 2.0, 'reactor': 1.0})
+class RelatedWorksTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'Password123!')
+        self.works = [
+            self.work('Okafor, Mensah', 'crops, remote sensing'),
+            self.work('Okafor', 'crops'),
+            self.work('Zhang', 'crops, remote sensing'),
+            self.work('Kamau', 'malaria'),
+            self.work('Silva', 'coral reefs'),
+        ]
+        related.sync_features([work.pk for work in self.works])
+
+    def work(self, authors, keywords):
+        return ScholarlyWork.objects.create(
+            title='Related', authors=authors, keywords=keywords, publication_year=2024,
+            file='scholarly_works/test.pdf', original_filename='test.pdf', file_size=1, file_type='pdf',
+            uploader=self.user
+        )
+
+    def neighbours(self, work):
+        return [other for other, _ in RelatedWorks.objects.get(pk=work.pk).neighbours]
+
+    def refresh(self, seconds_later):
+        with patch.object(related.timezone, 'now', return_value=timezone.now() + timedelta(seconds=seconds_later)):
+            return related.refresh_related()
+
+    def test_scores_rank_shared_features(self):
+        first, coauthored, same_topic, unrelated, _ = self.works
+        candidates, scores = related.score_candidates(first.pk, ScholarlyWork.objects.count())
+        ranked = related.top_k(candidates, scores, 10)
+        self.assertEqual([work for work, _ in ranked], [coauthored.pk, same_topic.pk])
+        self.assertTrue(all(score > 0 for _, score in ranked))
+        self.assertEqual(related.score_candidates(unrelated.pk, 5)[0].tolist(), [])
+
+    def test_top_k_order_and_ties(self):
+        import numpy as np
+
+        ranked = related.top_k(np.array([9, 4, 7, 2]), np.array([1.0, 3.0, 3.0, 0.5]), 3)
+        self.assertEqual(ranked, [[4, 3.0], [7, 3.0], [9, 1.0]])
+
+    def test_deleted_works_do_not_count(self):
+        # Their features stay until purge; document frequencies must not exceed the live count
+        copies = [self.work('Kamau', 'crops') for _ in range(4)]
+        related.sync_features([work.pk for work in copies])
+        soft_delete(ScholarlyWork.objects.filter(pk__in=[work.pk for work in copies]))
+
+        candidates, scores = related.score_candidates(self.works[1].pk, ScholarlyWork.objects.count())
+        self.assertEqual(set(candidates.tolist()), {self.works[0].pk, self.works[2].pk})
+        self.assertTrue((scores > 0).all())
+
+    def test_incremental_updates(self):
+        related.rebuild_all()
+        self.assertEqual(self.neighbours(self.works[3]), [])
+
+        # Upload: the new work gets a list and enters its candidates' lists
+        new = self.work('Kamau', 'malaria, rainfall')
+        related.update_related([new.pk])
+        self.assertEqual(self.neighbours(new), [self.works[3].pk])
+        self.assertEqual(self.neighbours(self.works[3]), [new.pk])
+
+        # Reactions since the high-water mark become reactor features
+        Reaction.objects.create(user=self.user, scholarly_work=self.works[4])
+        Reaction.objects.create(user=self.user, scholarly_work=new)
+        self.assertEqual(self.refresh(seconds_later=120), (2, 2))
+        self.assertIn(new.pk, self.neighbours(self.works[4]))
+        self.assertEqual(RelatedWorksState.objects.get().last_reaction_id, Reaction.objects.latest('id').pk)
+        self.assertEqual(self.refresh(seconds_later=120), (0, 0))
+
+    @override_settings(RELATED_SETTLE_SECONDS=60)
+    def test_settle_window(self):
+        related.rebuild_all()
+        first = Reaction.objects.create(user=self.user, scholarly_work=self.works[3])
+        Reaction.objects.filter(pk=first.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        young = Reaction.objects.create(user=self.user, scholarly_work=self.works[4])
+
+        # Only the settled reaction is consumed; the young one keeps the mark below it
+        self.assertEqual(related.refresh_related(), (1, 1))
+        self.assertEqual(RelatedWorksState.objects.get().last_reaction_id, first.pk)
+        self.assertEqual(self.refresh(seconds_later=120), (1, 1))
+        self.assertEqual(RelatedWorksState.objects.get().last_reaction_id, young.pk)
+
+        # A rebuild leaves unsettled reactions above its mark too
+        Reaction.objects.filter(pk=young.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        later = Reaction.objects.create(user=User.objects.create_user('late', 'late@example.com', 'Password123!'),
+                                        scholarly_work=self.works[3])
+        related.rebuild_all()
+        self.assertEqual(RelatedWorksState.objects.get().last_reaction_id, young.pk)
+        self.assertEqual(self.refresh(seconds_later=120), (1, 1))
+        self.assertEqual(RelatedWorksState.objects.get().last_reaction_id, later.pk)
+
+    def test_rebuild_queries_do_not_grow_with_works(self):
+        related.rebuild_all()  # creates the state row
+        with CaptureQueriesContext(connection) as few:
+            related.rebuild_all()
+        for i in range(10):
+            self.work(f'Author {i % 3}', 'crops')
+        with CaptureQueriesContext(connection) as many:
+            related.rebuild_all()
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(RelatedWorks.objects.count(), 15)
+
+
+@override_settings(
+    DATABASE_REPLICAS=[], TRENDING_COUNTER_BACKEND='local', TRENDING_HALF_LIFE_HOURS=1, TRENDING_SETTLE_SECONDS=60,
+    TRENDING_REACTION_WEIGHT=1.0, TRENDING_DOWNLOAD_WEIGHT=0.5, TRENDING_MIN_SCORE=0.1,
+)
+class TrendingTests(TestCase):
+    def setUp(self):
+        trending._counter = trending.LocalDownloadCounter()
+        self.epoch = timezone.now().replace(microsecond=0) - timedelta(days=1)
+        self.now = self.epoch
+        TrendingState.objects.create(pk=1, epoch=self.epoch)
+        self.users = [User.objects.create_user(f'fan{i}', f'fan{i}@example.com', 'Password123!') for i in range(3)]
+        self.works = [
+            ScholarlyWork.objects.create(
+                title=f'Hot {i}', authors='A', publication_year=2024, file_size=4, file_type='pdf', uploader=self.users[0]
+            )
+            for i in range(3)
+        ]
+
+    def tearDown(self):
+        trending._counter = None
+
+    def react(self, work, user, hours):
+        """A reaction made `hours` after the epoch"""
+        reaction = Reaction.objects.create(scholarly_work=work, user=user)
+        Reaction.objects.filter(pk=reaction.pk).update(created_at=self.epoch + timedelta(hours=hours))
+        return reaction
+
+    def refresh(self, hours):
+        self.now = self.epoch + timedelta(hours=hours)
+        with patch.object(trending.timezone, 'now', return_value=self.now):
+            return trending.refresh_trending()
+
+    def scores(self):
+        return dict(TrendingScore.objects.values_list('scholarly_work_id', 'score'))
+
+    def test_forward_decay(self):
+        self.react(self.works[0], self.users[0], hours=0)
+        self.react(self.works[1], self.users[0], hours=2)
+        self.assertEqual(self.refresh(hours=3), (2, 0, 2))
+
+        # One half-life apart: the later reaction is worth twice as much, and the ranking follows
+        scores = self.scores()
+        self.assertAlmostEqual(scores[self.works[0].pk], 1.0)
+        self.assertAlmostEqual(scores[self.works[1].pk], 4.0)
+        state = TrendingState.objects.get()
+        self.assertAlmostEqual(trending.decay_factor(state, self.now) * scores[self.works[1].pk], 0.5)
+
+    def test_downloads_are_drained_once(self):
+        for _ in range(3):
+            trending.record_download(self.works[2].pk)
+        trending.record_download(987654)  # no such work
+        self.assertEqual(self.refresh(hours=1), (0, 4, 1))
+        self.assertAlmostEqual(self.scores()[self.works[2].pk], 3 * 0.5 * 2)
+        self.assertEqual(self.refresh(hours=1), (0, 0, 0))
+
+    def test_high_water_mark_and_settle_window(self):
+        first = self.react(self.works[0], self.users[0], hours=1)
+        young = self.react(self.works[0], self.users[1], hours=2)  # 30 seconds old at the refresh
+        self.assertEqual(self.refresh(hours=2 + 30 / 3600), (1, 0, 1))
+        self.assertEqual(TrendingState.objects.get().last_reaction_id, first.pk)
+
+        # Settled now; the first reaction is not counted twice
+        self.assertEqual(self.refresh(hours=3), (1, 0, 1))
+        self.assertEqual(TrendingState.objects.get().last_reaction_id, young.pk)
+        self.assertEqual(TrendingScore.objects.get().reactions, 2)
+        self.assertAlmostEqual(self.scores()[self.works[0].pk], 2 + 4)
+        self.assertEqual(self.refresh(hours=4), (0, 0, 0))
+
+    def test_prune_and_rebase(self):
+        self.react(self.works[0], self.users[0], hours=0)
+        self.react(self.works[1], self.users[0], hours=2)
+        self.refresh(hours=3)
+        self.assertEqual(set(self.scores()), {self.works[0].pk, self.works[1].pk})
+
+        # Work 0 decays below TRENDING_MIN_SCORE (0.1) first: 2 ** -3.5 against 2 ** -1.5
+        self.refresh(hours=3.5)
+        self.assertEqual(set(self.scores()), {self.works[1].pk})
+
+        # Moving the epoch rescales every score once, the decayed values stay the same
+        state = TrendingState.objects.get()
+        later = self.epoch + timedelta(hours=10)
+        decayed = trending.decay_factor(state, later) * self.scores()[self.works[1].pk]
+        trending.rebase(state, later)
+        self.assertEqual(state.epoch, later)
+        self.assertAlmostEqual(self.scores()[self.works[1].pk], decayed)
+
+    def test_refresh_rebases_before_the_exponent_overflows(self):
+        trending.record_download(self.works[2].pk)
+        self.refresh(hours=trending.MAX_EXPONENT + 1)
+        self.assertEqual(TrendingState.objects.get().epoch, self.now)
+        self.assertAlmostEqual(self.scores()[self.works[2].pk], 0.5)
+
+    def test_view_reads_without_writing(self):
+        self.react(self.works[1], self.users[0], hours=2)
+        self.refresh(hours=3)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/repository/trending/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data['results']], [self.works[1].pk])
+        self.assertFalse([q['sql'] for q in queries if not q['sql'].startswith('SELECT')])
+
+        # No state yet: scores are shown undecayed and the row is left to the first refresh
+        TrendingState.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/repository/trending/')
+        self.assertEqual(response.data['results'][0]['trending_score'], 4.0)
+        self.assertFalse(TrendingState.objects.exists())
+        self.assertFalse([q['sql'] for q in queries if not q['sql'].startswith('SELECT')])
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class FacetTests(TestCase):
+    def setUp(self):
+        self.ada = User.objects.create_user('ada', 'ada@example.com', 'Password123!', country='Nigeria')
+        self.bo = User.objects.create_user('bo', 'bo@example.com', 'Password123!', country='Kenya')
+        User.objects.create_superuser('staff@example.com', 'staff', 'Password123!', country='Kenya')
+        self.works = [
+            ScholarlyWork.objects.create(
+                title=f'Work {i}', authors='A. Author' if i % 2 else 'B. Author', publication_year=2020 + i % 3,
+                file=f'scholarly_works/{i}.pdf', original_filename=f'{i}.pdf', file_size=1,
+                file_type='pdf' if i % 4 else 'docx', uploader=self.ada if i < 6 else self.bo
+            )
+            for i in range(10)
+        ]
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.ada)}')
+
+    def rollups(self):
+        return (
+            sorted(FacetCell.objects.filter(works__gt=0).values_list('publication_year', 'file_type', 'country', 'works')),
+            sorted(CountryRollup.objects.exclude(scholars=0, works=0).values_list('country', 'scholars', 'works')),
+        )
+
+    def assert_rollups_exact(self):
+        incremental = self.rollups()
+        facets.rebuild()
+        self.assertEqual(incremental, self.rollups())
+
+    def test_rollups_follow_writes(self):
+        self.assertEqual(dict(CountryRollup.objects.values_list('country', 'works')), {'Nigeria': 6, 'Kenya': 4})
+        self.assert_rollups_exact()
+
+        self.assertEqual(soft_delete(ScholarlyWork.objects.filter(pk__in=[self.works[0].pk, self.works[0].pk])), 1)
+        self.assertEqual(soft_delete(ScholarlyWork.all_objects.filter(pk=self.works[0].pk)), 0)
+        self.works[1].publication_year = 1999
+        self.works[1].save()
+        self.bo.country = 'Ghana'
+        self.bo.save()
+        self.ada.is_active = False
+        self.ada.save()
+        self.assert_rollups_exact()
+        self.assertEqual(
+            sorted(CountryRollup.objects.filter(scholars__gt=0).values_list('country', 'scholars')), [('Ghana', 1)]
+        )
+
+        self.bo.delete()
+        self.assert_rollups_exact()
+        self.assertEqual([country for country, _, _ in self.rollups()[1]], ['Nigeria'])
+
+    def test_rollup_and_live_counts_agree(self):
+        for params in [{}, {'file_type': 'pdf'}, {'publication_year': 2021, 'country': 'Kenya'}]:
+            rollup = self.client.get('/api/repository/facets/', params).json()
+            self.assertEqual(rollup['source'], 'rollup')
+            # A search every work matches forces the live path without changing the counts
+            live = self.client.get('/api/repository/facets/', {**params, 'search': 'Work'}).json()
+            self.assertEqual(live['source'], 'live')
+            self.assertEqual(rollup['facets'], live['facets'])
+            self.assertEqual(rollup['count'], live['count'])
+            self.assertEqual(rollup['count'], self.client.get('/api/repository/', params).json()['count'])
+
+        counts = self.client.get('/api/repository/facets/', {'file_type': 'docx'}).json()
+        # The selected dimension keeps its alternatives
+        self.assertEqual(counts['facets']['file_type'], [{'value': 'pdf', 'count': 7}, {'value': 'docx', 'count': 3}])
+        self.assertEqual(counts['count'], 3)
+
+        live = self.client.get('/api/repository/facets/', {'author': 'B. Author'}).json()
+        self.assertEqual(live['count'], 5)
+        self.assertEqual(self.client.get('/api/repository/facets/', {'publication_year': 'soon'}).status_code, 400)
+
+    def test_country_stats(self):
+        data = self.client.get('/api/repository/countries/').json()
+        self.assertEqual(data['totals'], {'scholars': 2, 'works': 10, 'countries': 2})
+        self.assertEqual(data['countries'], [
+            {'country': 'Nigeria', 'scholars': 1, 'works': 6},
+            {'country': 'Kenya', 'scholars': 1, 'works': 4},
+        ])
+
+
+@override_settings(DATABASE_REPLICAS=[], MEDIA_ROOT=tempfile.mkdtemp(), ZIP_MAX_BYTES=10_000)
+class ArchiveTests(TestCase):
+    def setUp(self):
+        trending._counter = trending.LocalDownloadCounter()
+        self.user = User.objects.create_user('zipper', 'zipper@example.com', 'Password123!')
+        self.works = []
+        for i, name in enumerate(['paper.pdf', '../../etc/paper.pdf', 'draft.docx']):
+            work = ScholarlyWork(
+                title=f'Archived {i}', authors='A. Author', publication_year=2024, original_filename=name,
+                file_size=4, file_type=name.rsplit('.', 1)[1], uploader=self.user
+            )
+            work.file.save(name, ContentFile(f'work{i}'.encode() * 100), save=False)
+            if work.file_type == 'docx':
+                work.converted_pdf.save('draft.pdf', ContentFile(b'%PDF converted'), save=False)
+            work.save()
+            self.works.append(work)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_streams_zip_of_filtered_works(self):
+        response = self.client.get('/api/repository/archive/', {'uploader': self.user.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        first, second, third = (work.pk for work in self.works)
+        self.assertEqual(sorted(archive.namelist()), sorted([f'{first}-paper.pdf', f'{second}-paper.pdf', f'{third}-draft.pdf']))
+        self.assertEqual(archive.read(f'{first}-paper.pdf'), b'work0' * 100)
+        self.assertEqual(archive.read(f'{third}-draft.pdf'), b'%PDF converted')
+        self.assertIsNone(archive.testzip())
+
+    def test_caps_and_filters(self):
+        self.assertEqual(self.client.get('/api/repository/archive/').status_code, 400)
+        with self.settings(ZIP_MAX_BYTES=600):
+            self.assertEqual(self.client.get('/api/repository/archive/', {'uploader': self.user.pk}).status_code, 400)
+        with self.settings(ZIP_MAX_WORKS=1):
+            self.assertEqual(self.client.get('/api/repository/archive/', {'uploader': self.user.pk}).status_code, 400)
+            response = self.client.get('/api/repository/archive/', {'search': 'Archived 1'})
+            self.assertEqual(zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))).namelist(),
+                             [f'{self.works[1].pk}-paper.pdf'])
+        self.client.credentials()
+        self.assertEqual(self.client.get('/api/repository/archive/', {'uploader': self.user.pk}).status_code, 401)
+
+
+@override_settings(DATABASE_REPLICAS=[], EXPORT_CHUNK_SIZE=2)
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'harvested', 'harvested@example.com', 'Password123!', first_name='Ada', country='Nigeria'
+        )
+        self.works = [
+            ScholarlyWork.objects.create(
+                title=f'Exported, "{i}"', authors='A. Author', publication_year=2020 + i,
+                file='scholarly_works/test.pdf', original_filename='test.pdf',
+                file_size=1, file_type='pdf', uploader=self.user
+            )
+            for i in range(5)
+        ]
+
+    def test_jsonl_in_harvest_order(self):
+        response = self.client.get('/api/repository/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [work.pk for work in self.works])
+        self.assertEqual(rows[0]['uploader_name'], 'Ada')
+        self.assertEqual(rows[0]['uploader_country'], 'Nigeria')
+
+        # Only works changed since the first harvest
+        since = self.works[2].updated_at
+        self.works[0].save()
+        response = self.client.get('/api/repository/export/', {'from': since.isoformat()})
+        ids = [json.loads(line)['id'] for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(ids, [work.pk for work in self.works[2:]] + [self.works[0].pk])
+
+        self.assertEqual(self.client.get('/api/repository/export/', {'until': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/repository/export/', {'output': 'xml'}).status_code, 400)
+
+    def test_csv_command_matches_endpoint(self):
+        out = io.StringIO()
+        call_command('export_works', '--output', 'csv', '--until', '2999-12-31', stdout=out)
+        rows = list(csv.reader(io.StringIO(out.getvalue())))
+        self.assertEqual(rows[0][:3], ['id', 'title', 'authors'])
+        self.assertEqual([row[1] for row in rows[1:]], [work.title for work in self.works])
+
+        response = self.client.get('/api/repository/export/', {'output': 'csv', 'until': '2999-12-31'})
+        self.assertEqual(b''.join(response.streaming_content).decode(), out.getvalue())
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class DuplicateTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('dup', 'dup@example.com', 'Password123!')
+        papers = [
+            ('Deep learning for crop yield prediction in West Africa', 'A. Okafor, B. Mensah'),
+            ('A survey of quantum error correction codes', 'C. Zhang'),
+            ('Malaria incidence and rainfall: a time series study', 'D. Kamau, E. Otieno'),
+        ]
+        self.works = [
+            ScholarlyWork.objects.create(
+                title=title, authors=authors, publication_year=2023, description='Preprint.',
+                file='scholarly_works/test.pdf', original_filename='test.pdf',
+                file_size=1, file_type='pdf', uploader=user
+            )
+            for title, authors in papers
+        ]
+        for work in self.works:
+            duplicates.index_work(work.pk, work.title, work.authors, work.description)
+
+    def test_signature_estimates_jaccard(self):
+        first = set(map(str, range(0, 1000)))
+        second = set(map(str, range(200, 1200)))  # Jaccard 800 / 1200
+        score = duplicates.similarity(duplicates.signature(first), duplicates.signature(second))
+        self.assertAlmostEqual(score, 2 / 3, delta=0.12)
+
+    def test_reupload_is_flagged(self):
+        shingles = duplicates.metadata_shingles(
+            'Deep Learning for Crop-Yield Prediction in West Africa.', 'A. Okafor, B. Mensah', 'Preprint.'
+        )
+        found = duplicates.matches('metadata', duplicates.signature(shingles))
+        self.assertEqual(list(found), [self.works[0].pk])
+
+        unrelated = duplicates.metadata_shingles('Coral reef bleaching events', 'F. Silva', '')
+        self.assertEqual(duplicates.matches('metadata', duplicates.signature(unrelated)), {})
+
+    def test_text_signature_finds_renamed_copy(self):
+        body = ' '.join(f'word{i % 97} token{i % 89}' for i in range(3000))
+        duplicates.index_work(self.works[1].pk, self.works[1].title, self.works[1].authors, '', body=body)
+        duplicates.index_work(self.works[2].pk, self.works[2].title, self.works[2].authors, '', body=body + ' appendix')
+        self.assertEqual([work_id for work_id, _ in duplicates.find_duplicates(self.works[1].pk)], [self.works[2].pk])
+        self.assertEqual(duplicates.find_duplicates(self.works[0].pk), [])
+
+        soft_delete(ScholarlyWork.objects.filter(pk=self.works[2].pk))
+        self.assertEqual(duplicates.find_duplicates(self.works[1].pk), [])
+
+    def test_metadata_without_words(self):
+        work = ScholarlyWork.objects.create(
+            title='???', authors='-', publication_year=2024, file='scholarly_works/marks.pdf',
+            original_filename='marks.pdf', file_size=1, file_type='pdf', uploader=self.works[0].uploader
+        )
+        duplicates.index_work(work.pk, work.title, work.authors, '', body='')
+        self.assertIsNone(work.signature.metadata)
+        self.assertFalse(SignatureBand.objects.filter(scholarly_work=work).exists())
+        self.assertEqual(duplicates.find_duplicates(work.pk), [])
+        call_command('index_duplicates', '--all', '--report', stdout=io.StringIO())
+
+    def test_backfill_command(self):
+        work = self.works[0]
+        copy = ScholarlyWork.objects.create(
+            title=work.title, authors=work.authors, publication_year=2024, description=work.description,
+            file='scholarly_works/copy.pdf', original_filename='copy.pdf', file_size=1, file_type='pdf',
+            uploader=work.uploader
+        )
+        out = io.StringIO()
+        call_command('index_duplicates', '--report', stdout=out)
+        self.assertIn('Indexed 1 works', out.getvalue())
+        self.assertIn(f'{work.pk} ~ {copy.pk}  similarity 1.00', out.getvalue())
+
+
+@override_settings(
+    DATABASE_REPLICAS=[], MEDIA_ROOT=tempfile.mkdtemp(), THUMBNAIL_RENDERER='repository.thumbnails.BlankPageRenderer'
+)
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('painter', 'painter@example.com', 'Password123!')
+        self.work = ScholarlyWork(
+            title='Previewed', authors='A. Author', publication_year=2024, original_filename='paper.pdf',
+            file_size=4, file_type='pdf', uploader=user
+        )
+        self.work.file.save('paper.pdf', ContentFile(b'%PDF'), save=False)
+        self.work.save()
+
+    def generate(self, webp=True):
+        with patch.object(thumbnails, 'available_formats', return_value=['webp', 'jpeg'] if webp else ['jpeg']):
+            tasks.generate_thumbnails(self.work.pk)
+        self.work.refresh_from_db()
+        return int(self.work.thumbnails_generated_at.timestamp())
+
+    def get(self, accept='image/webp,image/*,*/*;q=0.8', etag='', **params):
+        url = f'/api/repository/{self.work.pk}/thumbnail/'
+        return self.client.get(url, params, HTTP_ACCEPT=accept, HTTP_IF_NONE_MATCH=etag)
+
+    def test_sizes_and_formats(self):
+        self.generate()
+        self.assertEqual(WorkThumbnail.objects.filter(scholarly_work=self.work).count(), 6)
+        for thumbnail in WorkThumbnail.objects.filter(scholarly_work=self.work):
+            self.assertRegex(thumbnail.image.name, SHARDED_NAME)
+        self.assertEqual(self.get(size='small')['Content-Type'], 'image/webp')
+        self.assertEqual(self.get(accept='image/*,*/*;q=0.8', size='large')['Content-Type'], 'image/jpeg')
+        self.assertEqual(self.get(size='huge').status_code, 400)
+
+    def test_jpeg_when_webp_was_not_written(self):
+        self.generate(webp=False)
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('Accept', response['Vary'])
+
+    def test_only_versioned_urls_are_immutable(self):
+        version = self.generate()
+        response = self.get(v=version)
+        self.assertIn('immutable', response['Cache-Control'])
+        for response in [self.get(), self.get(v=version - 1)]:
+            self.assertEqual(response['Cache-Control'], 'public, no-cache')
+
+        revalidated = self.get(etag=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['Cache-Control'], 'public, no-cache')
+
+    def test_deleted_works_have_no_thumbnail(self):
+        self.generate()
+        soft_delete(ScholarlyWork.objects.filter(pk=self.work.pk))
+        self.assertEqual(self.get().status_code, 404)
+
+
+def docx_bytes(*blocks):
+    """A minimal DOCX: strings become paragraphs, lists of lists become tables"""
+    def paragraph(text):
+        runs = ''.join(
+            f'<w:r><w:t xml:space="preserve">{escape(part)}</w:t></w:r>' if part != '\t' else '<w:r><w:tab/></w:r>'
+            for part in re.split('(\t)', text)
+        )
+        return f'<w:p>{runs}</w:p>'
+
+    body = ''.join(
+        paragraph(block) if isinstance(block, str) else '<w:tbl>' + ''.join(
+            '<w:tr>' + ''.join(f'<w:tc>{paragraph(cell)}</w:tc>' for cell in row) + '</w:tr>' for row in block
+        ) + '</w:tbl>'
+        for block in blocks
+    )
+    content = io.BytesIO()
+    with zipfile.ZipFile(content, 'w') as archive:
+        archive.writestr('word/document.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body>{body}<w:sectPr/></w:body></w:document>'
+        ))
+    return content.getvalue()
+
+
+@override_settings(DATABASE_REPLICAS=[], MEDIA_ROOT=tempfile.mkdtemp())
+class ExtractionTests(TestCase):
+    def docx(self, *blocks):
+        path = os.path.join(settings.MEDIA_ROOT, 'extract.docx')
+        with open(path, 'wb') as f:
+            f.write(docx_bytes(*blocks))
+        return path
+
+    def test_docx_text_in_document_order(self):
+        path = self.docx('Intro ünïcode', [['A1', 'B1'], ['', 'B2']], 'Tab\there', '', 'Closing & <done>')
+        self.assertEqual(
+            list(extraction.iter_docx_text(path)),
+            ['Intro ünïcode\n', 'A1 | B1\n', 'B2\n', 'Tab\there\n', 'Closing & <done>\n'],
+        )
+
+    def test_caps_and_cleans_the_text(self):
+        path = self.docx(*[f'Paragraph {i}' for i in range(1000)])
+        text, truncated = extraction.extract_text(path, 'docx', 100)
+        self.assertTrue(truncated)
+        self.assertEqual(len(text), 100)
+        self.assertEqual(extraction.collect_text((chunk for chunk in ['a\x00b', 'c']), 100), ('abc', False))
+        self.assertEqual(extraction.extract_text(self.docx('Short'), 'docx', 100), ('Short\n', False))
+        with self.assertRaises(ValueError):
+            extraction.extract_text(path, 'odt', 100)
+
+    def test_pdf_extraction_stops_the_subprocess(self):
+        # A pdftotext that never finishes
+        script = os.path.join(settings.MEDIA_ROOT, 'pdftotext')
+        with open(script, 'w') as f:
+            f.write('#!/bin/sh\nexec yes "text of $4"\n')
+        os.chmod(script, 0o755)
+
+        with self.settings(PDFTOTEXT_PATH=script):
+            text, truncated = extraction.extract_text('paper.pdf', 'pdf', 10_000)
+        self.assertTrue(truncated)
+        self.assertEqual(len(text), 10_000)
+        self.assertTrue(text.startswith('text of paper.pdf\ntext of paper.pdf\n'))
+
+
+@override_settings(DATABASE_REPLICAS=[], MEDIA_ROOT=tempfile.mkdtemp(), WORKS_LIST_FASTPATH=False)
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'Password123!')
+        self.works = {
+            name: self.work(name, keywords, body)
+            for name, keywords, body in [
+                ('Ocean currents', 'climate', ['The thermohaline circulation moves heat poleward.']),
+                ('Soil chemistry', 'farming', ['Nitrogen fixation by legumes.', [['Table', 'thermohaline']]]),
+                ('Unextracted', 'glaciers', None),
+            ]
+        }
+
+    def work(self, title, keywords, body):
+        work = ScholarlyWork(
+            title=title, authors='Amara Obi', keywords=keywords, publication_year=2024, original_filename='w.docx',
+            file_size=4, file_type='docx', uploader=self.user
+        )
+        work.file.save('w.docx', ContentFile(docx_bytes(*(body or ['']))), save=False)
+        work.save()
+        # What the upload does, then the extraction task
+        WorkText.objects.create(scholarly_work=work)
+        search.index_text(work)
+        if body is not None:
+            self.assertIn('Extracted', tasks.extract_fulltext(work.pk))
+        return work
+
+    def search(self, terms):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/repository/', {'q': terms})
+        self.assertEqual(response.status_code, 200)
+        return {item['title']: item['snippet'] for item in response.data['results']}, queries[-1]['sql']
+
+    def test_metadata_and_body_matches(self):
+        self.assertEqual(set(self.search('thermohaline')[0]), {'Ocean currents', 'Soil chemistry'})
+        self.assertEqual(set(self.search('glaciers')[0]), {'Unextracted'})
+        self.assertEqual(set(self.search('Obi')[0]), set(self.works))
+        self.assertEqual(set(self.search('legumes')[0]), {'Soil chemistry'})
+        self.assertEqual(self.search('volcano')[0], {})
+
+        soft_delete(ScholarlyWork.objects.filter(title='Soil chemistry'))
+        self.assertEqual(set(self.search('thermohaline')[0]), {'Ocean currents'})
+
+    @skipUnless(connection.vendor == 'postgresql', 'snippets and the tsvector are PostgreSQL only')
+    def test_index_match_with_snippets(self):
+        results, sql = self.search('thermohaline circulation')
+        self.assertEqual(results, {'Ocean currents': '<mark>thermohaline</mark> <mark>circulation</mark> moves heat poleward'})
+        self.assertIn('@@', sql)
+        self.assertNotIn('LIKE', sql)
+
+        # Title words weigh more than the body, so a metadata-only row is still found
+        self.assertEqual(set(self.search('ocean')[0]), {'Ocean currents'})
+
+    @skipUnless(connection.vendor != 'postgresql', 'substring fallback for other databases')
+    def test_substring_fallback_without_snippets(self):
+        results, sql = self.search('thermo')
+        self.assertEqual(results, {'Ocean currents': None, 'Soil chemistry': None})
+        self.assertIn('LIKE', sql)
+
+
+@override_settings(DATABASE_REPLICAS=[], REACTION_WRITE_BEHIND=False)
+class FieldsetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('selector', 'selector@example.com', 'Password123!', first_name='Sel')
+        self.works = [
+            ScholarlyWork.objects.create(
+                title=f'Sparse {i}', authors='A. Author', description='Long abstract ' * 50, publication_year=2024,
+                file_size=4, file_type='pdf', uploader=self.user,
+            )
+            for i in range(3)
+        ]
+        Reaction.objects.create(scholarly_work=self.works[0], user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        # The row query, after the page count (lists) and the user lookup of a cold auth cache
+        return response.data, [q['sql'] for q in queries if 'FROM "repository_scholarlywork"' in q['sql']][-1]
+
+    def test_fields_and_omit(self):
+        data, sql = self.get('/api/repository/', fields='id,title')
+        self.assertEqual([set(item) for item in data['results']], [{'id', 'title'}] * 3)
+        for column in ['description', 'authors', 'file_size', 'repository_reaction', 'accounts_user']:
+            self.assertNotIn(column, sql)
+
+        data, sql = self.get('/api/repository/', omit='uploader,snippet,reaction_count')
+        self.assertEqual(
+            set(data['results'][0]),
+            {'id', 'title', 'authors', 'publication_year', 'file_type', 'file_size', 'uploaded_at',
+             'user_has_reacted', 'conversion_status', 'thumbnail_url'},
+        )
+        self.assertNotIn('accounts_user', sql)
+        self.assertNotIn('COUNT', sql)
+        self.assertIn('repository_reaction', sql)  # has_reacted still annotated
+
+    def test_expand(self):
+        data, sql = self.get('/api/repository/', fields='id,uploader')
+        self.assertEqual(data['results'][0]['uploader'], {
+            'id': self.user.pk, 'username': 'selector', 'full_name': 'Sel', 'affiliation': '',
+        })
+        self.assertIn('accounts_user', sql)
+
+        # An empty expand collapses the default one to the id, without the join
+        data, sql = self.get('/api/repository/', fields='id,uploader', expand='')
+        self.assertEqual(data['results'][0]['uploader'], self.user.pk)
+        self.assertNotIn('accounts_user', sql)
+
+    def test_description_is_deferred_unless_rendered(self):
+        url = f'/api/repository/{self.works[0].pk}/'
+        data, sql = self.get(url, fields='id,title,reaction_count,user_has_reacted')
+        self.assertEqual(data, {'id': self.works[0].pk, 'title': 'Sparse 0', 'reaction_count': 1, 'user_has_reacted': True})
+        self.assertNotIn('description', sql)
+
+        data, sql = self.get(url)
+        self.assertEqual(data['description'], 'Long abstract ' * 50)
+        self.assertIn('"description"', sql)
+
+    def test_sparse_queryset_follows_the_serializer(self):
+        request = APIRequestFactory().get('/', {'fields': 'id,title,thumbnail_url,reaction_count'})
+        request.user = self.user
+        serializer = ScholarlyWorkListSerializer(context={'request': request})
+        queryset = sparse_queryset(ScholarlyWork.objects.all(), serializer)
+
+        loaded, deferred = queryset.query.deferred_loading
+        self.assertFalse(deferred)
+        self.assertEqual(set(loaded), {'id', 'title', 'thumbnails_generated_at'})
+        self.assertEqual(set(queryset.query.annotations), {'num_reactions'})
+        self.assertEqual(sorted(w.num_reactions for w in queryset), [0, 0, 1])
+
+    def test_query_count_does_not_grow_with_rows(self):
+        params = {'fields': 'id,uploader,reaction_count,user_has_reacted,thumbnail_url'}
+        self.client.get('/api/repository/', params)  # warms the user cache
+        with self.assertNumQueries(2):
+            first = self.client.get('/api/repository/', params).data
+        for i in range(10):
+            ScholarlyWork.objects.create(
+                title=f'More {i}', authors='B', publication_year=2024, file_size=4, file_type='pdf', uploader=self.user
+            )
+        with self.assertNumQueries(2):
+            self.client.get('/api/repository/', params)
+        self.assertEqual(sorted(item['reaction_count'] for item in first['results']), [0, 0, 1])
+
+
+@override_settings(DATABASE_REPLICAS=[], REACTION_WRITE_BEHIND=False, WORKS_LIST_FASTPATH=True)
+class WorksListFastpathTests(TestCase):
+    TITLES = [
+        'Plain title', 'Éléments de théorie — 数学', 'Line\u2028separated\u2029title', 'Emoji 🌍 studies',
+        'Quotes "and" \\ backslashes', 'Théorie des graphes', 'Zeta',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.named = User.objects.create_user(
+            'ngozi', 'ngozi@example.com', 'Password123!', first_name='Ngozi', last_name='Okafor', affiliation='UNILAG'
+        )
+        cls.bare = User.objects.create_user('bare', 'bare@example.com', 'Password123!')
+        for i, title in enumerate(cls.TITLES):
+            work = ScholarlyWork.objects.create(
+                title=title, authors='Ngozi Okafor' if i % 2 else 'Bare', publication_year=2018 + i % 3,
+                file_size=1000 + i, file_type='pdf', uploader=cls.named if i % 2 else cls.bare,
+                thumbnails_generated_at=timezone.now() if i % 3 else None,
+            )
+            WorkText.objects.create(scholarly_work=work, body=f'corpus body {i} Straßenbahn', char_count=30)
+            search.index_text(work)
+            if i % 2:
+                Reaction.objects.create(scholarly_work=work, user=cls.named)
+
+    def get_both(self, params, user=None):
+        """(serializer bytes, fast path bytes) for the same request"""
+        client = APIClient()
+        if user:
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        with self.settings(WORKS_LIST_FASTPATH=False):
+            slow = client.get('/api/repository/', params)
+        fast = client.get('/api/repository/', params)
+        self.assertEqual((slow.status_code, fast.status_code), (200, 200))
+        self.assertIsInstance(slow, Response)
+        self.assertNotIsInstance(fast, Response)
+        return slow.content, fast.content
+
+    def test_same_bytes_as_the_serializer_path(self):
+        requests = [
+            {}, {'page': 2}, {'search': 'théorie'}, {'q': 'Straßenbahn'}, {'q': 'graphes'},
+            {'ordering': 'title'}, {'ordering': '-publication_year', 'page': 2}, {'search': '数学', 'ordering': 'title'},
+        ]
+        for params in requests:
+            for user in [None, self.named, self.bare]:
+                with self.subTest(params=params, user=user):
+                    slow, fast = self.get_both(params, user)
+                    self.assertEqual(fast, slow)
+                    self.assertTrue(json.loads(fast)['results'])
+
+    def test_escapes_and_fallback_encoder(self):
+        slow, fast = self.get_both({'search': 'separated'})
+        self.assertEqual(fast, slow)
+        self.assertIn(b'Line\\u2028separated\\u2029title', fast)
+        self.assertIn('Éléments'.encode(), self.get_both({'search': 'Éléments'})[1])
+
+        with patch.object(fastpath, 'orjson', None):
+            for params in [{}, {'search': 'separated'}, {'search': '🌍'}]:
+                self.assertEqual(*self.get_both(params, self.named))
+
+    def test_other_representations_use_the_serializers(self):
+        client = APIClient()
+        for params in [{'fields': 'id,title'}, {'omit': 'snippet'}, {'expand': 'uploader'}]:
+            self.assertIsInstance(client.get('/api/repository/', params), Response)
+        self.assertIsInstance(client.get('/api/repository/', HTTP_ACCEPT='application/json; indent=2'), Response)
+
+
+@override_settings(DATABASE_REPLICAS=[], DELETION_BATCH_SIZE=2, DELETION_CHUNK_SIZE=2, MEDIA_GC_GRACE_SECONDS=3600)
+@patch('repository.tasks.update_related_works.delay')
+@patch('repository.tasks.purge_deleted_works.delay')
+class CleanupTests(TestCase):
+    def setUp(self):
+        # The GC walks the whole media root, so every test needs its own
+        media = self.settings(MEDIA_ROOT=tempfile.mkdtemp())
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'Password123!', country='Ghana')
+        self.fans = [User.objects.create_user(f'reader{i}', f'r{i}@example.com', 'Password123!') for i in range(3)]
+        self.doomed = self.work('Doomed', 'draft.docx', converted=True)
+        self.kept = self.work('Kept', 'paper.pdf')
+        for fan in self.fans:
+            Reaction.objects.create(scholarly_work=self.doomed, user=fan)
+        Reaction.objects.create(scholarly_work=self.kept, user=self.fans[0])
+        related.rebuild_all()
+        facets.rebuild()
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.owner)}'}
+
+    def work(self, title, name, converted=False):
+        work = ScholarlyWork(
+            title=title, authors='A. Author', keywords='soil', publication_year=2024, original_filename=name,
+            file_size=4, file_type=name.rsplit('.', 1)[1], uploader=self.owner
+        )
+        work.file.save(name, ContentFile(title.encode()), save=False)
+        if converted:
+            work.converted_pdf.save('draft.pdf', ContentFile(b'%PDF'), save=False)
+        work.save()
+        WorkThumbnail.objects.create(
+            scholarly_work=work, size='small', format='jpeg', width=1, height=1,
+            image=ContentFile(b'jpeg', name='small.jpeg'),
+        )
+        return work
+
+    def media(self):
+        return sorted(name for name, _ in walk(settings.MEDIA_ROOT))
+
+    def test_delete_hides_the_work_at_once(self, purge, related_update):
+        response = self.client.delete(f'/api/repository/{self.doomed.pk}/delete/', **self.auth)
+        self.assertEqual(response.status_code, 204)
+        purge.assert_called_once_with()
+
+        self.assertEqual(self.client.get(f'/api/repository/{self.doomed.pk}/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/repository/{self.doomed.pk}/download/', **self.auth).status_code, 404)
+        self.assertEqual([item['id'] for item in self.client.get('/api/repository/').json()['results']], [self.kept.pk])
+        self.assertEqual(FacetCell.objects.filter(country='Ghana').aggregate(total=Sum('works'))['total'], 1)
+
+        # Rows and files stay until the purge; deleting again changes nothing
+        self.assertTrue(ScholarlyWork.all_objects.filter(pk=self.doomed.pk).exists())
+        self.assertEqual(len(self.media()), 5)
+        self.assertEqual(soft_delete(ScholarlyWork.all_objects.filter(pk=self.doomed.pk)), 0)
+        self.assertEqual(self.client.delete(f'/api/repository/{self.doomed.pk}/delete/', **self.auth).status_code, 404)
+
+    def test_purge_removes_rows_and_files(self, purge, related_update):
+        doomed_files = [self.doomed.file.name, self.doomed.converted_pdf.name, self.doomed.thumbnails.get().image.name]
+        # Another row shares the converted PDF (e.g. a migrated copy); it must survive
+        ScholarlyWork.objects.filter(pk=self.kept.pk).update(converted_pdf=self.doomed.converted_pdf.name)
+        soft_delete(ScholarlyWork.objects.filter(pk=self.doomed.pk))
+
+        self.assertEqual(tasks.purge_deleted_works(), 'Purged 1 deleted works')
+        self.assertFalse(ScholarlyWork.all_objects.filter(pk=self.doomed.pk).exists())
+        self.assertFalse(Reaction.objects.filter(scholarly_work_id=self.doomed.pk).exists())
+        self.assertFalse(WorkThumbnail.objects.filter(scholarly_work_id=self.doomed.pk).exists())
+        self.assertEqual(Reaction.objects.filter(scholarly_work=self.kept).count(), 1)
+
+        media = self.media()
+        self.assertNotIn(doomed_files[0], media)
+        self.assertNotIn(doomed_files[2], media)
+        self.assertIn(doomed_files[1], media)
+        self.assertIn(self.kept.file.name, media)
+        # The work that listed it as related is recomputed
+        related_update.assert_called_once_with([self.kept.pk], cascade=False)
+        self.assertEqual(tasks.purge_deleted_works(), 'Purged 0 deleted works')
+
+    def test_orphan_gc_respects_grace_and_dry_run(self, purge, related_update):
+        old = time.time() - 7200
+        storage = default_storage
+        orphan = storage.save('works/aa/bb/orphan.pdf', ContentFile(b'x' * 10))
+        fresh = storage.save('works/aa/bb/uploading.pdf', ContentFile(b'y' * 20))
+        for name in self.media():
+            if name != fresh:
+                os.utime(storage.path(name), (old, old))
+
+        self.assertEqual(collect_orphans(dry_run=True), (7, 1, 10))
+        self.assertTrue(storage.exists(orphan))
+
+        out = io.StringIO()
+        call_command('collect_orphaned_files', stdout=out)
+        self.assertIn('Removed 1 of 7 files', out.getvalue())
+        self.assertFalse(storage.exists(orphan))
+        self.assertTrue(storage.exists(fresh))
+        self.assertEqual(len(self.media()), 6)
+
+        # Past its grace period the unreferenced upload goes too, referenced files never do
+        self.assertEqual(collect_orphans(grace_seconds=0), (6, 1, 20))
+        self.assertEqual(len(self.media()), 5)
+        self.assertEqual(collect_orphans(grace_seconds=0), (5, 0, 0))
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class MediaLayoutTests(TestCase):
+    def setUp(self):
+        # The legacy names are fixed, so every test needs an empty media root
+        media = self.settings(MEDIA_ROOT=tempfile.mkdtemp())
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user('archivist', 'archivist@example.com', 'Password123!')
+        self.shared = self.legacy_file('scholarly_works/7/paper.pdf', b'%PDF shared')
+        self.works = [self.work(self.shared) for _ in range(2)]
+        self.docx = self.work(self.legacy_file('scholarly_works/7/draft.docx', b'docx'), file_type='docx')
+        self.docx.converted_pdf = self.legacy_file('converted_pdfs/draft.pdf', b'%PDF converted')
+        self.docx.save()
+        self.missing = self.work('scholarly_works/7/gone.pdf')
+        self.thumbnail = WorkThumbnail.objects.create(
+            scholarly_work=self.works[0], size='small', format='jpeg', width=1, height=1,
+            image=self.legacy_file(f'thumbnails/{self.works[0].pk}/small.jpeg', b'jpeg'),
+        )
+
+    def legacy_file(self, name, content):
+        self.assertEqual(default_storage.save(name, ContentFile(content)), name)
+        return name
+
+    def work(self, name, file_type='pdf'):
+        return ScholarlyWork.objects.create(
+            title='Moved', authors='A. Author', publication_year=2024, original_filename=name.rsplit('/', 1)[1],
+            file_size=4, file_type=file_type, uploader=self.user, file=name,
+        )
+
+    def migrate(self, *args, command='migrate_media_layout'):
+        out = io.StringIO()
+        call_command(command, '--batch-size', '2', '--pause', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def names(self):
+        return [str(work.file) for work in ScholarlyWork.all_objects.order_by('pk')]
+
+    def test_copies_and_repoints_every_layout(self):
+        self.assertIn('scholarlywork.file: 4 rows to move', self.migrate('--dry-run'))
+        self.assertTrue(default_storage.exists(self.shared))
+
+        self.assertIn('scholarlywork.file: 3 rows moved, 1 files missing', self.migrate('--grace', '0'))
+        first, second, docx, missing = self.names()
+        self.docx.refresh_from_db()
+        self.thumbnail.refresh_from_db()
+        for name in [first, docx, str(self.docx.converted_pdf), str(self.thumbnail.image)]:
+            self.assertRegex(name, SHARDED_NAME)
+        self.assertTrue(str(self.thumbnail.image).startswith('thumbnails/'))
+
+        # A shared file is copied once and both rows follow it
+        self.assertEqual(second, first)
+        self.assertEqual(default_storage.open(first).read(), b'%PDF shared')
+        self.assertEqual(default_storage.open(str(self.docx.converted_pdf)).read(), b'%PDF converted')
+        self.assertEqual(missing, 'scholarly_works/7/gone.pdf')
+        for old in [self.shared, 'converted_pdfs/draft.pdf', f'thumbnails/{self.works[0].pk}/small.jpeg']:
+            self.assertFalse(default_storage.exists(old))
+
+        # Re-running only finds the missing file
+        self.assertIn('scholarlywork.file: 1 rows to move', self.migrate('--dry-run'))
+        self.assertIn('workthumbnail.image: 0 rows to move', self.migrate('--dry-run'))
+
+    def test_row_edited_meanwhile_is_left_alone(self):
+        edited = self.works[1]
+        open_file = FileSystemStorage.open
+
+        def replace_then_open(storage, name, mode='rb'):
+            # The owner uploads a new file between the batch read and the repoint
+            ScholarlyWork.objects.filter(pk=edited.pk).update(file='works/aa/bb/replaced.pdf')
+            return open_file(storage, name, mode)
+
+        with patch.object(FileSystemStorage, 'open', autospec=True, side_effect=replace_then_open):
+            self.migrate('--grace', '0')
+
+        edited.refresh_from_db()
+        self.assertEqual(str(edited.file), 'works/aa/bb/replaced.pdf')
+        self.assertRegex(self.names()[0], SHARDED_NAME)
+        copies = [name for name, _ in walk(os.path.join(settings.MEDIA_ROOT, 'works'))]
+        self.assertEqual(len(copies), 2)  # paper.pdf once and draft.docx, no copy for the edited row
+
+    def test_old_files_outlive_the_grace_period(self):
+        command = migrate_media_layout.Command()
+        with patch.object(migrate_media_layout.time, 'sleep'):
+            self.migrate('--grace', '60', command=command)
+
+        # Rows already point at the copies, readers of the old names still find them
+        self.assertRegex(self.names()[0], SHARDED_NAME)
+        self.assertTrue(default_storage.exists(self.shared))
+        self.assertEqual(len(command.pending), 5)
+
+        # Still referenced by a row the run did not reach: kept past the deadline
+        ScholarlyWork.objects.create(
+            title='Late', authors='A. Author', publication_year=2024, original_filename='paper.pdf',
+            file_size=4, file_type='pdf', uploader=self.user, file=self.shared,
+        )
+        command.pending = [(0, name) for _, name in command.pending]
+        command.delete_expired()
+        self.assertEqual(command.pending, [])
+        self.assertTrue(default_storage.exists(self.shared))
+        self.assertFalse(default_storage.exists('converted_pdfs/draft.pdf'))
+
+
+@override_settings(DATABASE_REPLICAS=[], MEDIA_ROOT=tempfile.mkdtemp(), REACTION_BUFFER_BACKEND='local')
+class AsyncViewTests(TestCase):
+    """The async variants (routed under ASGI) answer exactly like the DRF views the tests route to"""
+
+    def setUp(self):
+        trending._counter = trending.LocalDownloadCounter()
+        reactions._buffer = reactions.LocalReactionBuffer()
+        self.user = User.objects.create_user('async', 'async@example.com', 'Password123!')
+        self.token = str(AccessToken.for_user(self.user))
+        self.works = [self.work(f'Async {i}', f'paper {i}.pdf') for i in range(2)]
+        self.docx = self.work('Converted', 'draft.docx')
+        self.docx.converted_pdf.save('draft.pdf', ContentFile(b'%PDF converted ' * 10_000))
+
+    def tearDown(self):
+        trending._counter = None
+        reactions._buffer = None
+
+    def work(self, title, name):
+        work = ScholarlyWork(
+            title=title, authors='A. Author', publication_year=2024, original_filename=name,
+            file_size=4, file_type=name.rsplit('.', 1)[1], uploader=self.user
+        )
+        work.file.save(name, ContentFile(title.encode() * 100), save=False)
+        work.save()
+        return work
+
+    def both(self, method, path, view, pk, token=None, async_pk=None):
+        """(DRF response, async view response) for the same request"""
+        token = self.token if token is None else token
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        drf = getattr(self.client, method)(f'/api/repository/{pk}/{path}/', headers=headers)
+        request = getattr(AsyncRequestFactory(), method)(f'/api/repository/{async_pk or pk}/{path}/', headers=headers)
+        return drf, async_to_sync(view)(request, async_pk or pk)
+
+    def assertSame(self, drf, response, headers=('Content-Type',)):
+        self.assertEqual(response.status_code, drf.status_code)
+        self.assertEqual(response.content, drf.content)
+        for header in headers:
+            self.assertEqual(response.get(header), drf.get(header))
+
+    def test_conversion_status(self):
+        for work in [self.works[0], self.docx]:
+            drf, response = self.both('get', 'conversion-status', async_views.conversion_status, work.pk)
+            self.assertEqual(drf.status_code, 200)
+            self.assertSame(drf, response)
+
+    def test_errors(self):
+        missing = max(work.pk for work in ScholarlyWork.objects.all()) + 1
+        soft_delete(ScholarlyWork.objects.filter(pk=self.works[1].pk))
+        cases = [
+            (async_views.conversion_status, 'get', 'conversion-status'),
+            (async_views.download_work, 'get', 'download'),
+            (async_views.react_to_work, 'post', 'react'),
+        ]
+        for view, method, path in cases:
+            for pk, token, status in [
+                (self.works[0].pk, '', 401), (self.works[0].pk, 'not-a-jwt', 401), (missing, None, 404),
+                (self.works[1].pk, None, 404),
+            ]:
+                with self.subTest(path=path, pk=pk, token=token):
+                    drf, response = self.both(method, path, view, pk, token=token)
+                    self.assertEqual(drf.status_code, status)
+                    self.assertSame(drf, response, headers=('Content-Type', 'WWW-Authenticate'))
+
+    def test_download(self):
+        for work in [self.works[0], self.docx]:
+            drf, response = self.both('get', 'download', async_views.download_work, work.pk)
+            self.assertEqual(drf.status_code, 200)
+            self.assertEqual(
+                async_to_sync(self.collect)(response.streaming_content), b''.join(drf.streaming_content)
+            )
+            for header in ['Content-Type', 'Content-Length', 'Content-Disposition']:
+                self.assertEqual(response[header], drf[header])
+        self.assertEqual(trending.get_download_counter().drain(), {self.works[0].pk: 2, self.docx.pk: 2})
+
+        # A file gone from storage
+        self.works[0].file.delete(save=False)
+        drf, response = self.both('get', 'download', async_views.download_work, self.works[0].pk)
+        self.assertEqual(drf.status_code, 404)
+        self.assertSame(drf, response)
+
+    def test_react(self):
+        for write_behind in [False, True]:
+            with self.subTest(write_behind=write_behind), self.settings(REACTION_WRITE_BEHIND=write_behind):
+                for _ in range(2):
+                    # Same starting state on two works: the DRF view toggles one, the async view the other
+                    drf, response = self.both(
+                        'post', 'react', async_views.react_to_work, self.works[0].pk, async_pk=self.docx.pk
+                    )
+                    self.assertEqual(drf.status_code, 200)
+                    self.assertSame(drf, response)
+
+    async def collect(self, chunks):
+        return b''.join([chunk async for chunk in chunks])
+
+
+@override_settings(DATABASE_REPLICAS=[], MEDIA_ROOT=tempfile.mkdtemp(), THROTTLE_BACKEND='local')
+@patch('repository.tasks.update_related_works.delay')
+@patch('repository.tasks.generate_thumbnails.delay')
+@patch('repository.tasks.extract_fulltext.delay')
+@patch('repository.tasks.convert_docx_to_pdf.delay')
+class UploadTests(TestCase):
+    def setUp(self):
+        throttling._buckets = throttling.LocalTokenBuckets()
+        self.user = User.objects.create_user('uploader', 'uploader@example.com', 'Password123!')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        throttling._buckets = None
+
+    def upload(self, name, content_type, title='Malaria incidence and rainfall', authors='D. Kamau'):
+        return self.client.post('/api/repository/upload/', {
+            'title': title, 'authors': authors, 'publication_year': 2023,
+            'file': SimpleUploadedFile(name, b'%PDF-1.4 test', content_type=content_type),
+        }, format='multipart')
+
+    def test_pdf_goes_to_post_processing(self, convert, extract, thumbnails, related):
+        response = self.upload('paper.pdf', 'application/pdf')
+        self.assertEqual(response.status_code, 201)
+        work = ScholarlyWork.objects.get(pk=response.data['id'])
+        self.assertEqual(work.conversion_status, 'completed')
+        convert.assert_not_called()
+        extract.assert_called_once_with(work.pk)
+        thumbnails.assert_called_once_with(work.pk)
+        related.assert_called_once_with([work.pk])
+
+    def test_metadata_without_words(self, convert, extract, thumbnails, related):
+        response = self.upload('marks.pdf', 'application/pdf', title='???', authors='-')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['possible_duplicates'], [])
+        self.assertIsNone(ScholarlyWork.objects.get(pk=response.data['id']).signature.metadata)
+
+    def test_docx_is_queued_for_conversion(self, convert, extract, thumbnails, related):
+        docx = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        response = self.upload('paper.docx', docx)
+        self.assertEqual(response.status_code, 201)
+        work = ScholarlyWork.objects.get(pk=response.data['id'])
+        self.assertEqual(work.conversion_status, 'pending')
+        convert.assert_called_once_with(work.pk)
+        extract.assert_not_called()
+        related.assert_called_once_with([work.pk])
+
+
+@override_settings(
+    THROTTLE_BACKEND='local', DATABASE_REPLICAS=[],
+    THROTTLE_BUCKETS={'ip': {'capacity': 30, 'per_minute': 60}, 'user': {'capacity': 20, 'per_minute': 6}},
+    THROTTLE_COSTS={'login': 10, 'upload': 10, 'profile_pdf': 15},
+)
+class ThrottleTests(TestCase):
+    def setUp(self):
+        self.clock = [0.0]
+        throttling._buckets = throttling.LocalTokenBuckets(clock=lambda: self.clock[0])
+        self.ada = User.objects.create_user('ada', 'ada@example.com', 'Password123!')
+        self.bo = User.objects.create_user('bo', 'bo@example.com', 'Password123!')
+
+    def tearDown(self):
+        throttling._buckets = None
+
+    def login(self, ip='10.0.0.1', **headers):
+        return self.client.post('/api/auth/login/', {'username': 'ada', 'password': 'wrong'}, REMOTE_ADDR=ip, **headers)
+
+    def upload(self, user, ip='10.0.0.1'):
+        client = APIClient()
+        client.force_authenticate(user)
+        # An empty form fails validation, after the throttle has charged for it
+        return client.post('/api/repository/upload/', {}, REMOTE_ADDR=ip)
+
+    def test_bucket_refuses_and_refills(self):
+        responses = [self.login() for _ in range(4)]
+        self.assertEqual([r.status_code for r in responses], [401, 401, 401, 429])
+        self.assertEqual(responses[0]['RateLimit-Limit'], '3')
+        self.assertEqual([r['RateLimit-Remaining'] for r in responses], ['2', '1', '0', '0'])
+        self.assertEqual(responses[2]['RateLimit-Reset'], '30')
+        self.assertEqual(responses[3]['Retry-After'], '10')
+
+        self.assertEqual(self.login(ip='10.0.0.2').status_code, 401)
+        self.clock[0] += 10
+        self.assertEqual(self.login().status_code, 401)
+        self.assertEqual(self.login().status_code, 429)
+
+    def test_forwarded_for_header_is_not_trusted(self):
+        responses = [self.login(HTTP_X_FORWARDED_FOR=f'192.0.2.{i}') for i in range(4)]
+        self.assertEqual([r.status_code for r in responses], [401, 401, 401, 429])
+
+        # Behind one proxy, the address it appends is the client's
+        with self.settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='192.0.2.9, 198.51.100.7').status_code, 401)
+            self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='198.51.100.7').status_code, 401)
+            self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='192.0.2.1, 198.51.100.7').status_code, 401)
+            self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='198.51.100.7').status_code, 429)
+
+    def test_costs_differ_by_endpoint(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/auth/scholars/0/export/', REMOTE_ADDR='10.0.0.1').status_code, 404)
+        self.assertEqual(self.login().status_code, 429)
+
+    def test_user_and_ip_buckets(self):
+        self.assertEqual([self.upload(self.ada).status_code for _ in range(2)], [400, 400])
+        # ada's user bucket is empty from any address
+        refused = self.upload(self.ada, ip='10.0.0.2')
+        self.assertEqual(refused.status_code, 429)
+        self.assertEqual(refused['Retry-After'], '100')
+        self.assertEqual(refused['RateLimit-Limit'], '2')
+        # The shared address still has room for one more request from someone else
+        self.assertEqual(self.upload(self.bo).status_code, 400)
+        self.assertEqual(self.upload(self.bo).status_code, 429)
+
+    def test_store_outage_fails_open(self):
+        throttling._buckets = BrokenTokenBuckets()
+        for _ in range(4):
+            with self.assertLogs('backend.throttling', 'ERROR'):
+                response = self.login()
+            self.assertEqual(response.status_code, 401)
+            self.assertNotIn('RateLimit-Remaining', response)
+
+
+class BrokenTokenBuckets:
+    def take(self, buckets, cost):
+        raise ConnectionError('bucket store unavailable')
+
+
+# Python code run by each kind of process before it does any work
+STARTUP_PROCESSES = {
+    'manage.py check': ['manage.py', 'check'],
+    'URLconf': ['-c', 'import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns'],
+    # What `celery worker` does before consuming: Django setup, system checks, task autodiscovery
+    'Celery worker': ['-c', 'from backend.celery import app; app.loader.import_default_modules()'],
+}
+# Imported on first use only
+DEFERRED_MODULES = {'weasyprint', 'numpy', 'repository.duplicates'}
+STARTUP_IMPORT_BUDGET_SECONDS = 2.0
+
+
+@override_settings(
+    DATABASE_REPLICAS=[], MEDIA_ROOT=tempfile.mkdtemp(), THROTTLE_BACKEND='local', REACTION_BUFFER_BACKEND='local',
+    TRENDING_COUNTER_BACKEND='local',
+)
+class LoadToolingTests(TestCase):
+    def setUp(self):
+        throttling._buckets = throttling.LocalTokenBuckets()
+        reactions._buffer = reactions.LocalReactionBuffer()
+        trending._counter = trending.LocalDownloadCounter()
+
+    def tearDown(self):
+        throttling._buckets = reactions._buffer = trending._counter = None
+
+    def generate(self, **sizes):
+        args = [f'--{name}={value}' for name, value in sizes.items()]
+        out = io.StringIO()
+        call_command('generate_dataset', '--batch-size=7', *args, stdout=out)
+        return out.getvalue()
+
+    def test_generate_dataset(self):
+        output = self.generate(users=6, works=20, reactions=40)
+        self.assertIn('Created 6 users', output)
+        self.assertIn('Created 20 works', output)
+        self.assertEqual(ScholarlyWork.objects.count(), 20)
+        # Popular works saturate, so the draw may stop short of the target; the count reported is the real one
+        self.assertIn(f'Created {Reaction.objects.count()} reactions', output)
+        self.assertGreater(Reaction.objects.count(), 30)
+        self.assertEqual(FacetCell.objects.aggregate(total=Sum('works'))['total'], 20)
+        self.assertTrue(default_storage.exists(ScholarlyWork.objects.first().file.name))
+        self.assertEqual(WorkText.objects.count(), 20)
+        work = ScholarlyWork.objects.first()
+        found = self.client.get('/api/repository/', {'q': work.title}).json()['results']
+        self.assertIn(work.pk, [item['id'] for item in found])
+
+        # Re-running grows the dataset without clashing usernames
+        self.generate(users=2, works=0, reactions=0)
+        self.assertEqual(User.objects.filter(username__startswith='synth_').count(), 8)
+        with self.assertRaises(CommandError):
+            self.generate(users=0)
+
+    def test_run_load_scenarios_and_compare(self):
+        with self.assertRaises(CommandError):
+            call_command('run_load_scenarios', stdout=io.StringIO())
+        self.generate(users=3, works=10, reactions=10)
+
+        scenarios = ['--scenario=list_search', '--scenario=detail', '--scenario=react_toggle', '--scenario=download']
+        report = os.path.join(settings.MEDIA_ROOT, 'before.json')
+        out = io.StringIO()
+        call_command('run_load_scenarios', '--iterations=3', '--warmup=1', f'--output={report}', *scenarios, stdout=out)
+        self.assertIn('Report written', out.getvalue())
+        with open(report) as f:
+            results = json.load(f)['scenarios']
+        self.assertEqual(set(results), {'list_search', 'detail', 'react_toggle', 'download'})
+        for name, summary in results.items():
+            self.assertEqual(summary['requests'], 3)
+            self.assertEqual(summary['statuses'], {'200': 3}, name)
+
+        # The comparison goes to the command's stderr, the report to its stdout
+        out, err = io.StringIO(), io.StringIO()
+        call_command(
+            'run_load_scenarios', '--iterations=2', '--warmup=0', '--scenario=detail', f'--compare={report}',
+            stdout=out, stderr=err,
+        )
+        self.assertEqual(set(json.loads(out.getvalue())['scenarios']), {'detail'})
+        self.assertRegex(err.getvalue(), r'^detail +p95 +[\d.]+ -> +[\d.]+ ms \([+-][\d.]+\)  queries ')
+        self.assertEqual(len(err.getvalue().splitlines()), 1)
+
+
+class StartupImportTests(SimpleTestCase):
+    """Import cost of every process start, from `python -X importtime`"""
+
+    def imports(self, args):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', *args],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=120
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        modules = {}
+        for line in result.stderr.splitlines():
+            match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)', line)
+            if match:
+                modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+        return modules
+
+    def test_startup_imports(self):
+        for process, args in STARTUP_PROCESSES.items():
+            with self.subTest(process):
+                modules = self.imports(args)
+                self.assertFalse(DEFERRED_MODULES & set(modules), process)
+                total = sum(own for own, _ in modules.values()) / 1e6
+                slowest = sorted(modules.items(), key=lambda item: -item[1][1])[:15]
+                self.assertLess(
+                    total, STARTUP_IMPORT_BUDGET_SECONDS,
+                    f'{process} spends {total:.2f}s importing; slowest (cumulative µs):\n'
+                    + '\n'.join(f'{cumulative:>10} {name}' for name, (_, cumulative) in slowest)
+                )
@@ -0,0 +1,79 @@
+"""
+First-page thumbnail rendering.
+
+Rendering a page is delegated to a pluggable renderer (THUMBNAIL_RENDERER):
+any class with a `render(path)` method returning a PIL image of the first
+page. The default shells out to LibreOffice, which is already installed for
+DOCX conversion; tests and machines without LibreOffice can point the
+setting at BlankPageRenderer or their own stub.
+"""
+import os
+import subprocess
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from PIL import Image, features
+
+CONTENT_TYPES = {
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+
+
+class LibreOfficeRenderer:
+    """Render the first page with LibreOffice's PNG export (it only exports the first page)"""
+    timeout = 120
+
+    def render(self, path):
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = subprocess.run([
+                settings.LIBREOFFICE_PATH,
+                '--headless',
+                '--convert-to', 'png',
+                '--outdir', output_dir,
+                path
+            ], capture_output=True, text=True, timeout=self.timeout)
+
+            png_path = os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0] + '.png')
+            if result.returncode != 0 or not os.path.exists(png_path):
+                raise Exception(f"LibreOffice preview rendering failed: {result.stderr}")
+
+            with Image.open(png_path) as image:
+                image.load()
+                return image.copy()
+
+
+class BlankPageRenderer:
+    """Stub renderer producing an empty A4 page, for tests and environments without LibreOffice"""
+
+    def render(self, path):
+        return Image.new('RGB', (595, 842), 'white')
+
+
+def get_renderer():
+    return import_string(settings.THUMBNAIL_RENDERER)()
+
+
+def available_formats():
+    """WebP when Pillow was built with it, JPEG always"""
+    return ['webp', 'jpeg'] if features.check('webp') else ['jpeg']
+
+
+def encode_thumbnails(page):
+    """
+    Yield (size, format, width, height, bytes) for every configured size and format.
+    Page aspect ratio is preserved; THUMBNAIL_SIZES gives the target width.
+    """
+    page = page.convert('RGB')
+    for size, width in settings.THUMBNAIL_SIZES.items():
+        height = max(1, round(page.height * width / page.width))
+        resized = page.resize((width, height), Image.Resampling.LANCZOS)
+        for image_format in available_formats():
+            buffer = BytesIO()
+            if image_format == 'webp':
+                resized.save(buffer, 'WEBP', quality=80, method=4)
+            else:
+                resized.save(buffer, 'JPEG', quality=82, optimize=True, progressive=True)
+            yield size, image_format, width, height, buffer.getvalue()
@@ -0,0 +1,204 @@
+"""
+Time-decayed trending ranking.
+
+Scores use forward decay: an event at time t adds
+    weight * 2 ** ((t - epoch) / half_life)
+to its work's score. A work's decayed score "now" is score * 2 ** (-(now - epoch) / half_life),
+but that factor is the same for every work, so ranking by the stored score is
+ranking by the decayed one. Only works with new activity are written on a refresh;
+nothing has to be re-decayed. When the exponent grows large the epoch is moved
+forward and all scores are rescaled once.
+
+Reactions are read incrementally from the Reaction table (id high-water mark).
+Downloads are counted in a Redis hash by the download view and drained here.
+"""
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Reaction, ScholarlyWork, TrendingScore, TrendingState
+
+# 2 ** 512 is far from float overflow but leaves headroom for summed weights
+MAX_EXPONENT = 512
+
+DRAIN_SCRIPT = """
+local counts = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+return counts
+"""
+
+
+class RedisDownloadCounter:
+    key = 'trending:downloads'
+
+    def __init__(self, client=None):
+        if client is None:
+            from backend.redis_client import get_redis
+            client = get_redis()
+        self.redis = client
+        self._drain = client.register_script(DRAIN_SCRIPT)
+
+    def increment(self, work_id):
+        self.redis.hincrby(self.key, work_id, 1)
+
+    def drain(self):
+        counts = self._drain(keys=[self.key])
+        return {int(counts[i]): int(counts[i + 1]) for i in range(0, len(counts), 2)}
+
+
+class LocalDownloadCounter:
+    """In-process equivalent of RedisDownloadCounter"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(int)
+
+    def increment(self, work_id):
+        with self._lock:
+            self._counts[work_id] += 1
+
+    def drain(self):
+        with self._lock:
+            counts, self._counts = dict(self._counts), defaultdict(int)
+        return counts
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def get_download_counter():
+    global _counter
+    with _counter_lock:
+        if _counter is None:
+            if settings.TRENDING_COUNTER_BACKEND == 'local':
+                _counter = LocalDownloadCounter()
+            else:
+                _counter = RedisDownloadCounter()
+        return _counter
+
+
+def record_download(work_id):
+    get_download_counter().increment(work_id)
+
+
+def half_life_seconds():
+    return settings.TRENDING_HALF_LIFE_HOURS * 3600
+
+
+def growth(moment, epoch):
+    """Forward-decay multiplier of an event at `moment`"""
+    return 2 ** ((moment - epoch).total_seconds() / half_life_seconds())
+
+
+def decay_factor(state, now=None):
+    """Multiply a stored score by this to get its decayed value at `now`"""
+    now = now or timezone.now()
+    return 2 ** (-(now - state.epoch).total_seconds() / half_life_seconds())
+
+
+def get_state():
+    """The state row, locked for the refresh; created by the first one"""
+    state, _ = TrendingState.objects.select_for_update().get_or_create(pk=1, defaults={'epoch': timezone.now()})
+    return state
+
+
+def current_decay_factor():
+    """decay_factor for readers: never writes, and 1 before the first refresh (there are no scores yet)"""
+    state = TrendingState.objects.filter(pk=1).first()
+    return decay_factor(state) if state else 1
+
+
+def rebase(state, now):
+    """Move the epoch to `now` and rescale every stored score by the same factor"""
+    factor = decay_factor(state, now)
+    TrendingScore.objects.update(score=F('score') * factor)
+    state.epoch = now
+    return factor
+
+
+def refresh_trending(batch_size=None):
+    """
+    Fold reactions created since the last run and drained download counts into the
+    scores. Reactions younger than TRENDING_SETTLE_SECONDS are left for the next run
+    so rows from transactions that commit out of id order are not skipped.
+    Returns (reactions processed, downloads processed, works updated).
+    """
+    batch_size = batch_size or settings.TRENDING_BATCH_SIZE
+    now = timezone.now()
+    settled = now - timedelta(seconds=settings.TRENDING_SETTLE_SECONDS)
+
+    with transaction.atomic():
+        state = get_state()
+        if (now - state.epoch).total_seconds() / half_life_seconds() > MAX_EXPONENT:
+            rebase(state, now)
+
+        increments = defaultdict(float)
+        reactions = defaultdict(int)
+        last_activity = {}
+
+        new_reactions = (
+            Reaction.objects
+            .filter(id__gt=state.last_reaction_id, created_at__lt=settled)
+            .order_by('id')
+            .values_list('id', 'scholarly_work_id', 'created_at')[:batch_size]
+        )
+        processed = 0
+        for reaction_id, work_id, created_at in new_reactions:
+            increments[work_id] += settings.TRENDING_REACTION_WEIGHT * growth(created_at, state.epoch)
+            reactions[work_id] += 1
+            last_activity[work_id] = max(created_at, last_activity.get(work_id, created_at))
+            state.last_reaction_id = reaction_id
+            processed += 1
+
+        downloads = get_download_counter().drain()
+        download_weight = settings.TRENDING_DOWNLOAD_WEIGHT * growth(now, state.epoch)
+        for work_id, count in downloads.items():
+            increments[work_id] += count * download_weight
+            last_activity[work_id] = now
+
+        updated = apply_increments(increments, reactions, downloads, last_activity)
+        prune(state, now)
+
+        state.refreshed_at = now
+        state.save()
+
+    return processed, sum(downloads.values()), updated
+
+
+def apply_increments(increments, reactions, downloads, last_activity):
+    if not increments:
+        return 0
+
+    live = set(ScholarlyWork.objects.filter(id__in=increments).values_list('id', flat=True))
+    existing = TrendingScore.objects.in_bulk([work_id for work_id in increments if work_id in live])
+
+    to_create, to_update = [], []
+    for work_id, increment in increments.items():
+        if work_id not in live:
+            continue
+        row = existing.get(work_id)
+        if row is None:
+            row = TrendingScore(scholarly_work_id=work_id, score=0)
+            to_create.append(row)
+        else:
+            to_update.append(row)
+        row.score += increment
+        row.reactions += reactions.get(work_id, 0)
+        row.downloads += downloads.get(work_id, 0)
+        row.last_activity_at = last_activity[work_id]
+
+    TrendingScore.objects.bulk_create(to_create)
+    TrendingScore.objects.bulk_update(to_update, ['score', 'reactions', 'downloads', 'last_activity_at'])
+    return len(to_create) + len(to_update)
+
+
+def prune(state, now):
+    """Drop works whose decayed score no longer matters (an indexed range delete on score)"""
+    threshold = settings.TRENDING_MIN_SCORE / decay_factor(state, now)
+    TrendingScore.objects.filter(score__lt=threshold).delete()
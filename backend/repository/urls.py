@@ -1,6 +1,18 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.ASYNC_VIEWS:
+    # Under ASGI these I/O-bound endpoints don't hold a thread while they wait
+    from . import async_views
+    download_view = async_views.download_work
+    react_view = async_views.react_to_work
+    conversion_status_view = async_views.conversion_status
+else:
+    download_view = views.ScholarlyWorkDownloadView.as_view()
+    react_view = views.ReactToWorkView.as_view()
+    conversion_status_view = views.ConversionStatusView.as_view()
+
 urlpatterns = [
     # Upload
     path('upload/', views.ScholarlyWorkUploadView.as_view(), name='work-upload'),
@@ -8,14 +20,25 @@ urlpatterns = [
     # List and Detail
     path('', views.ScholarlyWorkListView.as_view(), name='work-list'),
     path('<int:pk>/', views.ScholarlyWorkDetailView.as_view(), name='work-detail'),
+    path('trending/', views.TrendingWorksView.as_view(), name='work-trending'),
+    path('<int:pk>/related/', views.RelatedWorksView.as_view(), name='work-related'),
+    path('batch/', views.ScholarlyWorkBatchView.as_view(), name='work-batch'),
+    path('facets/', views.WorkFacetsView.as_view(), name='work-facets'),
+    path('countries/', views.CountryStatsView.as_view(), name='work-countries'),
     
     # Download and Delete
-    path('<int:pk>/download/', views.ScholarlyWorkDownloadView.as_view(), name='work-download'),
+    path('<int:pk>/download/', download_view, name='work-download'),
+    path('archive/', views.WorksArchiveView.as_view(), name='work-archive'),
+    path('export/', views.WorkExportView.as_view(), name='work-export'),
     path('<int:pk>/delete/', views.ScholarlyWorkDeleteView.as_view(), name='work-delete'),
+
+    # Preview
+    path('<int:pk>/thumbnail/', views.WorkThumbnailView.as_view(), name='work-thumbnail'),
     
     # Reactions
-    path('<int:pk>/react/', views.ReactToWorkView.as_view(), name='work-react'),
+    path('<int:pk>/react/', react_view, name='work-react'),
+    path('reactions/', views.ReactionStateView.as_view(), name='work-reaction-state'),
     
     # Conversion Status
-    path('<int:pk>/conversion-status/', views.ConversionStatusView.as_view(), name='conversion-status'),
+    path('<int:pk>/conversion-status/', conversion_status_view, name='conversion-status'),
 ]
\ No newline at end of file
@@ -1,31 +1,54 @@
 from rest_framework import status, generics, filters
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.parsers import MultiPartParser, FormParser
-from django.http import FileResponse, Http404
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import content_disposition_header
+from django.db.models import F, Q
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 
-from .models import ScholarlyWork, Reaction
+from backend.fieldsets import SparseQuerysetMixin, sparse_queryset
+from backend.profiling import span
+from backend.routers import ReplicaReadMixin
+from backend.throttling import TokenBucketMixin
+
+from . import export, facets, fastpath
+from .archive import archive_response, plan_archive
+from .async_views import streaming_content
+from .cleanup import soft_delete
+from .models import CountryRollup, ScholarlyWork, Reaction, RelatedWorks, WorkThumbnail
+from .reactions import get_reaction_buffer
+from .trending import current_decay_factor, record_download
+from .search import FullTextSearchFilter
+from .thumbnails import CONTENT_TYPES
 from .serializers import (
     ScholarlyWorkListSerializer,
     ScholarlyWorkDetailSerializer,
+    TrendingWorkSerializer,
+    RelatedWorkSerializer,
+    ReactionStateSerializer,
     ScholarlyWorkUploadSerializer,
     ReactionSerializer,
 )
 
 
-class ScholarlyWorkUploadView(APIView):
+class ScholarlyWorkUploadView(TokenBucketMixin, APIView):
     """Upload scholarly work file (RM4, RM13, RM19, RM22)"""
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
+    throttle_scope = 'upload'
 
     @extend_schema(
         request=ScholarlyWorkUploadSerializer,
         responses={201: ScholarlyWorkDetailSerializer},
-        description="Upload a scholarly work (PDF or DOCX, max 20MB)"
+        description="Upload a scholarly work (PDF or DOCX, max 20MB). The response lists "
+                    "`possible_duplicates`: existing works with near-identical metadata."
     )
     def post(self, request):
         serializer = ScholarlyWorkUploadSerializer(
@@ -39,46 +62,266 @@ class ScholarlyWorkUploadView(APIView):
                 scholarly_work,
                 context={'request': request}
             )
+            # Uploaded anyway; the client can offer to remove it (RM16) if it is a re-upload
             return Response(
-                response_serializer.data,
+                {**response_serializer.data, 'possible_duplicates': scholarly_work.possible_duplicates},
                 status=status.HTTP_201_CREATED
             )
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ScholarlyWorkListView(generics.ListAPIView):
+def filter_works(queryset, params):
+    """The list's own filters, shared with the facet counts"""
+    # Filter by author name (RS1)
+    author = params.get('author', None)
+    if author:
+        queryset = queryset.filter(authors__icontains=author)
+
+    uploader_id = params.get('uploader', None)
+    if uploader_id:
+        queryset = queryset.filter(uploader__id=uploader_id)
+
+    country = params.get('country', None)
+    if country:
+        queryset = queryset.filter(uploader__country=country)
+
+    return queryset
+
+
+class ScholarlyWorkListView(ReplicaReadMixin, SparseQuerysetMixin, generics.ListAPIView):
     """List all scholarly works with search and filters (RM7, RM8, RM9, RS1, RS2, RS6)"""
     permission_classes = [AllowAny]
     serializer_class = ScholarlyWorkListSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['publication_year', 'file_type']
     search_fields = ['title', 'authors', 'keywords']
     ordering_fields = ['uploaded_at', 'title', 'publication_year']
     ordering = ['-uploaded_at']  # Default sort by newest (RS6)
 
     def get_queryset(self):
-        queryset = ScholarlyWork.objects.all()
-        
-        # Filter by author name (RS1)
-        author = self.request.query_params.get('author', None)
-        if author:
-            queryset = queryset.filter(authors__icontains=author)
+        return filter_works(ScholarlyWork.objects.all(), self.request.query_params)
+
+    def list(self, request, *args, **kwargs):
+        if not fastpath.eligible(request):
+            return super().list(request, *args, **kwargs)
+
+        # Same bytes as the serializer path, built from values() (see fastpath.py)
+        queryset = fastpath.list_values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        with span('serialize'):
+            rows = fastpath.build_rows(queryset if page is None else page, request)
+            data = rows if page is None else self.get_paginated_response(rows).data
+            content = fastpath.encode(data)
+        return HttpResponse(content, content_type='application/json')
 
-        uploader_id = self.request.query_params.get('uploader', None)
-        if uploader_id:
-            queryset = queryset.filter(uploader__id=uploader_id)
 
-        return queryset
+class TrendingWorksView(SparseQuerysetMixin, generics.ListAPIView):
+    """Works ranked by time-decayed recent reactions and downloads (precomputed, see trending.py)"""
+    permission_classes = [AllowAny]
+    serializer_class = TrendingWorkSerializer
+
+    def get_queryset(self):
+        # Walks the score index and joins a page of works; nothing is aggregated here
+        # (scores and uploaders are joined by SparseQuerysetMixin when they are rendered)
+        return ScholarlyWork.objects.filter(trending__isnull=False).order_by('-trending__score')
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['decay_factor'] = current_decay_factor()
+        return context
 
-class ScholarlyWorkDetailView(generics.RetrieveAPIView):
+
+class ScholarlyWorkDetailView(ReplicaReadMixin, SparseQuerysetMixin, generics.RetrieveAPIView):
     """Get details of a specific scholarly work"""
     permission_classes = [AllowAny]
     serializer_class = ScholarlyWorkDetailSerializer
     queryset = ScholarlyWork.objects.all()
 
 
+class RelatedWorksView(generics.ListAPIView):
+    """Top related works of a work, read from its precomputed RelatedWorks row (see related.py)"""
+    permission_classes = [AllowAny]
+    serializer_class = RelatedWorkSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        neighbours = RelatedWorks.objects.filter(pk=self.kwargs['pk']).values_list('neighbours', flat=True).first()
+        if neighbours is None:
+            get_object_or_404(ScholarlyWork, pk=self.kwargs['pk'])
+            return []
+
+        self.similarities = dict(neighbours)
+        works = sparse_queryset(
+            ScholarlyWork.objects.filter(id__in=self.similarities), self.get_serializer()
+        ).in_bulk()
+        # Works deleted since the row was computed are skipped
+        return [works[work_id] for work_id, _ in neighbours if work_id in works]
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['similarities'] = getattr(self, 'similarities', {})
+        return context
+
+
+def batch_ids(request):
+    """Distinct work ids from `?ids=1,2,3`, in the order given"""
+    try:
+        ids = [int(part) for part in request.query_params.get('ids', '').split(',') if part.strip()]
+    except ValueError:
+        raise ValidationError({'ids': 'Expected comma-separated work ids.'})
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise ValidationError({'ids': 'This parameter is required.'})
+    if len(ids) > settings.BATCH_MAX_IDS:
+        raise ValidationError({'ids': f'At most {settings.BATCH_MAX_IDS} ids per request.'})
+    return ids
+
+
+BATCH_IDS_PARAMETER = OpenApiParameter(
+    'ids', str, required=True,
+    description=f'Comma-separated work ids (at most {settings.BATCH_MAX_IDS})'
+)
+
+
+@extend_schema(parameters=[BATCH_IDS_PARAMETER])
+class ScholarlyWorkBatchView(ReplicaReadMixin, generics.ListAPIView):
+    """Several works by id in one query, each as the detail view renders it; unknown ids are skipped"""
+    permission_classes = [AllowAny]
+    serializer_class = ScholarlyWorkDetailSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        ids = batch_ids(self.request)
+        works = sparse_queryset(ScholarlyWork.objects.filter(id__in=ids), self.get_serializer()).in_bulk()
+        return [works[work_id] for work_id in ids if work_id in works]
+
+
+@extend_schema(parameters=[BATCH_IDS_PARAMETER])
+class ReactionStateView(ReplicaReadMixin, generics.ListAPIView):
+    """Reaction counts and the user's flags for several works, as the react endpoint reports them"""
+    permission_classes = [AllowAny]
+    serializer_class = ReactionStateSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        ids = batch_ids(self.request)
+        works = sparse_queryset(ScholarlyWork.objects.filter(id__in=ids), self.get_serializer()).in_bulk()
+        if settings.REACTION_WRITE_BEHIND:
+            # Toggles not flushed yet: the buffer has the state the react endpoint answered with
+            user = self.request.user
+            buffered = get_reaction_buffer().state(list(works), user.pk if user.is_authenticated else None)
+            for work_id, (reacted, count) in buffered.items():
+                works[work_id].has_reacted, works[work_id].num_reactions = reacted, count
+        return [works[work_id] for work_id in ids if work_id in works]
+
+
+@extend_schema(parameters=[
+    OpenApiParameter(name, str, description=f'Same as the works list `{name}` filter')
+    for name in ('search', 'q', 'author', 'uploader', 'publication_year', 'file_type', 'country')
+])
+class WorkFacetsView(ReplicaReadMixin, generics.GenericAPIView):
+    """
+    Work counts per publication year, file type and uploader country under the
+    works list filters. Read from the facet rollups unless the request searches
+    or filters by author or uploader (see facets.py).
+    """
+    permission_classes = [AllowAny]
+    filter_backends = [filters.SearchFilter, FullTextSearchFilter]
+    search_fields = ScholarlyWorkListView.search_fields
+
+    def get(self, request):
+        params = request.query_params
+        selected = facets.selected_filters(params)
+        if any(params.get(name) for name in facets.LIVE_PARAMS):
+            queryset = self.filter_queryset(filter_works(ScholarlyWork.objects.all(), {
+                name: value for name, value in params.items() if name != 'country'
+            }))
+            return Response(facets.live_counts(queryset, selected))
+        return Response(facets.rollup_counts(selected))
+
+
+class CountryStatsView(ReplicaReadMixin, APIView):
+    """Listed scholars and their works per country for the globe, with global totals"""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        rows = CountryRollup.objects.filter(Q(scholars__gt=0) | Q(works__gt=0)).order_by('-works', '-scholars', 'country')
+        countries = [{'country': row.country, 'scholars': row.scholars, 'works': row.works} for row in rows]
+        return Response({
+            'totals': {
+                'scholars': sum(row['scholars'] for row in countries),
+                'works': sum(row['works'] for row in countries),
+                # Scholars who haven't set a country are counted in the totals, not placed on the globe
+                'countries': sum(1 for row in countries if row['country']),
+            },
+            'countries': countries,
+        })
+
+
+ARCHIVE_FILTERS = ('uploader', 'author', 'country', 'publication_year', 'file_type', 'search', 'q')
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter(name, str, description=f'Same as the works list `{name}` filter')
+        for name in ARCHIVE_FILTERS
+    ],
+    responses={200: bytes},
+    description="ZIP of every work matching the works list filters, e.g. one scholar's (`uploader`) or a search's "
+                f"(authenticated users only; at most {settings.ZIP_MAX_WORKS} works and {settings.ZIP_MAX_BYTES} bytes)"
+)
+class WorksArchiveView(ReplicaReadMixin, generics.GenericAPIView):
+    """Download many works as one streamed ZIP (see archive.py)"""
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, FullTextSearchFilter]
+    filterset_fields = ScholarlyWorkListView.filterset_fields
+    search_fields = ScholarlyWorkListView.search_fields
+
+    def get_queryset(self):
+        return filter_works(ScholarlyWork.objects.all(), self.request.query_params)
+
+    def get(self, request):
+        if not any(request.query_params.get(name) for name in ARCHIVE_FILTERS):
+            raise ValidationError({'detail': 'Choose a scholar (uploader) or a search to archive.'})
+        works, _ = plan_archive(self.filter_queryset(self.get_queryset()))
+        return archive_response(works, 'works.zip')
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter('output', str, enum=list(export.FORMATS), description='jsonl (default) or csv'),
+        OpenApiParameter('from', str, description='Works updated at or after this date or ISO 8601 datetime'),
+        OpenApiParameter('until', str, description='Works updated at or before this date or ISO 8601 datetime'),
+    ],
+    responses={200: bytes},
+    description="Stream the metadata of every work, oldest change first, for harvesting (see export.py)"
+)
+class WorkExportView(ReplicaReadMixin, APIView):
+    """Bulk metadata export (JSONL or CSV), optionally only works changed in a from/until window"""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        output = request.query_params.get('output', 'jsonl')
+        if output not in export.FORMATS:
+            raise ValidationError({'output': f"Choose one of: {', '.join(export.FORMATS)}."})
+        bounds = {}
+        for name, end in [('from', False), ('until', True)]:
+            if request.query_params.get(name):
+                try:
+                    bounds[name] = export.parse_bound(request.query_params[name], end=end)
+                except ValueError as exc:
+                    raise ValidationError({name: str(exc)})
+
+        queryset = export.harvest_queryset(bounds.get('from'), bounds.get('until'))
+        # Rows are fetched while streaming, after dispatch has left the replica context
+        queryset = queryset.using(queryset.db)
+        content_type, filename = export.FORMATS[output]
+        response = StreamingHttpResponse(streaming_content(export.encode(queryset, output)), content_type=content_type)
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        return response
+
+
 class ScholarlyWorkDownloadView(APIView):
     """Download file - requires authentication (RM6)"""
     permission_classes = [IsAuthenticated]
@@ -91,22 +334,77 @@ class ScholarlyWorkDownloadView(APIView):
         scholarly_work = get_object_or_404(ScholarlyWork, pk=pk)
         
         # Serve converted PDF if available, otherwise original
-        if scholarly_work.file_type == 'docx' and scholarly_work.converted_pdf:
-            file_to_serve = scholarly_work.converted_pdf
-            filename = f"{scholarly_work.original_filename.rsplit('.', 1)[0]}.pdf"
-        else:
-            file_to_serve = scholarly_work.file
-            filename = scholarly_work.original_filename
-        
         try:
-            response = FileResponse(
-                file_to_serve.open('rb'),
-                as_attachment=True,
-                filename=filename
-            )
-            return response
+            with span('file'):
+                handle = scholarly_work.preview_source.open('rb')
         except FileNotFoundError:
-            raise Http404("File not found.")
+            # migrate_media_layout may have moved the file since the row was read
+            scholarly_work.refresh_from_db(fields=['file', 'converted_pdf'])
+            try:
+                with span('file'):
+                    handle = scholarly_work.preview_source.open('rb')
+            except FileNotFoundError:
+                raise Http404("File not found.")
+
+        response = FileResponse(
+            handle,
+            as_attachment=True,
+            filename=scholarly_work.download_filename
+        )
+        record_download(scholarly_work.pk)
+        return response
+
+
+class WorkThumbnailView(APIView):
+    """First-page preview image - public and cacheable, no auth lookup on the hot path"""
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('size', str, description='One of THUMBNAIL_SIZES, default medium'),
+            OpenApiParameter('v', str, description='Generation version from thumbnail_url; cached for good when current'),
+        ],
+        responses={200: bytes},
+        description="First-page thumbnail (WebP when the client accepts it, otherwise JPEG)"
+    )
+    def get(self, request, pk):
+        size = request.query_params.get('size', settings.THUMBNAIL_DEFAULT_SIZE)
+        if size not in settings.THUMBNAIL_SIZES:
+            return Response(
+                {'error': f"Unknown size. Choose one of: {', '.join(settings.THUMBNAIL_SIZES)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # WebP when the client takes it and Pillow could write it; JPEG is always there
+        accepted = ['webp', 'jpeg'] if 'image/webp' in request.headers.get('Accept', '') else ['jpeg']
+        thumbnails = {
+            thumbnail.format: thumbnail
+            for thumbnail in WorkThumbnail.objects.filter(
+                scholarly_work_id=pk, scholarly_work__deleted_at__isnull=True, size=size, format__in=accepted
+            ).annotate(generated_at=F('scholarly_work__thumbnails_generated_at')).only('image', 'format', 'updated_at')
+        }
+        thumbnail = next((thumbnails[image_format] for image_format in accepted if image_format in thumbnails), None)
+        if thumbnail is None:
+            raise Http404("Thumbnail not available.")
+
+        etag = f'"{pk}-{size}-{thumbnail.format}-{int(thumbnail.updated_at.timestamp())}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            try:
+                response = FileResponse(thumbnail.image.open('rb'), content_type=CONTENT_TYPES[thumbnail.format])
+            except FileNotFoundError:
+                raise Http404("Thumbnail not available.")
+
+        response['ETag'] = etag
+        # Only the URL the API hands out (?v= generation time) changes when thumbnails are regenerated
+        generated_at = thumbnail.generated_at
+        if generated_at and request.query_params.get('v') == str(int(generated_at.timestamp())):
+            patch_cache_control(response, public=True, max_age=settings.THUMBNAIL_CACHE_SECONDS, immutable=True)
+        else:
+            patch_cache_control(response, public=True, no_cache=True)
+        patch_vary_headers(response, ['Accept'])
+        return response
 
 
 class ScholarlyWorkDeleteView(APIView):
@@ -127,14 +425,10 @@ class ScholarlyWorkDeleteView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Delete files from filesystem
-        if scholarly_work.file:
-            scholarly_work.file.delete(save=False)
-        if scholarly_work.converted_pdf:
-            scholarly_work.converted_pdf.delete(save=False)
-        
-        # Delete database record (cascades to reactions)
-        scholarly_work.delete()
+        # Hide it right away; rows, reactions and files are removed in the background
+        soft_delete(ScholarlyWork.objects.filter(pk=scholarly_work.pk))
+        from .tasks import purge_deleted_works
+        purge_deleted_works.delay()
         
         return Response(
             {'message': 'Scholarly work deleted successfully.'},
@@ -147,33 +441,33 @@ class ReactToWorkView(APIView):
     permission_classes = [IsAuthenticated]
 
     @extend_schema(
-        responses={200: {'reaction_count': 'integer', 'message': 'string'}},
+        responses={200: {'reaction_count': 'integer', 'user_has_reacted': 'boolean', 'message': 'string'}},
         description="Toggle like/reaction on scholarly work"
     )
     def post(self, request, pk):
-        scholarly_work = get_object_or_404(ScholarlyWork, pk=pk)
-        
-        # Check if user already reacted
-        reaction = Reaction.objects.filter(
-            user=request.user,
-            scholarly_work=scholarly_work
-        ).first()
-        
-        if reaction:
-            # Remove reaction (unlike)
-            reaction.delete()
-            message = 'Reaction removed'
+        if settings.REACTION_WRITE_BEHIND:
+            # Recorded in the reaction buffer and flushed to the database by Celery beat
+            if not ScholarlyWork.objects.filter(pk=pk).exists():
+                raise Http404("No ScholarlyWork matches the given query.")
+            reacted, reaction_count = get_reaction_buffer().toggle(pk, request.user.pk)
         else:
-            # Add reaction (like)
-            Reaction.objects.create(
-                user=request.user,
-                scholarly_work=scholarly_work
-            )
-            message = 'Reaction added'
-        
+            scholarly_work = get_object_or_404(ScholarlyWork, pk=pk)
+
+            # Delete first: if nothing was deleted the user had not reacted yet.
+            # ignore_conflicts lets the unique constraint absorb double clicks.
+            removed, _ = Reaction.objects.filter(user=request.user, scholarly_work=scholarly_work).delete()
+            reacted = not removed
+            if reacted:
+                Reaction.objects.bulk_create(
+                    [Reaction(user=request.user, scholarly_work=scholarly_work)],
+                    ignore_conflicts=True
+                )
+            reaction_count = scholarly_work.reactions.count()
+
         return Response({
-            'message': message,
-            'reaction_count': scholarly_work.reactions.count()
+            'message': 'Reaction added' if reacted else 'Reaction removed',
+            'reaction_count': reaction_count,
+            'user_has_reacted': reacted,
         })
 
 
@@ -186,9 +480,6 @@ class ConversionStatusView(APIView):
         description="Get conversion status for uploaded DOCX file"
     )
     def get(self, request, pk):
-        scholarly_work = get_object_or_404(ScholarlyWork, pk=pk)
-        serializer = ScholarlyWorkDetailSerializer(
-            scholarly_work,
-            context={'request': request}
-        )
+        serializer = ScholarlyWorkDetailSerializer(context={'request': request})
+        serializer.instance = get_object_or_404(sparse_queryset(ScholarlyWork.objects.all(), serializer), pk=pk)
         return Response(serializer.data)
\ No newline at end of file